@@ -1,46 +1,82 @@
 import os
 import logging
+import click
 from logging.handlers import RotatingFileHandler
 from flask import Flask, render_template, request, jsonify
 from werkzeug.security import generate_password_hash
 from flask_login import current_user
-from PIL import Image as PilImage
 
-from config import Config
+from config import Config, get_or_create_secret_key
 from extensions import db, login_manager, csrf, migrate, limiter
 from models import User
-from utils import ensure_local_resources
 
 
 def create_app(config_class=Config):
-    app = Flask(__name__)
+    app = Flask(__name__, instance_path=getattr(config_class, 'INSTANCE_PATH', None))
     app.config.from_object(config_class)
+    # 运行时目录与持久化密钥在这里准备，导入 config 本身不触碰文件系统
+    os.makedirs(app.instance_path, exist_ok=True)
+    if not app.config.get('SECRET_KEY'):
+        app.config['SECRET_KEY'] = get_or_create_secret_key(app.instance_path)
+
+    # 可选：orjson 加速 JSON 编码 (未安装时保持默认实现)
+    from services.serialization_service import OrjsonProvider, orjson
+    if orjson is not None and app.config.get('ORJSON_ENABLED'):
+        app.json = OrjsonProvider(app)
 
     # 修复 Flask 3.0+ JSON 中文显示
     app.json.ensure_ascii = False
 
-    # Pillow 解压炸弹防护：限制单张图片最大像素数
-    PilImage.MAX_IMAGE_PIXELS = app.config.get('MAX_IMAGE_PIXELS')
+    # Pillow 与 boto3 在首次处理图片/访问云存储时才加载 (见 utils._pil / utils._boto)，
+    # 解压炸弹防护的像素上限 MAX_IMAGE_PIXELS 也在加载时应用
+
+    # 可选：Jinja 字节码缓存，新 worker 无需重新编译模板
+    if app.config.get('JINJA_BYTECODE_CACHE_DIR'):
+        from jinja2 import FileSystemBytecodeCache
+        os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
 
-    # 初始化扩展
+    # 初始化扩展 (数据库连接池参数与 SQLite PRAGMA 见 services/database_service.py)
+    from services.database_service import DatabaseService
+    DatabaseService.apply_engine_options(app)
     db.init_app(app)
+    DatabaseService.configure_engines(app, db)
+    # 运行时指标 (/metrics)：请求耗时、每请求 SQL 统计等，见 services/metrics_service.py
+    from services.metrics_service import MetricsService
+    MetricsService.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
     migrate.init_app(app, db)
+    # sqlite:// 限流存储须在 limiter 读取 RATELIMIT_STORAGE_URI 之前注册
+    from services import ratelimit_storage
+    ratelimit_storage.register()
     limiter.init_app(app)
 
     # 注册蓝图
     from blueprints.public import bp as public_bp
     from blueprints.auth import bp as auth_bp
     from blueprints.admin import bp as admin_bp
+    from blueprints.metrics import bp as metrics_bp
 
     app.register_blueprint(public_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(metrics_bp)
 
-    # 检查静态资源
-    with app.app_context():
-        ensure_local_resources(app)
+    # 本地上传文件走专用路由 (长缓存 + 可选代理卸载)，优先于通用 static 路由匹配
+    if app.config.get('STORAGE_TYPE') != 'cloud':
+        from blueprints.media import bp as media_bp
+        from utils import _web_path
+        app.register_blueprint(media_bp, url_prefix=_web_path(app.config['UPLOAD_FOLDER'], '').rstrip('/'))
+
+    # 构建产物 (带哈希指纹的静态资源)，未构建时模板回退到原始文件
+    from blueprints.assets import bp as assets_bp
+    from services.asset_service import AssetService
+    app.register_blueprint(assets_bp, url_prefix=f"{app.static_url_path}/dist")
+    app.extensions['asset_manifest'] = AssetService.load_manifest(app)
+    # 第三方资源只检查是否就位 (stat)，不在启动时下载；缺失的回退到 CDN
+    app.extensions['vendor_missing'] = AssetService.check_vendor(app)
+    app.jinja_env.globals['asset_url'] = AssetService.asset_url
 
     # 配置登录
     login_manager.login_view = 'auth.login'
@@ -67,9 +103,9 @@ def create_app(config_class=Config):
 
 def configure_logging(app):
     if not app.debug and not app.testing:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/prompt_manager.log', maxBytes=10240, backupCount=10)
+        log_dir = app.config.get('LOG_DIR') or 'logs'
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = RotatingFileHandler(os.path.join(log_dir, 'prompt_manager.log'), maxBytes=10240, backupCount=10)
         file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
         file_handler.setLevel(logging.INFO)
         app.logger.addHandler(file_handler)
@@ -77,6 +113,26 @@ def configure_logging(app):
         app.logger.info('Prompt Manager startup')
 
 
+def reset_worker_state(app):
+    """
+    preload 模式下由 gunicorn 的 post_fork 在每个 worker 中调用：
+    丢弃从 master 继承的数据库连接、S3 客户端、删除队列线程状态与进程内缓存，由 worker 各自重建
+    """
+    from services.deletion_service import reset_deletion_worker
+    from services.metrics_service import MetricsService
+    from services.serialization_service import SerializationService
+    from utils import reset_s3_client
+
+    # close=False：不关闭父进程仍持有的连接，只让本进程的连接池从空池开始
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    reset_s3_client()
+    reset_deletion_worker()
+    MetricsService.reset_process_state(app)
+    SerializationService.reset_after_fork(app)
+
+
 def register_error_handlers(app):
     @app.errorhandler(404)
     def page_not_found(e):
@@ -97,7 +153,10 @@ def register_commands(app):
     @app.cli.command("init-db")
     def init_db_command():
         """初始化数据库和管理员账户"""
+        from services.schema_service import SchemaService
+
         db.create_all()
+        SchemaService.store_fingerprint()
         admin_user = app.config['ADMIN_USERNAME']
         admin_pass = app.config['ADMIN_PASSWORD']
 
@@ -124,6 +183,117 @@ def register_commands(app):
         db.session.commit()
         print(f"✅ 已回填 {updated} 条记录的 media_type")
 
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        """压缩静态资源并生成带哈希指纹与预压缩版本的构建产物"""
+        from services.asset_service import AssetService
+
+        dist_dir = AssetService.dist_dir(app)
+        manifest = AssetService.build(app.static_folder, dist_dir, app.static_url_path)
+        app.extensions['asset_manifest'] = AssetService.load_manifest(app)
+        for src, hashed in sorted(manifest.items()):
+            print(f"   {src} -> dist/{hashed}")
+        print(f"✅ 已构建 {len(manifest)} 个静态资源至 {dist_dir}")
+
+    @app.cli.command("fetch-assets")
+    @click.option('--force', is_flag=True, help='忽略已存在的文件，全部重新下载')
+    @click.option('--timeout', default=30, show_default=True, help='单个文件的下载超时 (秒)')
+    def fetch_assets_command(force, timeout):
+        """按版本化清单下载第三方静态资源并校验完整性 (离线部署前执行一次)"""
+        from services.asset_service import AssetService, VENDOR_MANIFEST_VERSION
+
+        results = AssetService.fetch_vendor(app.static_folder, force=force, timeout=timeout)
+        failed = 0
+        for rel_path, status, detail in results:
+            if status == 'failed':
+                failed += 1
+                print(f"   ❌ {rel_path}: {detail}")
+            else:
+                print(f"   {'↓' if status == 'downloaded' else '✓'} {rel_path} {detail}")
+        app.extensions['vendor_missing'] = AssetService.check_vendor(app)
+        if failed:
+            raise click.ClickException(f"{failed} 个资源下载或校验失败")
+        print(f"✅ 第三方资源已就位 (清单版本 {VENDOR_MANIFEST_VERSION})")
+
+    @app.cli.command("profile-startup")
+    @click.option('--top', default=15, show_default=True, help='显示导入耗时最多的前 N 个包')
+    @click.option('--budget-ms', default=0.0, help='worker 启动耗时预算 (毫秒)，超出时返回非零退出码，0 为不检查')
+    def profile_startup_command(top, budget_ms):
+        """在子进程中冷启动应用，按包汇总 -X importtime 导入耗时"""
+        from services.profile_service import ProfileService
+
+        report = ProfileService.profile_startup(app.root_path)
+        print(f"⏱️  worker 冷启动 (导入 + create_app): {report['boot_ms']:.0f} ms，"
+              f"模块导入合计 (含解释器自身) {report['import_ms']:.0f} ms")
+        for name, ms in report['packages'][:top]:
+            print(f"   {name:<32} {ms:8.1f} ms")
+        if report['lazy_loaded']:
+            print(f"⚠️  启动时加载了按需依赖: {', '.join(report['lazy_loaded'])}")
+        if budget_ms and report['boot_ms'] > budget_ms:
+            raise click.ClickException(f"启动耗时 {report['boot_ms']:.0f} ms 超出预算 {budget_ms:.0f} ms")
+
+    @app.cli.command("bench-db")
+    @click.option('--duration', default=2.0, show_default=True, help='每个配置的压测秒数')
+    @click.option('--readers', default=4, show_default=True, help='并发读线程数')
+    @click.option('--rows', default=2000, show_default=True, help='测试表行数')
+    def bench_db_command(duration, readers, rows):
+        """在临时 SQLite 库上对比各 PRAGMA 设置 (与当前配置一致) 对并发读写的影响"""
+        from services.database_service import DatabaseService
+
+        pragmas = DatabaseService.sqlite_pragmas(app.config)
+        print(f"🏁 1 个写线程 (单行更新 + 提交) 与 {readers} 个读线程并发，每项 {duration:g}s")
+        print(f"   {'配置':<28} {'写/s':>8} {'读/s':>8} {'读中位ms':>9} {'读p95ms':>8} {'错误':>5}")
+        for label, r in DatabaseService.benchmark_sqlite(pragmas, rows=rows, readers=readers, duration=duration):
+            median = f"{r['read_median_ms']:.2f}" if r['read_median_ms'] is not None else '-'
+            p95 = f"{r['read_p95_ms']:.2f}" if r['read_p95_ms'] is not None else '-'
+            print(f"   {label:<28} {r['writes_per_s']:>8.0f} {r['reads_per_s']:>8.0f} {median:>9} {p95:>8} {r['errors']:>5}")
+
+    @app.cli.command("drain-deletions")
+    def drain_deletions_command():
+        """立即处理文件删除队列中所有到期的记录"""
+        from services.deletion_service import DeletionService
+
+        processed = DeletionService.drain_all()
+        stats = DeletionService.stats()
+        print(f"✅ 已处理 {processed} 条删除记录，剩余待重试 {stats['pending']} 条，已放弃 {stats['dead']} 条")
+
+    @app.cli.command("refresh-stats")
+    @click.option('--skip-storage', is_flag=True, help='只重算计数，不统计存储占用')
+    def refresh_stats_command(skip_storage):
+        """重算后台统计计数器与存储占用 (可配合定时任务执行)"""
+        from services.stats_service import StatsService
+        from services.storage_service import _format_size
+
+        StatsService.rebuild(include_storage=not skip_storage)
+        stats = StatsService.get_stats()
+        storage = _format_size(stats['storage_bytes']) if stats['storage_bytes'] is not None else '未统计'
+        print(f"✅ 作品 {stats['total_images']} (待审核 {stats['pending']})，标签 {stats['total_tags']}，存储占用 {storage}")
+
+    @app.cli.command("storage-gc")
+    @click.option('--delete', is_flag=True, help='实际删除孤儿文件 (默认仅报告)')
+    @click.option('--prune-dangling', is_flag=True, help='同时清理指向缺失文件的参考图/缩略图引用')
+    @click.option('--min-age', default=60, show_default=True, help='只处理早于 N 分钟的文件')
+    @click.option('--rate', default=50.0, show_default=True, help='每秒最多删除的文件数，0 为不限速')
+    def storage_gc_command(delete, prune_dangling, min_age, rate):
+        """对账存储与数据库，报告/清理孤儿文件与悬空引用"""
+        from services.storage_service import StorageService
+
+        for line in StorageService.reconcile_stream(delete=delete, prune_dangling=prune_dangling,
+                                                    min_age_minutes=min_age, rate_limit=rate):
+            print(line, end='')
+        print()
+
+    @app.cli.command("shard-uploads")
+    @click.option('--batch-size', default=500, show_default=True, help='每批处理的记录数')
+    @click.option('--dry-run', is_flag=True, help='仅统计，不移动文件')
+    def shard_uploads_command(batch_size, dry_run):
+        """将平铺的历史上传文件迁移到分片目录 (ab/cd/<uuid>.jpg)"""
+        from services.storage_service import StorageService
+
+        for line in StorageService.shard_existing_stream(batch_size=batch_size, dry_run=dry_run):
+            print(line, end='')
+        print()
+
 
 app = create_app()
 
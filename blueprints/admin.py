@@ -1,11 +1,18 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, Response, \
     stream_with_context, send_file, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.orm import selectinload, load_only
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import db, Image, Tag, ReferenceImage, SystemSetting, User
 from services.image_service import ImageService
 from services.data_service import DataService
 from services.config_service import ConfigService
+from services.storage_service import StorageService
+from services.stats_service import StatsService
+from services.moderation_service import ModerationService
+from services.tag_service import TagService
+from services.metrics_service import MetricsService
+from utils import _resolve_upload_dir
 import json
 import time
 import zipfile
@@ -44,11 +51,34 @@ def dashboard():
     active_tab = request.args.get('tab', 'pending')
     search_query = request.args.get('q', '').strip()
 
-    # 待审核队列
-    pending_images = Image.query.filter_by(status='pending').order_by(Image.created_at.asc()).all()
+    per_page = current_app.config['ADMIN_PER_PAGE']
+
+    # 聚合计数来自 stat_counter，无需扫描作品表；仅带筛选条件时才实时 COUNT
+    # (先于列表查询：计数过期时会重算并提交，提交会使已加载的卡片过期而逐条重新加载)
+    stats = StatsService.get_stats()
 
-    # 已发布列表（含搜索和分页）
-    approved_query = Image.query.filter_by(status='approved')
+    # 待审核队列 (键集分页 + 分类/媒体类型筛选，仅加载卡片所需列)
+    pending_filters = {
+        'pcat': request.args.get('pcat', '').strip() or None,
+        'pmedia': request.args.get('pmedia', '').strip() or None,
+    }
+    pending_images, pending_next = ImageService.get_pending_page(
+        category=pending_filters['pcat'],
+        media_type=pending_filters['pmedia'],
+        after=request.args.get('after'),
+        limit=per_page,
+    )
+    if pending_filters['pcat'] or pending_filters['pmedia']:
+        pending_total = ImageService.pending_query(pending_filters['pcat'], pending_filters['pmedia']).count()
+    else:
+        pending_total = stats['pending']
+
+    # 已发布列表（含搜索和分页），预加载列表中渲染的标签
+    approved_query = Image.query.options(
+        selectinload(Image.tags),
+        load_only(Image.id, Image.title, Image.author, Image.file_path, Image.thumbnail_path,
+                  Image.media_type, Image.type, Image.created_at),
+    ).filter_by(status='approved')
     if search_query:
         approved_query = approved_query.filter(
             Image.title.contains(search_query) |
@@ -57,16 +87,15 @@ def dashboard():
         )
 
     page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['ADMIN_PER_PAGE']
-    approved_pagination = approved_query.order_by(Image.created_at.desc()).paginate(page=page, per_page=per_page)
+    approved_query = approved_query.order_by(Image.created_at.desc())
+    if search_query:
+        approved_pagination = approved_query.paginate(page=page, per_page=per_page)
+    else:
+        approved_pagination = approved_query.paginate(page=page, per_page=per_page, count=False)
+        approved_pagination.total = stats['approved']
 
     all_tags = Tag.query.order_by(Tag.name).all()
 
-    stats = {
-        'total_images': Image.query.count(),
-        'total_tags': Tag.query.count()
-    }
-
     # 获取系统设置 (从数据库读取持久化配置)
     approval_settings = {
         'gallery': SystemSetting.get_bool('approval_gallery', default=True),
@@ -88,6 +117,9 @@ def dashboard():
 
     return render_template('admin.html',
                            pending_images=pending_images,
+                           pending_total=pending_total,
+                           pending_next=pending_next,
+                           pending_filters=pending_filters,
                            approved_pagination=approved_pagination,
                            active_tab=active_tab,
                            search_query=search_query,
@@ -119,21 +151,45 @@ def approve(img_id):
 def approve_all():
     """一键通过所有待审核作品"""
     try:
-        # 批量更新效率更高
-        updated_count = Image.query.filter_by(status='pending').update({'status': 'approved'})
-        db.session.commit()
+        # 集合 UPDATE，一次提交
+        updated_count = ModerationService.apply('approve', filters={'status': 'pending'})['affected']
         if updated_count > 0:
             flash(f'🎉 已一键通过 {updated_count} 个作品！')
         else:
             flash('没有待审核的作品。')
     except Exception as e:
-        db.session.rollback()
         current_app.logger.error(f"Batch approve error: {e}")
         flash('操作失败，请查看日志')
 
     return redirect(url_for('admin.dashboard', tab='pending'))
 
 
+@bp.route('/bulk', methods=['POST'])
+@login_required
+def bulk_action():
+    """
+    批量审核/编辑 (JSON)
+    请求体: {"action": "approve|reject|delete|recategorize|add_tags|remove_tags",
+             "ids": [1, 2] 或 "filter": {"status": "pending", "category": ..., "media_type": ..., "tag": ..., "q": ...},
+             "category": "template", "tags": ["a", "b"]}
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        result = ModerationService.apply(
+            payload.get('action'),
+            ids=payload.get('ids'),
+            filters=payload.get('filter'),
+            category=payload.get('category'),
+            tags=payload.get('tags'),
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Bulk action error: {e}")
+        return jsonify({'status': 'error', 'message': '批量操作失败，请查看日志'}), 500
+    return jsonify({'status': 'ok', 'data': result})
+
+
 @bp.route('/delete/<int:img_id>', methods=['POST'])
 @login_required
 def delete(img_id):
@@ -204,22 +260,30 @@ def import_zip():
 @login_required
 def export_zip():
     """导出全量数据包 (含图片和元数据)"""
-    images = Image.query.all()
+    # 元数据含标签与参考图：预加载，避免逐条懒加载
+    images = Image.query.options(selectinload(Image.tags), selectinload(Image.refs)).all()
     if not images:
         flash('没有数据可导出')
         return redirect(url_for('admin.dashboard', tab='data-mgmt'))
 
+    started = time.perf_counter()
     memory_file = io.BytesIO()
 
     # 构建 ZIP
     with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
         json_data = []
-        upload_root = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+        upload_root = _resolve_upload_dir(current_app.config['UPLOAD_FOLDER'])
+
+        def _abs_upload_path(web_path):
+            # 兼容平铺与分片 (ab/cd/<uuid>.jpg) 两种目录布局
+            key = StorageService.storage_key(web_path)
+            return os.path.join(upload_root, *key.split('/')) if key else None
 
         for img in images:
             # 准备元数据
             item_data = img.to_dict()
 
+            # ZIP 内统一平铺存放 (uuid 文件名不会冲突)，保持备份格式不变
             img_filename = os.path.basename(img.file_path)
             item_data['zip_image_path'] = f"images/{img_filename}"
 
@@ -228,22 +292,24 @@ def export_zip():
                 item_data['zip_thumb_path'] = f"images/{thumb_name}"
 
             # 写入主图
-            abs_img_path = os.path.join(upload_root, img_filename)
-            if os.path.exists(abs_img_path):
+            abs_img_path = _abs_upload_path(img.file_path)
+            if abs_img_path and os.path.exists(abs_img_path):
                 zf.write(abs_img_path, f"images/{img_filename}")
 
             # 写入缩略图
-            if img.thumbnail_path:
-                abs_thumb = os.path.join(upload_root, os.path.basename(img.thumbnail_path))
-                if os.path.exists(abs_thumb):
+            if img.thumbnail_path and img.thumbnail_path != img.file_path:
+                abs_thumb = _abs_upload_path(img.thumbnail_path)
+                if abs_thumb and os.path.exists(abs_thumb):
                     zf.write(abs_thumb, f"images/{os.path.basename(img.thumbnail_path)}")
 
             # 写入参考图
             item_data['refs'] = []
             for ref in img.refs:
+                if ref.is_placeholder or not ref.file_path:
+                    continue
                 ref_fname = os.path.basename(ref.file_path)
-                abs_ref_path = os.path.join(upload_root, ref_fname)
-                if os.path.exists(abs_ref_path):
+                abs_ref_path = _abs_upload_path(ref.file_path)
+                if abs_ref_path and os.path.exists(abs_ref_path):
                     zf.write(abs_ref_path, f"images/{ref_fname}")
                     item_data['refs'].append(f"images/{ref_fname}")
 
@@ -252,6 +318,9 @@ def export_zip():
         # 写入 JSON 索引
         zf.writestr("data.json", json.dumps({"images": json_data}, ensure_ascii=False, indent=2))
 
+    MetricsService.observe('transfer_duration_seconds', time.perf_counter() - started, direction='export')
+    MetricsService.inc('transfer_items_total', len(images), direction='export', result='processed')
+    MetricsService.inc('transfer_bytes_total', memory_file.tell(), direction='export')
     memory_file.seek(0)
     filename = f"backup_{time.strftime('%Y%m%d')}.zip"
     return send_file(
@@ -288,35 +357,19 @@ def update_tag():
         tag.is_sensitive = is_sensitive
         db.session.commit()
 
-    # 更新名称（合并逻辑）
+    # 更新名称（目标已存在时以集合 SQL 合并）
     if new_name and new_name != tag.name:
-        existing = Tag.query.filter_by(name=new_name).first()
-        if existing:
-            for img in tag.images:
-                if img not in existing.images:
-                    existing.images.append(img)
-            db.session.delete(tag)
+        if TagService.rename_or_merge(tag, new_name):
             flash(f'标签已合并至: {new_name}')
         else:
-            tag.name = new_name
+            # 改名后无关联的标签同样视为僵尸标签
+            TagService.delete_orphans([tag.id])
         db.session.commit()
 
-    # 清理僵尸标签
-    _clean_orphaned_tags()
-
     if is_json: return jsonify({'status': 'ok'})
     return redirect(url_for('admin.dashboard'))
 
 
-def _clean_orphaned_tags():
-    """清理没有关联图片的僵尸标签"""
-    orphaned = Tag.query.filter(~Tag.images.any()).all()
-    for tag in orphaned:
-        db.session.delete(tag)
-    if orphaned:
-        db.session.commit()
-
-
 @bp.route('/setting/global', methods=['POST'])
 @login_required
 def update_global_setting():
@@ -493,6 +546,33 @@ def update_password():
     return redirect(url_for('admin.dashboard', tab='data-mgmt'))
 
 
+@bp.route('/stats', methods=['GET', 'POST'])
+@login_required
+def stats_api():
+    """聚合统计 (JSON)；POST 立即重算计数器并重新统计存储占用"""
+    if request.method == 'POST':
+        StatsService.rebuild(include_storage=True)
+    return jsonify({'status': 'ok', 'data': StatsService.get_stats()})
+
+
+@bp.route('/storage/s3-stats', methods=['GET'])
+@login_required
+def s3_stats():
+    """S3 客户端复用与连接池占用统计 (JSON)"""
+    from utils import get_s3_client_stats
+    return jsonify({'status': 'ok', 'data': get_s3_client_stats()})
+
+
+@bp.route('/storage/deletion-queue', methods=['GET', 'POST'])
+@login_required
+def deletion_queue():
+    """文件删除队列积压情况 (JSON)；POST 立即唤醒后台清理"""
+    from services.deletion_service import DeletionService
+    if request.method == 'POST':
+        DeletionService.wake()
+    return jsonify({'status': 'ok', 'data': DeletionService.stats()})
+
+
 @bp.route('/check-update', methods=['GET'])
 @login_required
 def check_update():
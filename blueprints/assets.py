@@ -0,0 +1,42 @@
+"""
+构建产物分发 (static/dist)
+
+文件名含内容哈希，下发一年期 immutable 缓存头；
+客户端支持时优先发送预压缩的 .br / .gz 版本。
+"""
+import mimetypes
+import os
+
+from flask import Blueprint, current_app, request, abort
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+from services.asset_service import AssetService
+
+bp = Blueprint('assets', __name__)
+
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+@bp.route('/<path:filename>')
+def serve_asset(filename):
+    """发送构建后的静态资源"""
+    abspath = safe_join(AssetService.dist_dir(current_app), filename)
+    if abspath is None or not os.path.isfile(abspath):
+        abort(404)
+
+    encoding = None
+    for name, suffix in _ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(abspath + suffix):
+            encoding, abspath = name, abspath + suffix
+            break
+
+    response = send_file(abspath, request.environ, conditional=True,
+                         mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
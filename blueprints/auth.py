@@ -1,14 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required
 from werkzeug.security import check_password_hash
 from models import User
 from extensions import limiter
+from services.config_service import ConfigService
 
 bp = Blueprint('auth', __name__)
 
 
 @bp.route('/login', methods=['GET', 'POST'])
-@limiter.limit(lambda: current_app.config['LOGIN_RATE_LIMIT'])
+@limiter.limit(ConfigService.get_login_rate_limit)
 def login():
     """管理员登录"""
     if request.method == 'POST':
@@ -0,0 +1,58 @@
+"""
+上传媒体分发 (本地存储模式)
+
+上传文件名为 uuid 且永不覆盖，可安全地下发一年期 immutable 缓存头。
+MEDIA_OFFLOAD 可选把文件传输交给前置代理：
+- 'x-accel-redirect': Nginx，需配置 internal location 指向上传目录
+- 'x-sendfile': Apache mod_xsendfile / Lighttpd
+留空则由 Flask 直接发送 (支持 Range 断点/拖动)。
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from flask import Blueprint, current_app, request, abort, Response
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+from utils import _resolve_upload_dir
+
+bp = Blueprint('media', __name__)
+
+# uuid4().hex 文件名 (含缩略图 _thumb 后缀)，内容不可变
+_IMMUTABLE_NAME = re.compile(r'^[0-9a-f]{32}(_thumb)?\.[a-z0-9]+$')
+
+
+def _cache_headers(response, filename):
+    if _IMMUTABLE_NAME.match(os.path.basename(filename)):
+        response.cache_control.max_age = current_app.config.get('MEDIA_CACHE_MAX_AGE', 31536000)
+        response.cache_control.immutable = True
+    else:
+        # 导入的历史文件名可能被同名覆盖，只给短缓存
+        response.cache_control.max_age = 3600
+    response.cache_control.public = True
+    return response
+
+
+@bp.route('/<path:filename>')
+def serve_upload(filename):
+    """发送上传目录中的文件"""
+    upload_root = _resolve_upload_dir(current_app.config['UPLOAD_FOLDER'])
+    abspath = safe_join(upload_root, filename)
+    if abspath is None or not os.path.isfile(abspath):
+        abort(404)
+
+    offload = (current_app.config.get('MEDIA_OFFLOAD') or '').lower()
+
+    if offload == 'x-accel-redirect':
+        prefix = current_app.config.get('MEDIA_ACCEL_PREFIX', '/_protected_uploads').rstrip('/')
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        # Nginx 会对该头做 URL 解码，文件名中的空格、%、?、# 与非 ASCII 字符需先转义
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(filename)}"
+        return _cache_headers(response, filename)
+
+    # x-sendfile 由 werkzeug 只写响应头、不读文件；否则直接发送并处理 Range / 条件请求
+    response = send_file(abspath, request.environ, conditional=True,
+                         use_x_sendfile=(offload == 'x-sendfile'))
+    return _cache_headers(response, filename)
@@ -0,0 +1,32 @@
+"""
+Prometheus 指标端点 (GET /metrics)
+
+输出所有 worker 汇总后的样本 (见 MetricsService)；需携带 Authorization: Bearer <METRICS_TOKEN>，
+未配置令牌或关闭了指标采集时返回 404。
+"""
+import hmac
+
+from flask import Blueprint, current_app, make_response, render_template, request
+
+from extensions import limiter
+from services.metrics_service import MetricsService
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Prometheus 文本格式的指标"""
+    expected = current_app.config.get('METRICS_TOKEN') or ''
+    if not expected or current_app.extensions.get('metrics') is None:
+        return render_template('404.html'), 404
+    auth = request.headers.get('Authorization', '')
+    provided = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+    if not provided or not hmac.compare_digest(provided, expected):
+        return 'Unauthorized', 401, {'WWW-Authenticate': 'Bearer'}
+
+    response = make_response(MetricsService.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -1,13 +1,16 @@
 import hashlib
 import hmac
-import json
 import time
 from functools import wraps
 from flask import Blueprint, render_template, request, current_app, url_for, jsonify, make_response
 from flask_login import current_user
 from models import db, Image, Tag, SystemSetting
 from extensions import limiter, csrf
+from services.config_service import ConfigService
+from services.database_service import replica_lag_ok, use_read_replica
 from services.image_service import ImageService
+from services.serialization_service import SerializationService, dumps_bytes
+from services.tag_service import parse_tag_expression
 
 bp = Blueprint('public', __name__)
 
@@ -57,6 +60,7 @@ def _get_common_data(category_filter=None):
         tag_filter=tag_filter,
         sort_by=sort_by,
         show_sensitive=show_sensitive,
+        for_cards=True,
     )
 
     pagination = query.paginate(page=page, per_page=current_app.config['ITEMS_PER_PAGE'])
@@ -72,10 +76,19 @@ def _get_common_data(category_filter=None):
 
     all_tags = tags_query.group_by(Tag.id).order_by(Tag.name).all()
 
+    # 无限滚动的起始游标：后续批次由 gallery_cards 按游标加载，不再重复统计/查询标签
+    next_cursor = None
+    if pagination.has_next and pagination.items:
+        next_cursor = ImageService.encode_cursor(pagination.items[-1], sort_by, page)
+
     return {
         'images': pagination.items,
         'pagination': pagination,
+        'next_cursor': next_cursor,
+        'category_filter': category_filter,
         'active_tag': tag_filter,
+        # 表达式中的必选标签 (侧栏高亮)
+        'active_tag_names': {n for group in parse_tag_expression(tag_filter)[0] for n in group},
         'active_search': search_query,
         'all_tags': all_tags,
         'current_sort': sort_by
@@ -83,6 +96,7 @@ def _get_common_data(category_filter=None):
 
 
 @bp.route('/')
+@use_read_replica
 def index():
     """画廊主页"""
     data = _get_common_data(category_filter=None)
@@ -90,14 +104,52 @@ def index():
 
 
 @bp.route('/templates')
+@use_read_replica
 def templates_index():
     """模板库"""
     data = _get_common_data(category_filter='template')
     return render_template('index.html', **data)
 
 
+@bp.route('/cards')
+@use_read_replica
+def gallery_cards():
+    """
+    无限滚动：按游标返回下一批画廊卡片 (HTML 片段)。
+    下一批的地址通过 X-Next-Url 响应头返回，为空表示已到末尾。
+    """
+    category_filter = request.args.get('category') or None
+    if category_filter != 'template':
+        category_filter = None
+    tag_filter = request.args.get('tag', '').strip()
+    search_query = request.args.get('q', '').strip()
+    sort_by = request.args.get('sort', 'date')
+    cursor = request.args.get('cursor', '')
+
+    query = ImageService.build_query(
+        category_filter=category_filter,
+        search_query=search_query,
+        tag_filter=tag_filter,
+        sort_by=sort_by,
+        show_sensitive=can_see_sensitive(),
+        for_cards=True,
+    )
+    images, next_cursor = ImageService.fetch_after_cursor(
+        query, sort_by, cursor, current_app.config['ITEMS_PER_PAGE']
+    )
+
+    resp = make_response(render_template('components/_gallery_cards.html', images=images, current_sort=sort_by))
+    next_url = ''
+    if next_cursor:
+        next_url = url_for('public.gallery_cards', category=category_filter, cursor=next_cursor,
+                           tag=tag_filter or None, q=search_query or None, sort=sort_by)
+    resp.headers['X-Next-Url'] = next_url
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
 @bp.route('/upload', methods=['GET', 'POST'])
-@limiter.limit(lambda: current_app.config['UPLOAD_RATE_LIMIT'])
+@limiter.limit(ConfigService.get_upload_rate_limit)
 def upload():
     """发布新作品"""
     if request.method == 'GET':
@@ -140,6 +192,7 @@ def upload():
 
 
 @bp.route('/about')
+@use_read_replica
 def about():
     return render_template('about.html')
 
@@ -180,6 +233,13 @@ def _get_api_data(category_filter):
     tag_filter = request.args.get('tag', '').strip()
     sort_by = request.args.get('sort', 'date')
 
+    # 稀疏字段集：如 fields=id,title,thumbnail_path，仅加载/输出所需字段
+    raw_fields = request.args.get('fields', '').strip()
+    try:
+        fields = ImageService.parse_fields(raw_fields)
+    except ValueError as e:
+        return jsonify({'code': 400, 'message': str(e), 'data': None}), 400
+
     # --- 2. 构建查询 (共享 builder，含 tags/refs 预加载消除 N+1) ---
     query = ImageService.build_query(
         category_filter=category_filter,
@@ -187,11 +247,13 @@ def _get_api_data(category_filter):
         tag_filter=tag_filter,
         sort_by=sort_by,
         show_sensitive=True,  # API 当前不过滤敏感内容，保持既有行为
+        fields=fields,
     )
 
     # --- 4. 获取数据 ---
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    items_data = [img.to_dict(request.url_root) for img in pagination.items]
+    # 每条作品的 JSON 片段按 (id, row_version) 缓存，列表直接拼接字节串
+    items_json = SerializationService.images_json(pagination.items, request.url_root, fields)
 
     meta = {
         'page': page,
@@ -201,29 +263,28 @@ def _get_api_data(category_filter):
         'has_next': pagination.has_next,
         # 自动生成下一页链接
         'next_url': url_for(request.endpoint, page=pagination.next_num, per_page=per_page, q=search_query,
-                            tag=tag_filter, sort=sort_by, _external=True) if pagination.has_next else None,
+                            tag=tag_filter, sort=sort_by, fields=raw_fields or None,
+                            _external=True) if pagination.has_next else None,
     }
 
     # --- 6. ETag 缓存校验 ---
     # 只对实际数据 (data + 分页 meta) 求哈希，排除每次都变的 server_timestamp，
     # 否则 ETag 永不命中、304 形同虚设。
-    etag_basis = json.dumps({'data': items_data, 'meta': meta}, sort_keys=True, ensure_ascii=False)
-    etag_value = hashlib.md5(etag_basis.encode('utf-8')).hexdigest()
+    etag_value = hashlib.md5(items_json + dumps_bytes(meta)).hexdigest()
 
     if request.if_none_match and request.if_none_match.contains(etag_value):
         return make_response('', 304)
 
     # --- 5. 构建响应 (body 仍带 server_timestamp，便于客户端调试) ---
-    response_payload = {
+    head = dumps_bytes({
         'code': 200,
         'message': 'success',
         'meta': {**meta, 'server_timestamp': int(time.time())},
-        'data': items_data,
-    }
-    json_str = json.dumps(response_payload, ensure_ascii=False)
+    })
+    body = head[:-1] + b',"data":' + items_json + b'}'
 
     # --- 7. 返回响应 ---
-    response = make_response(json_str)
+    response = make_response(body)
     response.headers['Content-Type'] = 'application/json'
     response.set_etag(etag_value)
     # 允许客户端缓存 60 秒
@@ -233,18 +294,43 @@ def _get_api_data(category_filter):
 
 
 @bp.route('/api/gallery')
+@use_read_replica
 def api_gallery_list():
     """获取画廊数据 (JSON)"""
     return _get_api_data('gallery')
 
 
 @bp.route('/api/templates')
+@use_read_replica
 def api_templates_list():
     """获取模板数据 (JSON)"""
     return _get_api_data('template')
 
 
+@bp.route('/api/image/<int:img_id>')
+@use_read_replica
+def api_image_detail(img_id):
+    """获取单个作品详情 (JSON)，画廊卡片点击时按需加载"""
+    img = ImageService.get_public_image(img_id, show_sensitive=can_see_sensitive())
+    if not img:
+        return jsonify({'code': 404, 'message': '作品不存在', 'data': None}), 404
+
+    body = b'{"code":200,"message":"success","data":' + SerializationService.image_json(img, request.url_root) + b'}'
+    etag_value = hashlib.md5(body).hexdigest()
+
+    if request.if_none_match and request.if_none_match.contains(etag_value):
+        return make_response('', 304)
+
+    response = make_response(body)
+    response.headers['Content-Type'] = 'application/json'
+    response.set_etag(etag_value)
+    # 可见性取决于登录态/敏感内容开关，只允许浏览器私有缓存
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
+
+
 @bp.route('/api/stats/view/<int:img_id>', methods=['POST'])
+@replica_lag_ok
 def stat_view(img_id):
     """增加浏览计数"""
     img = db.session.get(Image, img_id)
@@ -256,6 +342,7 @@ def stat_view(img_id):
 
 
 @bp.route('/api/stats/copy/<int:img_id>', methods=['POST'])
+@replica_lag_ok
 def stat_copy(img_id):
     """增加复制计数"""
     img = db.session.get(Image, img_id)
@@ -268,7 +355,7 @@ def stat_copy(img_id):
 
 @bp.route('/api/upload', methods=['POST'])
 @csrf.exempt
-@limiter.limit(lambda: current_app.config['UPLOAD_RATE_LIMIT'])
+@limiter.limit(ConfigService.get_upload_rate_limit)
 @require_api_token
 def api_upload():
     """
@@ -6,23 +6,31 @@ from dotenv import load_dotenv
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
-instance_path = os.path.join(basedir, 'instance')
-if not os.path.exists(instance_path):
-    os.makedirs(instance_path)
+# 运行时数据目录 (数据库、SECRET_KEY、限流计数等)，可用 INSTANCE_PATH 指向其他位置
+# 导入本模块不做任何文件读写：目录创建与 SECRET_KEY 文件读写在 create_app 中进行
+instance_path = os.environ.get('INSTANCE_PATH') or os.path.join(basedir, 'instance')
 
 
 def str_to_bool(s):
     return str(s).lower() == 'true'
 
 
-def get_or_create_secret_key():
+def env_secret_key():
+    """环境变量中的 SECRET_KEY (未设置或仍为示例值时返回 None)"""
+    env_key = os.environ.get('SECRET_KEY')
+    if env_key and env_key != 'dev-key-please-change-in-prod':
+        return env_key
+    return None
+
+
+def get_or_create_secret_key(instance_path):
     """
-    获取或自动生成 SECRET_KEY
+    获取或自动生成 SECRET_KEY (由 create_app 在未配置密钥时调用)
     优先级: 环境变量 > 持久化文件 > 自动生成并保存
     """
     # 1. 优先使用环境变量
-    env_key = os.environ.get('SECRET_KEY')
-    if env_key and env_key != 'dev-key-please-change-in-prod':
+    env_key = env_secret_key()
+    if env_key:
         return env_key
 
     # 2. 尝试从持久化文件读取
@@ -41,7 +49,11 @@ def get_or_create_secret_key():
 
 class Config:
     """应用全局配置"""
-    SECRET_KEY = get_or_create_secret_key()
+    # 未设置时由 create_app 从 instance/.secret_key 读取或生成
+    SECRET_KEY = env_secret_key()
+    INSTANCE_PATH = instance_path
+    # 日志目录 (非调试/测试模式下写入 prompt_manager.log)
+    LOG_DIR = os.environ.get('LOG_DIR') or os.path.join(basedir, 'logs')
 
     # =========================================================
     # 数据库智能配置逻辑
@@ -92,14 +104,65 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # SQLite 连接参数 (每个连接建立时执行 PRAGMA)
+    # 未设置时使用 DatabaseService 中的调优默认值；设为空或 0 表示保持 SQLite 自身默认
+    # WAL：读写互不阻塞；synchronous=NORMAL 在 WAL 下仍保证崩溃一致性，提交无需每次 fsync
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS')
+    # 遇到写锁时等待的毫秒数，而不是立即报 database is locked (默认 5000)
+    SQLITE_BUSY_TIMEOUT_MS = os.environ.get('SQLITE_BUSY_TIMEOUT_MS')
+    # 内存映射读取的字节数 (默认 256MB)
+    SQLITE_MMAP_SIZE = os.environ.get('SQLITE_MMAP_SIZE')
+    # 页缓存大小：负数表示 KiB (默认 64MB)
+    SQLITE_CACHE_SIZE = os.environ.get('SQLITE_CACHE_SIZE')
+
+    # MySQL / PostgreSQL 连接池
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    # 取用连接前先探活，丢弃已被服务端断开的连接
+    DB_POOL_PRE_PING = str_to_bool(os.environ.get('DB_POOL_PRE_PING', 'True'))
+    # 连接最长存活秒数，应小于服务端 wait_timeout / 负载均衡空闲超时
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    # 慢查询日志阈值 (毫秒)，0 为关闭
+    SQL_SLOW_QUERY_MS = int(os.environ.get('SQL_SLOW_QUERY_MS') or 200)
+    # 同一请求内同一形状的语句执行达到此次数时记录疑似 N+1，0 为关闭
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD') or 10)
+    # 只读副本 (可选)：公开页面与 /api 列表的查询走副本，写入与管理员请求仍走主库
+    DB_REPLICA_URI = os.environ.get('DB_REPLICA_URI', '')
+    # 写入后该客户端的读请求继续走主库的秒数 (覆盖副本复制延迟)
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS') or 10)
+    # manage_db.py 在未随代码发布迁移脚本 (migrations/versions) 时是否现场自动生成迁移
+    DB_AUTOGENERATE_MIGRATIONS = str_to_bool(os.environ.get('DB_AUTOGENERATE_MIGRATIONS', 'True'))
+
     # =========================================================
     # 其他配置
     # =========================================================
     
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'static/uploads'
+    # 本地媒体分发：'' (Flask 直接发送) | 'x-accel-redirect' (Nginx) | 'x-sendfile' (Apache/Lighttpd)
+    MEDIA_OFFLOAD = (os.environ.get('MEDIA_OFFLOAD') or '').lower()
+    # X-Accel-Redirect 使用的 Nginx internal location 前缀
+    MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX') or '/_protected_uploads'
+    # uuid 命名的上传文件永不变化，默认缓存一年 (immutable)
+    MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE') or 31536000)
+    # 本地上传目录分片层数：2 表示 ab/cd/<uuid>.jpg，0 为平铺 (旧布局)
+    UPLOAD_SHARD_LEVELS = int(os.environ.get('UPLOAD_SHARD_LEVELS') or 2)
     MAX_REF_IMAGES = int(os.environ.get('MAX_REF_IMAGES') or 10)
     UPLOAD_RATE_LIMIT = os.environ.get('UPLOAD_RATE_LIMIT') or '100 per hour'
     LOGIN_RATE_LIMIT = os.environ.get('LOGIN_RATE_LIMIT') or '10 per minute'
+    # 限流计数存储：默认 instance 目录下的 SQLite 文件 (同机多 worker 共享)；多机部署用 redis://host:6379
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI') or \
+        f"sqlite:///{os.path.join(instance_path, 'ratelimit.db')}"
+    # moving-window 按真实时间窗计数，不会在固定窗口边界处放行双倍请求
+    RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY') or 'moving-window'
+
+    # 运行时指标 (Prometheus /metrics)：未设置 METRICS_TOKEN 时端点返回 404，但仍在后台累计
+    METRICS_ENABLED = str_to_bool(os.environ.get('METRICS_ENABLED', 'True'))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    # 各 worker 定期把增量合并进此 SQLite 文件，/metrics 读取汇总结果
+    METRICS_DB_PATH = os.environ.get('METRICS_DB_PATH') or os.path.join(instance_path, 'metrics.db')
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL') or 5)
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME') or 'admin'
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD') or '123456'
     ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE') or 24)
@@ -110,7 +173,15 @@ class Config:
     ENABLE_IMG_COMPRESS = str_to_bool(os.environ.get('ENABLE_IMG_COMPRESS', 'True'))
     USE_THUMBNAIL_IN_PREVIEW = str_to_bool(os.environ.get('USE_THUMBNAIL_IN_PREVIEW', 'True'))
     USE_LOCAL_RESOURCES = str_to_bool(os.environ.get('USE_LOCAL_RESOURCES', 'True'))
+    # 使用 `flask build-assets` 生成的带哈希静态资源 (调试模式下始终使用原始文件)
+    ASSET_MANIFEST_ENABLED = str_to_bool(os.environ.get('ASSET_MANIFEST_ENABLED', 'True'))
+    # Jinja 模板字节码缓存目录 (留空不启用)，多个 worker / 重启后复用已编译的模板
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR') or ''
     ALLOW_PUBLIC_SENSITIVE_TOGGLE = str_to_bool(os.environ.get('ALLOW_PUBLIC_SENSITIVE_TOGGLE', 'True'))
+    # 每个进程缓存的作品 JSON 片段条数 (按行版本失效)，0 为关闭
+    IMAGE_JSON_CACHE_SIZE = int(os.environ.get('IMAGE_JSON_CACHE_SIZE') or 5000)
+    # 安装了 orjson 时用其替换 app.json 编码
+    ORJSON_ENABLED = str_to_bool(os.environ.get('ORJSON_ENABLED', 'True'))
 
     # =========================================================
     # 上传体积与安全限制
@@ -125,6 +196,12 @@ class Config:
     # 公开上传接口 /api/upload 的可选鉴权令牌，留空则不校验（向后兼容）
     API_UPLOAD_TOKEN = os.environ.get('API_UPLOAD_TOKEN') or ''
 
+    # 文件删除队列：删除记录随事务提交，由后台线程批量清理并失败重试
+    DELETION_WORKER_ENABLED = str_to_bool(os.environ.get('DELETION_WORKER_ENABLED', 'True'))
+    DELETION_QUEUE_INTERVAL = int(os.environ.get('DELETION_QUEUE_INTERVAL') or 60)
+    DELETION_MAX_ATTEMPTS = int(os.environ.get('DELETION_MAX_ATTEMPTS') or 8)
+    DELETION_RETRY_DELAY = int(os.environ.get('DELETION_RETRY_DELAY') or 30)
+
     STORAGE_TYPE = os.environ.get('STORAGE_TYPE') or 'local'
     S3_ENDPOINT = os.environ.get('S3_ENDPOINT')
     S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
@@ -132,3 +209,8 @@ class Config:
     S3_BUCKET = os.environ.get('S3_BUCKET')
     S3_DOMAIN = os.environ.get('S3_DOMAIN')
     S3_THUMB_SUFFIX = os.environ.get('S3_THUMB_SUFFIX') or ''
+    # S3 客户端连接池与超时 (每个进程复用同一客户端)
+    S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS') or 20)
+    S3_MAX_ATTEMPTS = int(os.environ.get('S3_MAX_ATTEMPTS') or 3)
+    S3_CONNECT_TIMEOUT = int(os.environ.get('S3_CONNECT_TIMEOUT') or 5)
+    S3_READ_TIMEOUT = int(os.environ.get('S3_READ_TIMEOUT') or 60)
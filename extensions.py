@@ -4,16 +4,17 @@ from flask_wtf.csrf import CSRFProtect
 from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from services.database_service import RoutingSession
 
-# 初始化核心扩展
-db = SQLAlchemy()
+# 初始化核心扩展 (RoutingSession 支持把只读请求路由到副本库)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 csrf = CSRFProtect()
 migrate = Migrate()
 
 # 限流器 (具体限制在各蓝图中定义)
+# 存储与策略取自配置 RATELIMIT_STORAGE_URI / RATELIMIT_STRATEGY，多 worker 共享同一份计数
 limiter = Limiter(
     key_func=get_remote_address,
-    storage_uri="memory://",
     default_limits=["5000 per day", "1000 per hour"]
 )
\ No newline at end of file
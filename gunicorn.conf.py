@@ -0,0 +1,52 @@
+"""
+Gunicorn 配置 (容器内由 start.sh 以 `gunicorn -c gunicorn.conf.py app:app` 启动)
+
+- preload_app：master 预先导入应用，worker 通过 fork 以写时复制方式共享已加载的代码与模板，降低每个 worker 的常驻内存
+- post_fork：worker 丢弃从 master 继承的数据库连接池、S3 客户端、后台线程状态与进程内缓存 (见 app.reset_worker_state)
+- max_requests + jitter：worker 处理一定请求后错峰重启，回收内存碎片
+- worker 类型可选 gthread (默认) 或 gevent (需 pip install gevent)
+
+所有参数均可用 GUNICORN_* 环境变量覆盖。
+"""
+import gc
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name) or default)
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = _env_int('GUNICORN_WORKERS', 2)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread').lower()
+# gthread 每个 worker 的线程数；gevent 每个 worker 的并发连接数
+threads = _env_int('GUNICORN_THREADS', 4)
+worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 1000)
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() in ('true', '1', 'yes', 'on')
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+accesslog = '-'
+errorlog = '-'
+capture_output = True
+
+if worker_class == 'gevent':
+    # 须在预加载应用之前打补丁，否则 master 中已导入的 socket/threading 仍是阻塞实现
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def when_ready(server):
+    # 预加载产生的对象移入永久代，避免 worker 的 GC 扫描触碰这些页面而破坏写时复制
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import app, reset_worker_state
+        reset_worker_state(app)
@@ -1,4 +1,6 @@
+import argparse
 import os
+import sys
 import time
 from sqlalchemy import inspect, text  # <--- 1. 这里加了 text
 from werkzeug.security import generate_password_hash
@@ -7,10 +9,13 @@ from flask_migrate import migrate, upgrade, init, stamp
 # 引入你的应用组件
 from app import create_app, db
 from models import User
+from services.schema_service import AUTO_MIGRATION_MARK, SchemaService
 
 # 创建应用上下文
 app = create_app()
 
+MIGRATIONS_DIR = 'migrations'
+
 
 def ensure_admin_user():
     """
@@ -34,9 +39,72 @@ def ensure_admin_user():
         print(f"✅ 管理员账户 '{admin_username}' 已存在。")
 
 
-def sync_database():
+def _legacy_auto_migrate(existing_tables):
+    """
+    未随代码发布迁移脚本时的兼容流程：现场初始化迁移仓库并自动生成、应用迁移。
+    """
+    # 标记是否刚刚执行了初始化，用于后续判断是否需要重置 DB 版本
+    is_fresh_migrations = False
+
+    if not os.path.exists(MIGRATIONS_DIR):
+        print("📦 检测到 migrations 文件夹缺失 (可能是 Docker 镜像更新导致)...")
+        print("⚙️  正在重新初始化迁移环境...")
+        init()
+        is_fresh_migrations = True
+
+    # 智能处理版本冲突
+    has_version_table = 'alembic_version' in existing_tables
+
+    if has_version_table and is_fresh_migrations:
+        print("⚠️  [自动修复] 检测到数据库有历史记录，但迁移文件已丢失。")
+        print("🔄 正在重置数据库版本记录，以匹配当前代码...")
+        # 强制删除版本表
+        with db.engine.connect() as conn:
+            conn.execute(text("DROP TABLE alembic_version"))
+            conn.commit()
+        print("✅ 版本记录已重置。")
+        has_version_table = False  # 更新状态
+
+    # 处理“既有表但无版本号”的情况 (Stamping)
+    if 'user' in existing_tables and not has_version_table:
+        print("🏷️  正在将当前数据库状态标记为基准版本 (Stamping)...")
+        # 注意：如果你的 Model 比 数据库 新，后续的 migrate 会自动检测出差异
+        stamp()
+
+    # 执行迁移 (生成脚本 -> 应用变更)
+    print("🔍 正在扫描模型变动 (Auto Migrate)...")
+
+    # 使用时间戳防止迁移脚本文件名冲突
+    migration_message = f"{AUTO_MIGRATION_MARK}{int(time.time())}"
+
+    try:
+        # 尝试生成迁移脚本
+        # 这一步会对比 models.py 和 数据库 的差异
+        # 如果有差异（比如你加了新字段），它会生成新的脚本
+        migrate(message=migration_message)
+    except Exception as e:
+        print(f"ℹ️  生成迁移脚本提示 (通常可忽略): {e}")
+
+
+def _apply_shipped_migrations(existing_tables):
     """
-    [核心逻辑] 智能数据库同步工具 (已增强自动修复功能)
+    随代码发布的迁移脚本 (migrations/versions) 直接 upgrade，不做模型比对。
+    空库先 create_all 再标记为最新版本；已有表但无版本记录时标记为基准版本。
+    """
+    if 'user' not in existing_tables:
+        print("🆕 空数据库：按模型建表并标记为最新迁移版本...")
+        db.create_all()
+        stamp(directory=MIGRATIONS_DIR)
+        return
+    if 'alembic_version' not in existing_tables:
+        print("🏷️  正在将当前数据库状态标记为基准版本 (Stamping)...")
+        stamp(directory=MIGRATIONS_DIR)
+
+
+def sync_database(force=False):
+    """
+    [核心逻辑] 智能数据库同步工具
+    结构指纹与库中记录一致时跳过迁移；有随代码发布的迁移脚本时只执行 upgrade，否则回退到自动生成。
     """
     print("=" * 60)
     print("🛠️  Prompt Manager 智能数据库同步工具 (Smart Sync)")
@@ -47,72 +115,97 @@ def sync_database():
         try:
             inspector = inspect(db.engine)
             existing_tables = inspector.get_table_names()
-            db_path = str(db.engine.url)
+            db_path = db.engine.url.render_as_string(hide_password=True)
             print(f"📂 数据库目标: {db_path}")
         except Exception as e:
             print(f"❌ 数据库连接失败: {e}")
-            return
-
-        # 2. 初始化迁移仓库 (如果不存在)
-        # 标记是否刚刚执行了初始化，用于后续判断是否需要重置 DB 版本
-        is_fresh_migrations = False
-
-        if not os.path.exists('migrations'):
-            print("📦 检测到 migrations 文件夹缺失 (可能是 Docker 镜像更新导致)...")
-            print("⚙️  正在重新初始化迁移环境...")
-            init()
-            is_fresh_migrations = True
-
-        # 3. 智能处理版本冲突
-        has_version_table = 'alembic_version' in existing_tables
-
-        if has_version_table and is_fresh_migrations:
-            print("⚠️  [自动修复] 检测到数据库有历史记录，但迁移文件已丢失。")
-            print("🔄 正在重置数据库版本记录，以匹配当前代码...")
-            # 强制删除版本表
-            with db.engine.connect() as conn:
-                conn.execute(text("DROP TABLE alembic_version"))
-                conn.commit()
-            print("✅ 版本记录已重置。")
-            has_version_table = False  # 更新状态
-
-        # 4. 处理“既有表但无版本号”的情况 (Stamping)
-        if 'user' in existing_tables and not has_version_table:
-            print("🏷️  正在将当前数据库状态标记为基准版本 (Stamping)...")
-            # 注意：如果你的 Model 比 数据库 新，后续的 migrate 会自动检测出差异
-            stamp()
-
-        # 5. 执行迁移 (生成脚本 -> 应用变更)
-        print("🔍 正在扫描模型变动 (Auto Migrate)...")
-
-        # 使用时间戳防止迁移脚本文件名冲突
-        migration_message = f"auto_update_{int(time.time())}"
+            return False
+
+        # 2. 结构指纹未变：无需任何迁移操作
+        if not force and SchemaService.is_current(MIGRATIONS_DIR):
+            print("⚡ 数据库结构指纹未变化，跳过迁移。")
+            ensure_admin_user()
+            return True
+
+        # 3. 同步结构
+        shipped = SchemaService.migration_files(MIGRATIONS_DIR)
+        if shipped:
+            print(f"📦 使用随代码发布的 {len(shipped)} 个迁移脚本 (不自动生成)...")
+            _apply_shipped_migrations(existing_tables)
+        elif app.config.get('DB_AUTOGENERATE_MIGRATIONS', True):
+            _legacy_auto_migrate(existing_tables)
+        else:
+            print("🆕 未发布迁移脚本且已关闭自动生成：按模型补建缺失的表...")
+            db.create_all()
+
+        ok = True
+        if os.path.exists(MIGRATIONS_DIR):
+            try:
+                print("🚀 正在应用数据库变更 (Upgrade)...")
+                upgrade(directory=MIGRATIONS_DIR)
+                print("✅ 数据库结构已同步至最新。")
+            except Exception as e:
+                ok = False
+                print(f"❌ 升级过程中发生错误: {e}")
+                print("提示: 如果是'No changes detected'或'alembic_version'相关错误，通常说明已是最新。")
+
+        # 4. 记录指纹 (失败时不记录，下次启动重试)
+        if ok:
+            SchemaService.store_fingerprint(MIGRATIONS_DIR)
+            print("🔖 已记录数据库结构指纹。")
+
+        # 5. 确保种子数据 (管理员)
+        ensure_admin_user()
 
-        try:
-            # 尝试生成迁移脚本
-            # 这一步会对比 models.py 和 数据库 的差异
-            # 如果有差异（比如你加了新字段），它会生成新的脚本
-            migrate(message=migration_message)
-        except Exception as e:
-            print(f"ℹ️  生成迁移脚本提示 (通常可忽略): {e}")
+    print("\n🎉 所有操作完成！系统已就绪。")
+    return ok
 
-        try:
-            print("🚀 正在应用数据库变更 (Upgrade)...")
-            upgrade()
-            print("✅ 数据库结构已同步至最新。")
-        except Exception as e:
-            print(f"❌ 升级过程中发生错误: {e}")
-            print("提示: 如果是'No changes detected'或'alembic_version'相关错误，通常说明已是最新。")
 
-        # 6. 确保种子数据 (管理员)
-        ensure_admin_user()
+def check_schema():
+    """结构指纹是否与库中记录一致 (用于部署脚本判断是否需要迁移)"""
+    with app.app_context():
+        current = SchemaService.is_current(MIGRATIONS_DIR)
+    print("✅ 数据库结构已是最新。" if current else "⚠️  数据库结构需要同步 (python manage_db.py)。")
+    return current
 
-    print("\n🎉 所有操作完成！系统已就绪。")
+
+def make_migration(message):
+    """
+    [开发环境] 对比模型与开发库生成迁移脚本，提交到代码仓库随镜像发布；
+    部署时 manage_db.py 只执行 upgrade，不再现场生成。
+    """
+    with app.app_context():
+        if not os.path.exists(MIGRATIONS_DIR):
+            init(directory=MIGRATIONS_DIR)
+        upgrade(directory=MIGRATIONS_DIR)
+        migrate(directory=MIGRATIONS_DIR, message=message)
+
+
+def print_upgrade_sql():
+    """离线模式：输出从当前记录版本升级到最新的 SQL，交由 DBA 审核后手动执行"""
+    if not SchemaService.migration_files(MIGRATIONS_DIR):
+        print("❌ 未找到随代码发布的迁移脚本，请先在开发环境执行 --make-migration。")
+        return
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR, sql=True)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prompt Manager 数据库同步')
+    parser.add_argument('--force', action='store_true', help='忽略结构指纹，强制执行迁移流程')
+    parser.add_argument('--check', action='store_true', help='只检查结构指纹，需要同步时返回退出码 1')
+    parser.add_argument('--make-migration', metavar='MESSAGE', help='[开发] 生成迁移脚本以随代码发布')
+    parser.add_argument('--sql', action='store_true', help='离线模式：输出升级 SQL 而不连接执行')
+    args = parser.parse_args()
     try:
-        sync_database()
+        if args.check:
+            sys.exit(0 if check_schema() else 1)
+        elif args.make_migration:
+            make_migration(args.make_migration)
+        elif args.sql:
+            print_upgrade_sql()
+        else:
+            sync_database(force=args.force)
     except KeyboardInterrupt:
         print("\n🚫 操作已取消。")
     except Exception as e:
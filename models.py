@@ -1,10 +1,16 @@
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
 from extensions import db
+from services.media_service import infer_media_type
 
 image_tags = db.Table('image_tags',
                       db.Column('image_id', db.Integer, db.ForeignKey('image.id')),
-                      db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'))
+                      db.Column('tag_id', db.Integer, db.ForeignKey('tag.id')),
+                      # 按标签查作品 (多标签筛选的分组查询) 与按作品查标签 (预加载) 都走覆盖索引
+                      db.Index('ix_image_tags_tag_image', 'tag_id', 'image_id'),
+                      db.Index('ix_image_tags_image_tag', 'image_id', 'tag_id'),
                       )
 
 
@@ -20,10 +26,21 @@ class SystemSetting(db.Model):
     key = db.Column(db.String(50), primary_key=True)
     value = db.Column(db.String(255))  # 存储 '1'/'0' 或其他字符串
 
+    @staticmethod
+    def _loaded(key):
+        """
+        读取配置行。表很小：会话内首次读取时一次查询载入全部行，之后 (含不存在的键) 不再逐个查询；
+        事务结束 (提交/回滚) 后重新载入
+        """
+        settings = db.session.info.get('system_settings')
+        if settings is None:
+            settings = db.session.info['system_settings'] = {s.key: s for s in SystemSetting.query.all()}
+        return settings.get(key)
+
     @staticmethod
     def get_bool(key, default=True):
         """获取布尔值设置"""
-        setting = db.session.get(SystemSetting, key)
+        setting = SystemSetting._loaded(key)
         if not setting:
             return default
         return setting.value == '1'
@@ -42,7 +59,7 @@ class SystemSetting(db.Model):
     @staticmethod
     def get_str(key, default=''):
         """获取字符串设置"""
-        setting = db.session.get(SystemSetting, key)
+        setting = SystemSetting._loaded(key)
         if not setting or setting.value is None:
             return default
         return setting.value
@@ -60,7 +77,7 @@ class SystemSetting(db.Model):
     @staticmethod
     def get_int(key, default=0):
         """获取整数设置"""
-        setting = db.session.get(SystemSetting, key)
+        setting = SystemSetting._loaded(key)
         if not setting or setting.value is None:
             return default
         try:
@@ -81,6 +98,10 @@ class SystemSetting(db.Model):
 
 class Image(db.Model):
     """核心作品模型"""
+    __table_args__ = (
+        # 审核队列按状态筛选后按时间键集翻页
+        db.Index('ix_image_status_created', 'status', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     author = db.Column(db.String(50), default='匿名')
@@ -106,31 +127,56 @@ class Image(db.Model):
     refs = db.relationship('ReferenceImage', backref='image', cascade="all, delete-orphan",
                            order_by="ReferenceImage.position")
 
-    def to_dict(self, base_url=''):
+    # 行版本号：作品本身、其标签或参考图有改动时递增 (见 _bump_image_row_version)，
+    # 作为序列化缓存的键，各进程无需通知即可识别过期条目。
+    # 绕过 ORM 的批量 UPDATE 需自行递增该字段。
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # 浏览/复制计数只随统计上报变化，不递增 row_version (heat_score 另行计入缓存键)
+    COUNTER_COLUMNS = frozenset({'views_count', 'copies_count', 'heat_score'})
+
+    # API 可返回的字段 (顺序即输出顺序)，及按需加载时每个字段依赖的列
+    API_FIELDS = ('id', 'title', 'author', 'prompt', 'description', 'type', 'category', 'media_type',
+                  'file_path', 'thumbnail_path', 'tags', 'refs', 'heat_score', 'created_at')
+    FIELD_COLUMNS = {
+        'media_type': ('media_type', 'file_path'),
+        'tags': (),
+        'refs': (),
+    }
+
+    def to_dict(self, base_url='', fields=None):
         """序列化为字典，用于 API 或导出。
 
         :param base_url: 用于将本地相对路径拼成绝对 URL 的站点根 (如 request.url_root)。
                          留空则返回原始相对路径，使模型可在请求上下文外/测试中调用。
+        :param fields: 仅输出这些字段 (稀疏字段集)，None 为全部；未请求的关联不会被访问。
         """
-        from services.media_service import infer_media_type
-
         prefix = base_url.rstrip('/') if base_url else ''
+        names = self.API_FIELDS if fields is None else [f for f in self.API_FIELDS if f in fields]
+        return {name: self._field_value(name, prefix) for name in names}
 
-        def _get_full_url(path):
-            if not path:
-                return None
-            if path.startswith(('http://', 'https://')):
-                return path
-            return f"{prefix}{path}" if prefix else path
+    def _field_value(self, name, prefix):
+        if name == 'media_type':
+            return self.media_type or infer_media_type(self.file_path)
+        # 主图和缩略图都处理成绝对路径
+        if name in ('file_path', 'thumbnail_path'):
+            return _full_url(prefix, getattr(self, name))
+        if name == 'tags':
+            return [t.name for t in self.tags]
+        if name == 'refs':
+            return self._refs_data(prefix)
+        if name == 'created_at':
+            return self.created_at.isoformat()
+        return getattr(self, name)
 
-        # 构造参考图列表
+    def _refs_data(self, prefix):
+        """构造参考图列表"""
         refs_data = []
         for r in self.refs:
             # 处理占位符逻辑，如果是占位符，返回特定标记 {{userText}}
             if r.is_placeholder:
                 final_path = "{{userText}}"
             else:
-                final_path = _get_full_url(r.file_path) if r.file_path else ""
+                final_path = _full_url(prefix, r.file_path) if r.file_path else ""
 
             refs_data.append({
                 "id": r.id,
@@ -138,29 +184,16 @@ class Image(db.Model):
                 "is_placeholder": r.is_placeholder,
                 "position": r.position
             })
+        return refs_data
 
-        return {
-            "id": self.id,
-            "title": self.title,
-            "author": self.author,
-            "prompt": self.prompt,
-            "description": self.description,
-            "type": self.type,
-            "category": self.category,
-            "media_type": self.media_type or infer_media_type(self.file_path),
-
-            # 主图和缩略图都处理成绝对路径
-            "file_path": _get_full_url(self.file_path),
-            "thumbnail_path": _get_full_url(self.thumbnail_path),
-
-            "tags": [t.name for t in self.tags],
-
-            # 参考图列表
-            "refs": refs_data,
 
-            "heat_score": self.heat_score,
-            "created_at": self.created_at.isoformat()
-        }
+def _full_url(prefix, path):
+    """本地相对路径拼接站点根；外链与空值原样返回"""
+    if not path:
+        return None
+    if path.startswith(('http://', 'https://')):
+        return path
+    return f"{prefix}{path}" if prefix else path
 
 
 class ReferenceImage(db.Model):
@@ -176,4 +209,62 @@ class Tag(db.Model):
     """标签模型"""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
-    is_sensitive = db.Column(db.Boolean, default=False)
\ No newline at end of file
+    is_sensitive = db.Column(db.Boolean, default=False)
+
+
+class StatCounter(db.Model):
+    """聚合计数器 (作品总数、各状态/分类/媒体类型数量、标签数、存储占用)，随事务增量维护"""
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class PendingDeletion(db.Model):
+    """待删除文件队列：记录随事务一起提交，由后台线程批量清理并失败重试"""
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), nullable=False)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_loaded_settings(session, transaction):
+    # 提交/回滚后对象已过期或可能被其他会话修改，下次读取时重新载入配置
+    session.info.pop('system_settings', None)
+
+
+def _has_content_changes(img):
+    """除计数列以外是否有改动 (含标签、参考图集合)"""
+    return any(attr.key not in Image.COUNTER_COLUMNS and attr.history.has_changes()
+               for attr in inspect(img).attrs)
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_image_row_version(session, flush_context, instances):
+    """作品、参考图或标签名变动时递增相关作品的 row_version，使序列化缓存失效"""
+    touched, renamed_tags = set(), []
+    for obj in session.dirty:
+        if isinstance(obj, Image) and _has_content_changes(obj):
+            touched.add(obj)
+        elif isinstance(obj, ReferenceImage) and obj.image is not None:
+            touched.add(obj.image)
+        elif isinstance(obj, Tag) and inspect(obj).attrs.name.history.has_changes():
+            renamed_tags.append(obj.id)
+    for obj in session.new:
+        if isinstance(obj, ReferenceImage) and obj.image is not None:
+            touched.add(obj.image)
+
+    for img in touched:
+        if img in session.new or img in session.deleted:
+            continue
+        img.row_version = (img.row_version or 0) + 1
+    if renamed_tags:
+        # 热门标签可能关联大量作品：一条集合 UPDATE，不把作品逐个载入会话
+        session.execute(
+            update(Image)
+            .where(Image.id.in_(select(image_tags.c.image_id).where(image_tags.c.tag_id.in_(renamed_tags))))
+            .values(row_version=Image.row_version + 1)
+            .execution_options(synchronize_session=False)
+        )
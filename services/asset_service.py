@@ -0,0 +1,256 @@
+"""
+静态资源构建：压缩 (minify)、内容哈希指纹、预压缩 (.gz / .br)
+
+`flask build-assets` 把 ASSET_SOURCES 输出到 static/dist/ 并写入 manifest.json；
+模板通过 asset_url() 解析为带哈希的文件名，配合一年期 immutable 缓存头，
+回访时浏览器无需再请求任何静态资源。未构建或调试模式下回退为原始文件。
+
+第三方依赖 (Bootstrap 等) 记录在版本化清单 VENDOR_ASSETS 中，只由 `flask fetch-assets` 下载并校验完整性；
+应用启动时仅 stat 检查文件是否就位，不做任何网络请求，缺失的文件在页面上回退到清单中的 CDN 地址。
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import urllib.request
+
+from flask import current_app, url_for
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 参与构建的资源 (相对 static 目录)，第三方文件由 `flask fetch-assets` 按 VENDOR_ASSETS 下载
+ASSET_SOURCES = [
+    'css/style.css',
+    'css/bootstrap.min.css',
+    'css/bootstrap-icons.min.css',
+    'css/nprogress.min.css',
+    'js/theme.js',
+    'js/gallery.js',
+    'js/image_form.js',
+    'js/bootstrap.bundle.min.js',
+    'js/nprogress.min.js',
+    'js/Sortable.min.js',
+]
+MANIFEST_NAME = 'manifest.json'
+
+# 第三方依赖清单：本地路径 (相对 static 目录) -> 版本、来源与完整性哈希 (SRI 格式 sha384-<base64>)。
+# 升级依赖时修改 version/url/integrity 并递增 VENDOR_MANIFEST_VERSION。integrity 必填：
+# 留空的条目 fetch-assets 一律判为失败且不落盘，失败信息中附带下载内容的摘要，与官方发布的 SRI 核对后填入。
+VENDOR_MANIFEST_VERSION = 1
+_BOOTCDN = 'https://cdn.bootcdn.net/ajax/libs'
+VENDOR_ASSETS = {
+    'css/bootstrap.min.css': {
+        'version': '5.3.0', 'url': f'{_BOOTCDN}/twitter-bootstrap/5.3.0/css/bootstrap.min.css',
+        'integrity': 'sha384-9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM'},
+    'css/nprogress.min.css': {
+        'version': '0.2.0', 'url': f'{_BOOTCDN}/nprogress/0.2.0/nprogress.min.css', 'integrity': ''},
+    'css/bootstrap-icons.min.css': {
+        'version': '1.10.5', 'url': f'{_BOOTCDN}/bootstrap-icons/1.10.5/font/bootstrap-icons.min.css', 'integrity': ''},
+    'js/bootstrap.bundle.min.js': {
+        'version': '5.3.0', 'url': f'{_BOOTCDN}/twitter-bootstrap/5.3.0/js/bootstrap.bundle.min.js',
+        'integrity': 'sha384-geWF76RCwLtnZ8qwWowPQNguL3RmwHVBC9FhGdlKrxdiJJigb/j/68SIy3Te4Bkz'},
+    'js/nprogress.min.js': {
+        'version': '0.2.0', 'url': f'{_BOOTCDN}/nprogress/0.2.0/nprogress.min.js', 'integrity': ''},
+    'js/Sortable.min.js': {
+        'version': '1.15.0', 'url': f'{_BOOTCDN}/Sortable/1.15.0/Sortable.min.js', 'integrity': ''},
+    'css/fonts/bootstrap-icons.woff2': {
+        'version': '1.10.5', 'url': f'{_BOOTCDN}/bootstrap-icons/1.10.5/font/fonts/bootstrap-icons.woff2',
+        'integrity': ''},
+    'css/fonts/bootstrap-icons.woff': {
+        'version': '1.10.5', 'url': f'{_BOOTCDN}/bootstrap-icons/1.10.5/font/fonts/bootstrap-icons.woff',
+        'integrity': ''},
+}
+
+# CSS 中的相对 url(...)：构建产物换了目录，需要改写为绝对路径
+_CSS_RELATIVE_URL = re.compile(r'url\(\s*([\'"]?)(?![a-zA-Z][a-zA-Z0-9+.-]*:|/|#)([^\'")]+)\1\s*\)')
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+
+
+def _basic_css_min(text):
+    """未安装 rcssmin 时的保守压缩：去注释、合并空白。"""
+    text = _CSS_COMMENT.sub('', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def _minify(rel_path, text):
+    if '.min.' in os.path.basename(rel_path):
+        return text
+    if rel_path.endswith('.css'):
+        return rcssmin.cssmin(text) if rcssmin else _basic_css_min(text)
+    if rel_path.endswith('.js') and rjsmin:
+        return rjsmin.jsmin(text)
+    return text
+
+
+def _rewrite_css_urls(rel_path, text, static_url_path):
+    base_dir = posixpath.dirname(rel_path)
+
+    def _sub(match):
+        quote, target = match.group(1), match.group(2).strip()
+        path, sep, suffix = target.partition('?')
+        resolved = posixpath.normpath(posixpath.join(base_dir, path))
+        return f"url({quote}{static_url_path}/{resolved}{sep}{suffix}{quote})"
+
+    return _CSS_RELATIVE_URL.sub(_sub, text)
+
+
+def _hashed_name(rel_path, digest):
+    stem, ext = os.path.splitext(rel_path)
+    return f"{stem}.{digest}{ext}"
+
+
+def _integrity(data):
+    """SRI 格式的 sha384 摘要"""
+    return 'sha384-' + base64.b64encode(hashlib.sha384(data).digest()).decode('ascii')
+
+
+def _static_path(static_folder, rel_path):
+    return os.path.join(static_folder, *rel_path.split('/'))
+
+
+class AssetService:
+    @staticmethod
+    def dist_dir(app):
+        return app.config.get('ASSET_DIST_DIR') or os.path.join(app.static_folder, 'dist')
+
+    @staticmethod
+    def build(static_folder, dist_dir, static_url_path='/static'):
+        """
+        构建全部资源，返回 manifest ({原路径: dist 内带哈希的路径})。
+        缺失的源文件 (如未下载的第三方库) 会被跳过。
+        """
+        manifest = {}
+        for rel_path in ASSET_SOURCES:
+            src = os.path.join(static_folder, *rel_path.split('/'))
+            if not os.path.exists(src):
+                continue
+            with open(src, 'r', encoding='utf-8') as f:
+                text = f.read()
+
+            text = _minify(rel_path, text)
+            if rel_path.endswith('.css'):
+                text = _rewrite_css_urls(rel_path, text, static_url_path)
+            data = text.encode('utf-8')
+
+            hashed = _hashed_name(rel_path, hashlib.sha256(data).hexdigest()[:12])
+            out = os.path.join(dist_dir, *hashed.split('/'))
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(out, 'wb') as f:
+                f.write(data)
+
+            # 预压缩：只保留比原文件更小的版本
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                with open(out + '.gz', 'wb') as f:
+                    f.write(gz)
+            if brotli:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    with open(out + '.br', 'wb') as f:
+                        f.write(br)
+
+            manifest[rel_path] = hashed
+
+        with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        return manifest
+
+    @staticmethod
+    def load_manifest(app):
+        """启动时读取 manifest；不存在、调试模式或被禁用时返回空表 (回退到原始文件)。"""
+        if app.debug or not app.config.get('ASSET_MANIFEST_ENABLED', True):
+            return {}
+        path = os.path.join(AssetService.dist_dir(app), MANIFEST_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def asset_url(filename):
+        """模板辅助函数：返回静态资源 URL，已构建时指向带哈希的文件，缺失的第三方文件回退到 CDN。"""
+        hashed = current_app.extensions.get('asset_manifest', {}).get(filename)
+        if hashed:
+            return url_for('assets.serve_asset', filename=hashed)
+        if filename in current_app.extensions.get('vendor_missing', ()):
+            return VENDOR_ASSETS[filename]['url']
+        return url_for('static', filename=filename)
+
+    # ==================== 第三方依赖 ====================
+
+    @staticmethod
+    def check_vendor(app):
+        """
+        启动检查：只对清单中的文件做 stat，返回缺失的路径 (frozenset)。
+        未启用本地资源时不检查；缺失时记录一条警告，提示执行 `flask fetch-assets`。
+        """
+        if not app.config.get('USE_LOCAL_RESOURCES'):
+            return frozenset()
+        missing = frozenset(rel for rel in VENDOR_ASSETS
+                            if not os.path.exists(_static_path(app.static_folder, rel)))
+        if missing:
+            app.logger.warning(
+                f"{len(missing)} vendor assets missing ({', '.join(sorted(missing))}), "
+                f"falling back to CDN. Run `flask fetch-assets` to bundle them.")
+        return missing
+
+    @staticmethod
+    def fetch_vendor(static_folder, force=False, timeout=30):
+        """
+        按 VENDOR_ASSETS 下载第三方资源并校验完整性，返回 [(路径, 状态, 摘要或错误信息)]。
+        状态: present (已存在且校验通过) | downloaded | failed。
+        已存在的文件校验不符时重新下载；下载内容校验不符、或清单未固定 integrity 时不落盘。
+        """
+        results = []
+        for rel_path, spec in VENDOR_ASSETS.items():
+            dest = _static_path(static_folder, rel_path)
+            expected = spec.get('integrity') or ''
+            if expected and os.path.exists(dest) and not force:
+                with open(dest, 'rb') as f:
+                    actual = _integrity(f.read())
+                if actual == expected:
+                    results.append((rel_path, 'present', actual))
+                    continue
+
+            try:
+                req = urllib.request.Request(spec['url'], headers={'User-Agent': 'Mozilla/5.0'})
+                with urllib.request.urlopen(req, timeout=timeout) as resp:
+                    data = resp.read()
+            except Exception as e:
+                results.append((rel_path, 'failed', str(e)))
+                continue
+
+            actual = _integrity(data)
+            if not expected:
+                results.append((rel_path, 'failed', f'integrity not pinned in VENDOR_ASSETS (downloaded {actual})'))
+                continue
+            if actual != expected:
+                results.append((rel_path, 'failed', f'integrity mismatch: expected {expected}, got {actual}'))
+                continue
+
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = dest + '.part'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, dest)
+            results.append((rel_path, 'downloaded', actual))
+        return results
@@ -6,9 +6,22 @@
 """
 
 from flask import current_app
+from limits import parse_many
 from models import SystemSetting
 
 
+def _validate_rate_limit(value):
+    """校验限流表达式 (如 '100 per hour;10 per minute')，非法时抛 ValueError"""
+    value = (value or '').strip()
+    if not value:
+        raise ValueError('限流配置不能为空')
+    try:
+        parse_many(value)
+    except ValueError:
+        raise ValueError(f'无效的限流配置: {value}')
+    return value
+
+
 class ConfigService:
     """
     配置服务类
@@ -128,8 +141,8 @@ class ConfigService:
 
     @staticmethod
     def set_upload_rate_limit(value):
-        """设置上传限流配置"""
-        SystemSetting.set_str('upload_rate_limit', value)
+        """设置上传限流配置 (下一个请求即生效，所有 worker 共享同一份计数)"""
+        SystemSetting.set_str('upload_rate_limit', _validate_rate_limit(value))
 
     @staticmethod
     def get_login_rate_limit():
@@ -141,8 +154,8 @@ class ConfigService:
 
     @staticmethod
     def set_login_rate_limit(value):
-        """设置登录限流配置"""
-        SystemSetting.set_str('login_rate_limit', value)
+        """设置登录限流配置 (下一个请求即生效，所有 worker 共享同一份计数)"""
+        SystemSetting.set_str('login_rate_limit', _validate_rate_limit(value))
 
     # ==================== 批量获取配置 ====================
 
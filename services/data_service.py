@@ -1,22 +1,35 @@
 import os
 import json
+import shutil
+import time
 import zipfile
 from werkzeug.utils import secure_filename
 from flask import current_app
 from extensions import db
-from models import Image, Tag, ReferenceImage
+from models import Image, ReferenceImage
 from services.media_service import infer_media_type
+from services.metrics_service import MetricsService
+from services.tag_service import TagService
+from utils import _resolve_upload_dir, _prepare_local_target, _web_path
 
 
 class DataService:
+    @staticmethod
+    def _extract_member(zf, member, upload_root):
+        """将 ZIP 成员解压到上传目录的分片路径，返回其 web 路径。"""
+        rel, abspath = _prepare_local_target(upload_root, secure_filename(os.path.basename(member)))
+        with zf.open(member) as src, open(abspath, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        return _web_path(current_app.config['UPLOAD_FOLDER'], rel)
+
     @staticmethod
     def import_zip_stream(zip_path):
         """流式处理 ZIP 导入，返回生成器"""
         yield "🚀 [System] 开始处理数据包...\n"
 
         stats = {'processed': 0, 'skipped': 0, 'errors': 0}
-        upload_root = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
-        if not os.path.exists(upload_root): os.makedirs(upload_root)
+        upload_root = _resolve_upload_dir(current_app.config['UPLOAD_FOLDER'])
+        started = time.perf_counter()
 
         try:
             with zipfile.ZipFile(zip_path, 'r') as zf:
@@ -45,20 +58,13 @@ class DataService:
                         if not zip_img or zip_img not in zf.namelist():
                             raise FileNotFoundError("主图缺失")
 
-                        safe_name = secure_filename(os.path.basename(zip_img))
-                        with zf.open(zip_img) as src, open(os.path.join(upload_root, safe_name), "wb") as dst:
-                            dst.write(src.read())
+                        local_file_path = DataService._extract_member(zf, zip_img, upload_root)
 
                         # 2. 提取缩略图 (可选)
-                        safe_thumb = None
+                        local_thumb_path = None
                         if item.get('zip_thumb_path') and item['zip_thumb_path'] in zf.namelist():
-                            safe_thumb = secure_filename(os.path.basename(item['zip_thumb_path']))
-                            with zf.open(item['zip_thumb_path']) as src, open(os.path.join(upload_root, safe_thumb),
-                                                                              "wb") as dst:
-                                dst.write(src.read())
+                            local_thumb_path = DataService._extract_member(zf, item['zip_thumb_path'], upload_root)
 
-                        web_folder = current_app.config['UPLOAD_FOLDER']
-                        local_file_path = f"/{web_folder}/{safe_name}"
                         img = Image(
                             title=item['title'],
                             author=item.get('author', ''),
@@ -67,7 +73,7 @@ class DataService:
                             type=item.get('type', 'txt2img'),
                             category=item.get('category', 'gallery'),  # 读取分类
                             file_path=local_file_path,
-                            thumbnail_path=f"/{web_folder}/{safe_thumb}" if safe_thumb else None,
+                            thumbnail_path=local_thumb_path,
                             media_type=item.get('media_type') or infer_media_type(local_file_path),
                             status='pending',  # 导入后默认为待审核，需管理员确认
                             heat_score=item.get('heat_score', 0)
@@ -75,21 +81,15 @@ class DataService:
                         # ---------------------------------
 
                         # 3. 处理标签
-                        for t in item.get('tags', []):
-                            tag = Tag.query.filter_by(name=t).first() or Tag(name=t)
-                            db.session.add(tag)
-                            img.tags.append(tag)
+                        img.tags.extend(TagService.resolve(item.get('tags', [])))
 
                         # 4. 处理参考图
                         for ref_path in item.get('refs', []):
                             # 兼容旧版本 JSON
                             if isinstance(ref_path, str):
                                 if ref_path in zf.namelist():
-                                    safe_ref = secure_filename(os.path.basename(ref_path))
-                                    with zf.open(ref_path) as src, open(os.path.join(upload_root, safe_ref),
-                                                                        "wb") as dst:
-                                        dst.write(src.read())
-                                    ref_obj = ReferenceImage(file_path=f"/{web_folder}/{safe_ref}")
+                                    ref_obj = ReferenceImage(
+                                        file_path=DataService._extract_member(zf, ref_path, upload_root))
                                     img.refs.append(ref_obj)
                             # 兼容新版本 JSON
                             elif isinstance(ref_path, dict):
@@ -98,11 +98,8 @@ class DataService:
                                     zip_ref_path = f"images/{fname}"
 
                                     if zip_ref_path in zf.namelist():
-                                        with zf.open(zip_ref_path) as src, open(os.path.join(upload_root, fname),
-                                                                                "wb") as dst:
-                                            dst.write(src.read())
                                         ref_obj = ReferenceImage(
-                                            file_path=f"/{web_folder}/{fname}",
+                                            file_path=DataService._extract_member(zf, zip_ref_path, upload_root),
                                             position=ref_path.get('position', 0)
                                         )
                                         img.refs.append(ref_obj)
@@ -121,6 +118,11 @@ class DataService:
             yield f"\n❌ ZIP 读取失败: {str(e)}\n"
         finally:
             # 清理临时上传文件
-            if os.path.exists(zip_path): os.remove(zip_path)
+            if os.path.exists(zip_path):
+                MetricsService.inc('transfer_bytes_total', os.path.getsize(zip_path), direction='import')
+                os.remove(zip_path)
+            MetricsService.observe('transfer_duration_seconds', time.perf_counter() - started, direction='import')
+            for result, count in stats.items():
+                MetricsService.inc('transfer_items_total', count, direction='import', result=result)
 
         yield f"\n🎉 完成：成功 {stats['processed']}，跳过 {stats['skipped']}，错误 {stats['errors']}"
\ No newline at end of file
@@ -0,0 +1,348 @@
+"""
+数据库引擎调优
+
+- SQLite：每个新连接执行 PRAGMA (WAL、synchronous、busy_timeout、mmap、cache)，
+  WAL 下读不阻塞写、写不阻塞读，浏览计数等频繁小写入不再让画廊查询排队
+- MySQL / PostgreSQL：连接池大小、溢出、取用前探活 (pre_ping) 与定期回收 (recycle)，
+  避免空闲连接被服务端超时断开后请求报错
+- 语句统计：每个请求的 SQL 条数与耗时 (g.sql_stats)，超过 SQL_SLOW_QUERY_MS 的语句记慢查询日志，
+  同一请求内同一形状的语句重复 SQL_N_PLUS_ONE_THRESHOLD 次以上记为疑似 N+1
+- 只读副本 (DB_REPLICA_URI)：标记了 use_read_replica 的公开 GET 视图把查询路由到副本引擎；
+  写入、管理员请求以及刚写入过的客户端 (短时粘滞 Cookie) 仍走主库，保证读到自己的写入
+
+参数均来自配置 (SQLITE_* / DB_POOL_* / SQL_* / DB_REPLICA_*)，`flask bench-db` 可对比各项 SQLite 设置的效果。
+"""
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+from flask_sqlalchemy.session import Session as BaseSession
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.selectable import CompoundSelect, Select
+
+# (配置项, PRAGMA 名称, 未配置时的默认值)，按执行顺序；整数型 PRAGMA 的值按 int 下发
+SQLITE_PRAGMA_KEYS = (
+    ('SQLITE_JOURNAL_MODE', 'journal_mode', 'WAL'),
+    ('SQLITE_SYNCHRONOUS', 'synchronous', 'NORMAL'),
+    ('SQLITE_BUSY_TIMEOUT_MS', 'busy_timeout', 5000),
+    ('SQLITE_MMAP_SIZE', 'mmap_size', 268435456),
+    ('SQLITE_CACHE_SIZE', 'cache_size', -65536),
+)
+
+# 只读副本在 SQLALCHEMY_BINDS 中的键
+REPLICA_BIND = 'replica'
+# 写入后的粘滞 Cookie：有效期内该客户端的读请求也走主库
+PRIMARY_STICKY_COOKIE = 'db_primary'
+# 单条 IN 语句的 id 数上限，避开 SQLite 绑定参数数量限制
+IN_CHUNK_SIZE = 500
+
+
+def chunked(items, size=IN_CHUNK_SIZE):
+    """按 size 切分序列，用于拼接 IN (...) 条件"""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def is_sqlite(uri):
+    return make_url(str(uri)).get_backend_name() == 'sqlite'
+
+
+def _on_connect(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+# 语句形状：各驱动的占位符统一为 ?，展开的 IN (?, ?, ...) 折叠为 (?)
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\?')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def statement_shape(statement):
+    shape = _PLACEHOLDER.sub('?', ' '.join(statement.split()))
+    return _PLACEHOLDER_LIST.sub('(?)', shape)
+
+
+class QueryStats:
+    """单个请求的语句统计；statements 按原始语句计数，请求结束时才归并形状"""
+    __slots__ = ('count', 'seconds', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def repeated_shapes(self, threshold):
+        """[(形状, 次数)]：同一形状执行不少于 threshold 次，按次数降序"""
+        shapes = Counter()
+        for statement, n in self.statements.items():
+            shapes[statement_shape(statement)] += n
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _on_cursor_executed(app):
+    slow_seconds = app.config.get('SQL_SLOW_QUERY_MS', 0) / 1000
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_query_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        in_request = has_request_context()
+        if in_request:
+            stats = g.get('sql_stats')
+            if stats is None:
+                stats = g.sql_stats = QueryStats()
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.statements[statement] += 1
+        if slow_seconds and elapsed >= slow_seconds:
+            endpoint = (request.endpoint or request.path) if in_request else '-'
+            app.logger.warning(f"Slow query {elapsed * 1000:.1f}ms [{endpoint}]: {' '.join(statement.split())[:500]}")
+    return after_cursor_execute
+
+
+def _report_n_plus_one(exc=None):
+    """请求结束 (teardown，含流式响应) 时检查重复的语句形状"""
+    stats = g.get('sql_stats')
+    threshold = current_app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 0)
+    if stats is None or not threshold:
+        return
+    for shape, n in stats.repeated_shapes(threshold):
+        current_app.logger.warning(
+            f"Probable N+1 in {request.endpoint or request.path}: {n} x {shape[:300]} "
+            f"({stats.count} statements, {stats.seconds * 1000:.1f}ms in request)")
+
+
+def _bench_profiles(pragmas):
+    """基准 (驱动默认)、逐项单独开启、全部开启"""
+    profiles = [('driver defaults', [])]
+    profiles.extend((f'{name}={value}', [(name, value)]) for name, value in pragmas)
+    if len(pragmas) > 1:
+        profiles.append(('all configured', list(pragmas)))
+    return profiles
+
+
+def _bench_one(path, pragmas, rows, readers, duration):
+    engine = create_engine(f'sqlite:///{path}')
+    DatabaseService.install_sqlite_pragmas(engine, pragmas)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE item (id INTEGER PRIMARY KEY, title TEXT, views INTEGER, created REAL)'))
+        conn.execute(text('CREATE INDEX ix_item_created ON item (created)'))
+        conn.execute(text('INSERT INTO item (title, views, created) VALUES (:t, 0, :c)'),
+                     [{'t': f'item {i}', 'c': float(i)} for i in range(rows)])
+
+    stop = time.perf_counter() + duration
+    counts = {'writes': 0, 'reads': 0, 'errors': 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def writer():
+        # 模拟浏览/复制计数：单行 UPDATE 后立即提交
+        i = 0
+        while time.perf_counter() < stop:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text('UPDATE item SET views = views + 1 WHERE id = :id'), {'id': i % rows + 1})
+                with lock:
+                    counts['writes'] += 1
+            except Exception:
+                with lock:
+                    counts['errors'] += 1
+            i += 1
+
+    def reader():
+        # 模拟画廊首页：按时间倒序取一页 + 计数
+        local = []
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT id, title, views FROM item ORDER BY created DESC LIMIT 24')).all()
+                    conn.execute(text('SELECT COUNT(*) FROM item')).scalar()
+                local.append(time.perf_counter() - start)
+            except Exception:
+                with lock:
+                    counts['errors'] += 1
+        with lock:
+            counts['reads'] += len(local)
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    latencies.sort()
+    return {
+        'writes_per_s': counts['writes'] / duration,
+        'reads_per_s': counts['reads'] / duration,
+        'read_p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else None,
+        'read_median_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'errors': counts['errors'],
+    }
+
+
+class RoutingSession(BaseSession):
+    """
+    按请求选择引擎的 Session：请求被标记为可读副本 (g.db_replica) 时，默认库上的 SELECT 走副本；
+    flush 及其他语句 (INSERT/UPDATE/DELETE、text() 原生 SQL 等无法确认只读的) 一律走主库，
+    并记下本请求已写入，之后的读取也回到主库。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                if self._flushing or not isinstance(clause, (Select, CompoundSelect)):
+                    g.db_wrote = True
+                elif g.get('db_replica') and not g.get('db_wrote'):
+                    bind_key = getattr(getattr(mapper, 'metadata', None), 'info', {}).get('bind_key')
+                    if bind_key is None:
+                        return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_read_replica(view):
+    """
+    视图装饰器：允许本请求的只读查询使用副本。
+    非 GET/HEAD、已登录管理员、刚写入过 (粘滞 Cookie) 的客户端仍使用主库。
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if (request.method in ('GET', 'HEAD')
+                and not request.cookies.get(PRIMARY_STICKY_COOKIE)
+                and not current_user.is_authenticated):
+            g.db_replica = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def replica_lag_ok(view):
+    """视图装饰器：本请求的写入不需要读到自己 (如浏览/复制计数)，不下发粘滞 Cookie"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.db_sticky_exempt = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def _mark_primary_sticky(response):
+    """本请求有写入时下发粘滞 Cookie，副本追上之前该客户端的读请求走主库"""
+    if g.get('db_wrote') and not g.get('db_sticky_exempt'):
+        response.set_cookie(PRIMARY_STICKY_COOKIE, '1', httponly=True, samesite='Lax',
+                            max_age=current_app.config.get('DB_REPLICA_STICKY_SECONDS', 10))
+    return response
+
+
+class DatabaseService:
+    @staticmethod
+    def sqlite_pragmas(config):
+        """按配置生成 [(pragma, 值)]：未配置的项取调优默认值，值为空/0 的项保持 SQLite 默认"""
+        pragmas = []
+        for key, name, default in SQLITE_PRAGMA_KEYS:
+            value = config.get(key)
+            if value is None:
+                value = default
+            if isinstance(value, str):
+                value = value.strip()
+            if value == '':
+                continue
+            if isinstance(default, int):
+                value = int(value)
+                if not value:
+                    continue
+            pragmas.append((name, value))
+        return pragmas
+
+    @staticmethod
+    def pool_options(config, uri):
+        """服务端数据库 (MySQL/PostgreSQL) 的连接池参数；SQLite 使用驱动默认池，返回空表"""
+        if not uri or is_sqlite(uri):
+            return {}
+        return {
+            'pool_size': config.get('DB_POOL_SIZE', 10),
+            'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+            'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+            'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        }
+
+    @staticmethod
+    def apply_engine_options(app):
+        """
+        db.init_app 之前调用：把连接池参数并入 SQLALCHEMY_ENGINE_OPTIONS (显式配置优先)；
+        配置了 DB_REPLICA_URI 时注册副本 bind 并启用写入后的粘滞 Cookie。
+        """
+        options = DatabaseService.pool_options(app.config, app.config.get('SQLALCHEMY_DATABASE_URI'))
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+        replica_uri = app.config.get('DB_REPLICA_URI')
+        if replica_uri:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds[REPLICA_BIND] = {'url': replica_uri, **DatabaseService.pool_options(app.config, replica_uri)}
+            app.config['SQLALCHEMY_BINDS'] = binds
+            app.after_request(_mark_primary_sticky)
+
+    @staticmethod
+    def install_sqlite_pragmas(engine, pragmas):
+        """为 SQLite 引擎注册连接钩子，返回是否注册"""
+        if engine.dialect.name != 'sqlite' or not pragmas:
+            return False
+        event.listen(engine, 'connect', _on_connect(list(pragmas)))
+        return True
+
+    @staticmethod
+    def install_query_hooks(app, engine):
+        """为引擎注册语句计时钩子：每请求统计、慢查询日志"""
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _on_cursor_executed(app))
+
+    @staticmethod
+    def configure_engines(app, db):
+        """
+        db.init_app 之后调用：为应用的所有引擎 (含 binds) 安装语句统计钩子，SQLite 引擎另装 PRAGMA 钩子；
+        请求结束时检查疑似 N+1
+        """
+        # 副本只是主库的镜像，不登记元数据，create_all / drop_all 不会触碰它
+        db.metadatas.pop(REPLICA_BIND, None)
+        pragmas = DatabaseService.sqlite_pragmas(app.config)
+        with app.app_context():
+            for engine in db.engines.values():
+                DatabaseService.install_sqlite_pragmas(engine, pragmas)
+                DatabaseService.install_query_hooks(app, engine)
+        app.teardown_request(_report_n_plus_one)
+
+    @staticmethod
+    def benchmark_sqlite(pragmas, rows=2000, readers=4, duration=2.0):
+        """
+        在临时数据库上对比各 PRAGMA 的效果：1 个线程持续做单行计数更新并提交，
+        readers 个线程并发查询首页。每个配置使用全新的数据库文件，返回 [(配置名, 结果)]。
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, (label, profile) in enumerate(_bench_profiles(pragmas)):
+                path = os.path.join(tmp, f'bench_{i}.sqlite')
+                results.append((label, _bench_one(path, profile, rows, readers, duration)))
+        return results
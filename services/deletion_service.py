@@ -0,0 +1,136 @@
+"""
+文件删除队列
+
+删除作品/替换主图/移除参考图时，不再在请求内逐个删除文件，而是把路径写入
+PendingDeletion 表 (与业务事务一起提交，保证不丢)，由进程内后台线程批量清理：
+云端对象用 delete_objects 每批最多 1000 个，失败按指数退避重试。
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from extensions import db
+from models import PendingDeletion
+from utils import remove_physical_files, S3_DELETE_BATCH_SIZE
+
+# 后台线程状态 (按进程隔离，fork 后重建)
+_worker_lock = threading.Lock()
+_worker_state = {'thread': None, 'pid': None}
+_wakeup = threading.Event()
+
+
+class DeletionService:
+    @staticmethod
+    def enqueue(paths):
+        """登记待删除文件。只加入当前会话，由调用方的 commit 一并持久化。"""
+        count = 0
+        for path in dict.fromkeys(p for p in paths if p):
+            db.session.add(PendingDeletion(path=path))
+            count += 1
+        return count
+
+    @staticmethod
+    def drain(limit=S3_DELETE_BATCH_SIZE):
+        """处理一批到期的待删除记录，返回本批处理的条数。"""
+        now = datetime.now()
+        max_attempts = current_app.config.get('DELETION_MAX_ATTEMPTS', 8)
+        rows = PendingDeletion.query.filter(
+            PendingDeletion.attempts < max_attempts,
+            PendingDeletion.next_attempt_at <= now,
+        ).order_by(PendingDeletion.id).limit(limit).all()
+        if not rows:
+            return 0
+
+        failed = remove_physical_files([r.path for r in rows])
+
+        done_ids = [r.id for r in rows if r.path not in failed]
+        if done_ids:
+            # 多进程可能同时消费同一批记录，使用批量 DELETE 避免 ORM 行数校验报错
+            PendingDeletion.query.filter(PendingDeletion.id.in_(done_ids)).delete(synchronize_session=False)
+
+        base_delay = current_app.config.get('DELETION_RETRY_DELAY', 30)
+        for r in rows:
+            if r.path not in failed:
+                continue
+            attempts = (r.attempts or 0) + 1
+            delay = min(base_delay * (2 ** (attempts - 1)), 6 * 3600)
+            PendingDeletion.query.filter_by(id=r.id).update({
+                'attempts': attempts,
+                'last_error': (failed[r.path] or '')[:255],
+                'next_attempt_at': now + timedelta(seconds=delay),
+            }, synchronize_session=False)
+            current_app.logger.warning(f"Deletion failed ({r.path}), attempt {attempts}: {failed[r.path]}")
+
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def drain_all():
+        """循环处理直至队列中没有到期记录，返回处理总数。"""
+        total = 0
+        while True:
+            processed = DeletionService.drain()
+            total += processed
+            if processed < S3_DELETE_BATCH_SIZE:
+                return total
+
+    @staticmethod
+    def stats():
+        """队列积压情况，供后台展示。"""
+        max_attempts = current_app.config.get('DELETION_MAX_ATTEMPTS', 8)
+        return {
+            'pending': PendingDeletion.query.filter(PendingDeletion.attempts < max_attempts).count(),
+            'dead': PendingDeletion.query.filter(PendingDeletion.attempts >= max_attempts).count(),
+        }
+
+    @staticmethod
+    def wake():
+        """事务提交后调用：唤醒 (必要时启动) 本进程的后台清理线程。"""
+        app = current_app._get_current_object()
+        if not app.config.get('DELETION_WORKER_ENABLED', True):
+            return
+        _ensure_worker(app)
+        _wakeup.set()
+
+
+def _ensure_worker(app):
+    pid = os.getpid()
+    thread = _worker_state['thread']
+    if thread is not None and thread.is_alive() and _worker_state['pid'] == pid:
+        return
+    with _worker_lock:
+        thread = _worker_state['thread']
+        if thread is not None and thread.is_alive() and _worker_state['pid'] == pid:
+            return
+        thread = threading.Thread(target=_worker_loop, args=(app,), name='deletion-queue', daemon=True)
+        _worker_state.update(thread=thread, pid=pid)
+        thread.start()
+
+
+def _worker_loop(app):
+    interval = app.config.get('DELETION_QUEUE_INTERVAL', 60)
+    while True:
+        # 被 wake() 唤醒立即处理，否则按间隔轮询以重试失败记录
+        _wakeup.wait(interval)
+        _wakeup.clear()
+        with app.app_context():
+            try:
+                DeletionService.drain_all()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Deletion queue error: {e}")
+            finally:
+                db.session.remove()
+
+
+def reset_deletion_worker():
+    """丢弃本进程的后台线程状态 (fork 后子进程调用)，下次 wake() 时重新启动线程"""
+    global _worker_lock, _wakeup
+    _worker_lock = threading.Lock()
+    _wakeup = threading.Event()
+    _worker_state.update(thread=None, pid=None)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_deletion_worker)
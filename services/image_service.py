@@ -1,24 +1,37 @@
+import base64
 import json
+from datetime import datetime
 from flask import current_app
-from sqlalchemy.orm import selectinload
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload, defer, load_only
 from sqlalchemy.sql.expression import func
 from extensions import db
 from models import Image, Tag, ReferenceImage
 from utils import process_image, remove_physical_file
+from services.database_service import chunked
 from services.media_service import save_media
+from services.deletion_service import DeletionService
+from services.tag_service import TagService
 
 
 class ImageService:
     @staticmethod
-    def build_query(category_filter=None, search_query='', tag_filter='', sort_by='date', show_sensitive=True):
+    def build_query(category_filter=None, search_query='', tag_filter='', sort_by='date', show_sensitive=True,
+                    for_cards=False, fields=None):
         """构建画廊/模板/API 共用的已审核作品查询。
 
         预加载 tags 与 refs 以消除 to_dict()/模板遍历产生的 N+1 查询。
+        for_cards=True 时仅用于渲染画廊卡片：不加载参考图，延迟加载 prompt/description 大字段
+        (详情由 /api/image/<id> 按需获取)。
+        fields 为 API 稀疏字段集：只加载所需列，未请求 tags/refs 时不做对应预加载。
         """
-        query = Image.query.options(
-            selectinload(Image.tags),
-            selectinload(Image.refs),
-        ).filter_by(status='approved')
+        if for_cards:
+            options = (selectinload(Image.tags), defer(Image.prompt), defer(Image.description))
+        elif fields is not None:
+            options = ImageService._field_options(fields)
+        else:
+            options = (selectinload(Image.tags), selectinload(Image.refs))
+        query = Image.query.options(*options).filter_by(status='approved')
 
         if category_filter:
             query = query.filter_by(category=category_filter)
@@ -27,7 +40,10 @@ class ImageService:
             query = query.filter(~Image.tags.any(Tag.is_sensitive == True))
 
         if tag_filter:
-            query = query.filter(Image.tags.any(name=tag_filter))
+            # 多标签表达式：`a,b` 交集、`a|b` 并集、`-a` 排除
+            clause = TagService.filter_clause(tag_filter)
+            if clause is not None:
+                query = query.filter(clause)
 
         if search_query:
             query = query.filter(
@@ -36,15 +52,171 @@ class ImageService:
                 Image.author.contains(search_query)
             )
 
+        # id 作为最终排序键，保证顺序稳定，供游标分页使用
         if sort_by == 'hot':
-            query = query.order_by(Image.heat_score.desc(), Image.created_at.desc())
+            query = query.order_by(Image.heat_score.desc(), Image.created_at.desc(), Image.id.desc())
         elif sort_by == 'random':
             query = query.order_by(func.random())
         else:
-            query = query.order_by(Image.created_at.desc())
+            query = query.order_by(Image.created_at.desc(), Image.id.desc())
+
+        return query
+
+    @staticmethod
+    def parse_fields(raw):
+        """
+        解析 fields=id,title,... 参数。
+        返回 None (未指定，输出全部字段) 或字段 frozenset (id 始终包含)；含未知字段时抛 ValueError。
+        """
+        if not raw:
+            return None
+        fields = {f.strip() for f in raw.split(',') if f.strip()}
+        unknown = fields.difference(Image.API_FIELDS)
+        if unknown:
+            raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+        return frozenset(fields | {'id'})
+
+    @staticmethod
+    def _field_options(fields):
+        """稀疏字段集对应的加载选项：load_only 所需列 + 按需预加载关联"""
+        columns = {'id', 'row_version'}
+        for name in fields:
+            columns.update(Image.FIELD_COLUMNS.get(name, (name,)))
+        options = [load_only(*(getattr(Image, c) for c in sorted(columns)))]
+        if 'tags' in fields:
+            options.append(selectinload(Image.tags))
+        if 'refs' in fields:
+            options.append(selectinload(Image.refs))
+        return options
+
+    # ==================== 游标分页 (无限滚动) ====================
+
+    @staticmethod
+    def encode_cursor(image, sort_by='date', page=None):
+        """
+        为结果集中的最后一条记录生成不透明游标。
+        date/hot 排序使用键集游标 (不受新增数据影响、无 OFFSET 扫描)；
+        random 排序无法键集定位，退化为页码游标。
+        """
+        if sort_by == 'random':
+            payload = ['p', page or 1]
+        elif sort_by == 'hot':
+            payload = ['h', image.heat_score or 0, image.created_at.isoformat(), image.id]
+        else:
+            payload = ['d', image.created_at.isoformat(), image.id]
+        raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """解析游标，非法时返回 None。"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            kind = payload[0]
+            if kind == 'p':
+                return kind, (int(payload[1]),)
+            if kind == 'h':
+                return kind, (int(payload[1]), datetime.fromisoformat(payload[2]), int(payload[3]))
+            if kind == 'd':
+                return kind, (datetime.fromisoformat(payload[1]), int(payload[2]))
+        except (ValueError, TypeError, IndexError, json.JSONDecodeError):
+            pass
+        return None
+
+    @staticmethod
+    def fetch_after_cursor(query, sort_by, cursor, limit):
+        """
+        取游标之后的一批记录，返回 (items, next_cursor|None)。
+        多取一条判断是否还有下一页，不执行 COUNT。
+        """
+        decoded = ImageService.decode_cursor(cursor) if cursor else None
+        page = 1
+        if decoded:
+            kind, values = decoded
+            if kind == 'p':
+                page = values[0] + 1
+            elif kind == 'h' and sort_by == 'hot':
+                heat, created, last_id = values
+                query = query.filter(or_(
+                    Image.heat_score < heat,
+                    and_(Image.heat_score == heat, or_(
+                        Image.created_at < created,
+                        and_(Image.created_at == created, Image.id < last_id),
+                    )),
+                ))
+            elif kind == 'd' and sort_by not in ('hot', 'random'):
+                created, last_id = values
+                query = query.filter(or_(
+                    Image.created_at < created,
+                    and_(Image.created_at == created, Image.id < last_id),
+                ))
+
+        if sort_by == 'random':
+            query = query.offset((page - 1) * limit)
+        items = query.limit(limit + 1).all()
+        has_more = len(items) > limit
+        items = items[:limit]
+        next_cursor = ImageService.encode_cursor(items[-1], sort_by, page) if has_more and items else None
+        return items, next_cursor
+
+    @staticmethod
+    def bump_row_versions(image_ids):
+        """绕过 ORM 批量改写作品相关数据后调用：递增 row_version，使序列化缓存失效"""
+        for chunk in chunked(image_ids):
+            Image.query.filter(Image.id.in_(chunk)) \
+                .update({Image.row_version: Image.row_version + 1}, synchronize_session=False)
+
+    # ==================== 后台审核队列 ====================
+
+    # 审核卡片渲染用到的列 (不含标签/参考图)
+    PENDING_CARD_COLUMNS = ('id', 'title', 'author', 'prompt', 'file_path', 'thumbnail_path',
+                            'media_type', 'type', 'category', 'created_at')
 
+    @staticmethod
+    def pending_query(category=None, media_type=None):
+        """待审核作品查询 (先到先审)，支持分类与媒体类型筛选"""
+        query = Image.query.filter_by(status='pending')
+        if category:
+            query = query.filter_by(category=category)
+        if media_type:
+            query = query.filter_by(media_type=media_type)
         return query
 
+    @staticmethod
+    def get_pending_page(category=None, media_type=None, after=None, limit=12):
+        """
+        键集分页获取一页待审核作品，返回 (items, next_cursor|None)。
+        按 (created_at, id) 升序，after 为上一页末条的游标；只加载卡片需要的列。
+        """
+        columns = [getattr(Image, c) for c in ImageService.PENDING_CARD_COLUMNS]
+        query = ImageService.pending_query(category, media_type).options(load_only(*columns))
+
+        decoded = ImageService.decode_cursor(after) if after else None
+        if decoded and decoded[0] == 'd':
+            created, last_id = decoded[1]
+            query = query.filter(or_(
+                Image.created_at > created,
+                and_(Image.created_at == created, Image.id > last_id),
+            ))
+
+        items = query.order_by(Image.created_at.asc(), Image.id.asc()).limit(limit + 1).all()
+        has_more = len(items) > limit
+        items = items[:limit]
+        next_cursor = ImageService.encode_cursor(items[-1]) if has_more else None
+        return items, next_cursor
+
+    @staticmethod
+    def get_public_image(image_id, show_sensitive=True):
+        """获取单个已审核作品 (含 tags/refs)，不可见时返回 None。"""
+        query = Image.query.options(
+            selectinload(Image.tags),
+            selectinload(Image.refs),
+        ).filter_by(id=image_id, status='approved')
+        if not show_sensitive:
+            query = query.filter(~Image.tags.any(Tag.is_sensitive == True))
+        return query.first()
+
     @staticmethod
     def create_image(file, data, ref_files=None, poster_file=None):
         """创建新作品记录"""
@@ -114,11 +286,12 @@ class ImageService:
             image.thumbnail_path = thumb_path
             image.media_type = media_type
 
-            for p in old_files:
-                remove_physical_file(p)
+            DeletionService.enqueue(old_files)
 
-        # 更新标签
+        # 更新标签 (被移除的旧标签若已无作品关联，随本次提交一并清理)
+        old_tag_ids = []
         if 'tags' in data:
+            old_tag_ids = [t.id for t in image.tags]
             image.tags = []
             ImageService._apply_tags(image, data['tags'])
 
@@ -128,8 +301,7 @@ class ImageService:
                 if not ref_id: continue
                 ref = db.session.get(ReferenceImage, int(ref_id))
                 if ref and ref.image_id == image.id:
-                    if ref.file_path:
-                        remove_physical_file(ref.file_path)
+                    DeletionService.enqueue([ref.file_path])
                     db.session.delete(ref)
             db.session.flush()
 
@@ -142,7 +314,9 @@ class ImageService:
             if new_ref_files:
                 ImageService._process_refs(image, new_ref_files, start_pos=max_pos + 1)
 
+        TagService.delete_orphans(old_tag_ids)
         db.session.commit()
+        DeletionService.wake()
         return image
 
     @staticmethod
@@ -156,27 +330,20 @@ class ImageService:
             if r.file_path:
                 files_to_remove.append(r.file_path)
 
-        tags = list(image.tags)
+        tag_ids = [t.id for t in image.tags]
 
+        # 文件删除登记入队，与记录删除、僵尸标签清理同一事务提交；实际清理由后台线程批量完成
         db.session.delete(image)
+        DeletionService.enqueue(files_to_remove)
+        TagService.delete_orphans(tag_ids)
         db.session.commit()
-
-        for p in files_to_remove:
-            remove_physical_file(p)
-
-        ImageService._clean_orphaned_tags(tags)
+        DeletionService.wake()
         return True
 
     @staticmethod
     def _apply_tags(image, tags_str):
         if not tags_str: return
-        tag_names = set(t.strip() for t in tags_str.replace('，', ',').split(',') if t.strip())
-        for name in tag_names:
-            tag = Tag.query.filter_by(name=name).first()
-            if not tag:
-                tag = Tag(name=name)
-                db.session.add(tag)
-            image.tags.append(tag)
+        image.tags.extend(TagService.resolve(tags_str))
 
     @staticmethod
     def _process_refs(image, files, start_pos=0):
@@ -222,15 +389,3 @@ class ImageService:
                         ref.position = index
         except Exception as e:
             current_app.logger.error(f"Layout parse error: {e}")
-
-    @staticmethod
-    def _clean_orphaned_tags(tags):
-        if not tags: return
-        for tag in tags:
-            try:
-                t = db.session.get(Tag, tag.id)
-                if t and not t.images:
-                    db.session.delete(t)
-            except:
-                pass
-        db.session.commit()
\ No newline at end of file
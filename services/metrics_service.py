@@ -0,0 +1,278 @@
+"""
+运行时指标 (Prometheus 文本格式，GET /metrics)
+
+记录只在进程内累加 (一次加锁的字典更新)，每隔 METRICS_FLUSH_INTERVAL 秒由请求结束时
+把增量合并进共享的 SQLite 文件 (METRICS_DB_PATH)；/metrics 读取该文件，因此多个 worker
+(及被 max_requests 回收的旧 worker) 的计数自动汇总。指标均为可累加的计数器与直方图。
+
+- http_request_duration_seconds：按端点/方法的请求耗时
+- db_queries_per_request / db_query_seconds_per_request：每个请求的 SQL 条数与耗时
+- media_processing_seconds：process_image / save_video 按媒体类型的处理耗时
+- s3_request_duration_seconds / s3_errors_total：按操作的 S3 调用耗时与失败数
+- cache_lookups_total：作品 JSON 缓存的命中/未命中
+- transfer_items_total / transfer_bytes_total / transfer_duration_seconds：导入导出吞吐
+"""
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+
+NAMESPACE = 'prompt_manager'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# 名称 -> (类型, 说明, 直方图分桶)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint', LATENCY_BUCKETS),
+    'db_queries_per_request': ('histogram', 'SQL statements executed per request', QUERY_COUNT_BUCKETS),
+    'db_query_seconds_per_request': ('histogram', 'Time spent in SQL per request', LATENCY_BUCKETS),
+    'media_processing_seconds': ('histogram', 'process_image / save_video duration by media type', SLOW_BUCKETS),
+    's3_request_duration_seconds': ('histogram', 'S3 API call latency by operation', LATENCY_BUCKETS),
+    's3_errors_total': ('counter', 'Failed S3 API calls by operation', None),
+    'cache_lookups_total': ('counter', 'In-process cache lookups by cache and result', None),
+    'transfer_items_total': ('counter', 'Items processed by ZIP import/export', None),
+    'transfer_bytes_total': ('counter', 'Bytes read by import / written by export', None),
+    'transfer_duration_seconds': ('histogram', 'ZIP import/export duration', SLOW_BUCKETS),
+}
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS sample ('
+    ' name TEXT NOT NULL, labels TEXT NOT NULL, le TEXT NOT NULL, value REAL NOT NULL,'
+    ' PRIMARY KEY (name, labels, le))'
+)
+_UPSERT = (
+    'INSERT INTO sample (name, labels, le, value) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value'
+)
+
+
+def _label_str(labels):
+    def esc(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{k}="{esc(v)}"' for k, v in sorted(labels.items()))
+
+
+def _fmt(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Registry:
+    """单个应用的进程内待写增量；键为 (样本名, 标签串, le)"""
+
+    def __init__(self, path, flush_interval):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    def add(self, key, amount):
+        with self.lock:
+            self.pending[key] = self.pending.get(key, 0) + amount
+
+    def reset(self):
+        """fork 后丢弃继承自父进程的增量与锁"""
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(_SCHEMA)
+        return conn
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    conn.executemany(_UPSERT, [(n, lbl, le, v) for (n, lbl, le), v in pending.items()])
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # 写入失败 (如锁超时)：增量放回，下次再合并
+            with self.lock:
+                for key, value in pending.items():
+                    self.pending[key] = self.pending.get(key, 0) + value
+
+    def rows(self):
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT name, labels, le, value FROM sample ORDER BY name, labels').fetchall()
+        finally:
+            conn.close()
+
+
+def _registry():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('metrics')
+
+
+def _on_s3_before_call(model, context, **kwargs):
+    context['metrics_start'] = time.perf_counter()
+    context['metrics_operation'] = model.name
+
+
+def _on_s3_after_call(http_response, model, context, **kwargs):
+    start = context.pop('metrics_start', None)
+    if start is None:
+        return
+    MetricsService.observe('s3_request_duration_seconds', time.perf_counter() - start, operation=model.name)
+    if http_response.status_code >= 400:
+        MetricsService.inc('s3_errors_total', operation=model.name)
+
+
+def _on_s3_call_error(context, **kwargs):
+    # 连接失败/超时等未拿到响应的错误
+    start = context.pop('metrics_start', None)
+    operation = context.get('metrics_operation', 'unknown')
+    if start is not None:
+        MetricsService.observe('s3_request_duration_seconds', time.perf_counter() - start, operation=operation)
+    MetricsService.inc('s3_errors_total', operation=operation)
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(exc=None):
+    # teardown 阶段记录：流式响应 (如 ZIP 导入) 在生成器结束后才到这里，耗时与 SQL 统计完整
+    start = g.pop('metrics_start', None)
+    registry = current_app.extensions.get('metrics')
+    if start is None or registry is None:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    MetricsService.observe('http_request_duration_seconds', time.perf_counter() - start,
+                           endpoint=endpoint, method=request.method)
+    sql = g.get('sql_stats')
+    MetricsService.observe('db_queries_per_request', sql.count if sql else 0, endpoint=endpoint)
+    MetricsService.observe('db_query_seconds_per_request', sql.seconds if sql else 0.0, endpoint=endpoint)
+    if time.monotonic() - registry.last_flush >= registry.flush_interval:
+        registry.flush()
+
+
+class MetricsService:
+    @staticmethod
+    def init_app(app):
+        """
+        注册请求计时钩子 (METRICS_ENABLED=False 时不做任何事)；
+        每请求的 SQL 条数与耗时取自 DatabaseService 的语句钩子 (g.sql_stats)
+        """
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        path = app.config.get('METRICS_DB_PATH') or os.path.join(app.instance_path, 'metrics.db')
+        app.extensions['metrics'] = _Registry(path, app.config.get('METRICS_FLUSH_INTERVAL', 5))
+        app.before_request(_start_timer)
+        app.teardown_request(_record_request)
+
+    @staticmethod
+    def instrument_s3_client(client):
+        """为 S3 客户端注册 botocore 事件，记录每次 API 调用的耗时与失败"""
+        client.meta.events.register('before-call.s3', _on_s3_before_call)
+        client.meta.events.register('after-call.s3', _on_s3_after_call)
+        client.meta.events.register('after-call-error.s3', _on_s3_call_error)
+
+    @staticmethod
+    def inc(name, amount=1, **labels):
+        registry = _registry()
+        if registry is not None:
+            registry.add((name, _label_str(labels), ''), amount)
+
+    @staticmethod
+    def observe(name, value, **labels):
+        registry = _registry()
+        if registry is None:
+            return
+        buckets = METRICS[name][2]
+        label_str = _label_str(labels)
+        index = bisect_left(buckets, value)
+        with registry.lock:
+            pending = registry.pending
+            if index < len(buckets):
+                key = (f'{name}_bucket', label_str, _fmt(buckets[index]))
+                pending[key] = pending.get(key, 0) + 1
+            for key, amount in (((f'{name}_sum', label_str, ''), value), ((f'{name}_count', label_str, ''), 1)):
+                pending[key] = pending.get(key, 0) + amount
+
+    @staticmethod
+    @contextmanager
+    def timer(name, **labels):
+        """计时代码块并记入直方图 (异常时同样记录)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            MetricsService.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def timed(name, **labels):
+        """装饰器形式的 timer"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with MetricsService.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def flush():
+        registry = _registry()
+        if registry is not None:
+            registry.flush()
+
+    @staticmethod
+    def reset_process_state(app):
+        """fork 后在子进程调用"""
+        registry = app.extensions.get('metrics')
+        if registry is not None:
+            registry.reset()
+
+    @staticmethod
+    def render():
+        """汇总所有进程已写入的样本 (先写入本进程的增量)，返回 Prometheus 文本格式"""
+        registry = _registry()
+        if registry is None:
+            return ''
+        registry.flush()
+        samples = {}
+        for name, labels, le, value in registry.rows():
+            samples.setdefault(name, {}).setdefault(labels, {})[le] = value
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            full = f'{NAMESPACE}_{name}'
+            lines.append(f'# HELP {full} {help_text}')
+            lines.append(f'# TYPE {full} {kind}')
+            if kind == 'counter':
+                for labels, values in samples.get(name, {}).items():
+                    lines.append(f'{full}{{{labels}}} {_fmt(values[""])}' if labels else f'{full} {_fmt(values[""])}')
+                continue
+            bucket_rows = samples.get(f'{name}_bucket', {})
+            sums = samples.get(f'{name}_sum', {})
+            for labels, count in samples.get(f'{name}_count', {}).items():
+                prefix = f'{labels},' if labels else ''
+                cumulative = 0
+                for bound in buckets:
+                    cumulative += bucket_rows.get(labels, {}).get(_fmt(bound), 0)
+                    lines.append(f'{full}_bucket{{{prefix}le="{_fmt(bound)}"}} {_fmt(cumulative)}')
+                lines.append(f'{full}_bucket{{{prefix}le="+Inf"}} {_fmt(count[""])}')
+                suffix = f'{{{labels}}}' if labels else ''
+                lines.append(f'{full}_sum{suffix} {_fmt(sums.get(labels, {}).get("", 0))}')
+                lines.append(f'{full}_count{suffix} {_fmt(count[""])}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,204 @@
+"""
+批量审核与批量编辑
+
+按 id 列表或筛选条件选中作品，以集合 SQL (UPDATE / DELETE / INSERT ... SELECT) 一次性处理，
+整批只提交一次；删除产生的文件登记到删除队列，由后台线程按批清理。
+"""
+from sqlalchemy import and_, delete, exists, insert, literal, select, update
+
+from extensions import db
+from models import Image, Tag, ReferenceImage, image_tags
+from services.database_service import chunked
+from services.deletion_service import DeletionService
+from services.image_service import ImageService
+from services.stats_service import StatsService
+from services.tag_service import TagService, split_tag_names
+
+ACTIONS = ('approve', 'reject', 'delete', 'recategorize', 'add_tags', 'remove_tags')
+# 会改变后台统计计数 (状态/分类/总数) 的操作；标签的增删由 TagService 自行维护计数
+COUNTED_ACTIONS = ('approve', 'reject', 'delete', 'recategorize')
+FILTER_KEYS = ('status', 'category', 'media_type', 'tag', 'q')
+CATEGORIES = ('gallery', 'template')
+
+
+class ModerationService:
+    @staticmethod
+    def filter_clauses(filters):
+        """把筛选条件编译为作品的 WHERE 条件列表。条件非法时抛 ValueError。"""
+        if not filters:
+            raise ValueError('需要提供 ids 或 filter')
+        unknown = set(filters).difference(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"未知筛选条件: {', '.join(sorted(unknown))}")
+
+        clauses = [getattr(Image, key) == filters[key]
+                   for key in ('status', 'category', 'media_type') if filters.get(key)]
+        if filters.get('tag'):
+            clause = TagService.filter_clause(filters['tag'])
+            if clause is not None:
+                clauses.append(clause)
+        if filters.get('q'):
+            q = filters['q']
+            clauses.append(Image.title.contains(q) | Image.prompt.contains(q) | Image.author.contains(q))
+        return clauses
+
+    @staticmethod
+    def resolve_ids(ids=None, filters=None):
+        """把 id 列表或筛选条件解析为作品 id 列表 (只查 id 列)。条件非法时抛 ValueError。"""
+        if ids is not None:
+            try:
+                ids = sorted({int(i) for i in ids})
+            except (TypeError, ValueError):
+                raise ValueError('ids 必须为整数列表')
+            if not ids:
+                return []
+            found = []
+            for chunk in chunked(ids):
+                found.extend(db.session.scalars(select(Image.id).where(Image.id.in_(chunk))))
+            return sorted(found)
+
+        stmt = select(Image.id).where(*ModerationService.filter_clauses(filters))
+        return list(db.session.scalars(stmt.order_by(Image.id)))
+
+    @staticmethod
+    def apply(action, ids=None, filters=None, category=None, tags=None):
+        """
+        执行批量操作，返回 {'action', 'matched', 'affected'}。
+        按筛选条件发布/撤回/改分类时直接执行一条 UPDATE，matched 为实际变更的行数。
+        action:
+            approve       发布
+            reject        撤回为待审核
+            delete        删除作品 (记录、参考图、标签关联，文件进入删除队列)
+            recategorize  改为 category 指定的分类
+            add_tags / remove_tags  批量增删 tags 指定的标签
+        """
+        if action not in ACTIONS:
+            raise ValueError(f'不支持的操作: {action}')
+        if action == 'recategorize' and category not in CATEGORIES:
+            raise ValueError('recategorize 需要有效的 category (gallery / template)')
+        tag_names = split_tag_names(tags)
+        if action in ('add_tags', 'remove_tags') and not tag_names:
+            raise ValueError(f'{action} 需要提供 tags')
+
+        values = {'approve': {'status': 'approved'}, 'reject': {'status': 'pending'},
+                  'recategorize': {'category': category}}.get(action)
+        if values is not None and ids is None:
+            # 按筛选条件改状态/分类：一条集合 UPDATE，不把 id 取回 Python
+            return ModerationService._apply_where(action, ModerationService.filter_clauses(filters), values)
+
+        target_ids = ModerationService.resolve_ids(ids, filters)
+        result = {'action': action, 'matched': len(target_ids), 'affected': 0}
+        if not target_ids:
+            return result
+
+        try:
+            if values is not None:
+                affected = ModerationService._update(target_ids, **values)
+            elif action == 'add_tags':
+                affected = ModerationService._add_tags(target_ids, tag_names)
+            elif action == 'remove_tags':
+                affected = ModerationService._remove_tags(target_ids, tag_names)
+            else:
+                affected = ModerationService._delete(target_ids)
+
+            if affected and action in COUNTED_ACTIONS:
+                StatsService.mark_stale()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if action == 'delete':
+            DeletionService.wake()
+        result['affected'] = affected
+        return result
+
+    @staticmethod
+    def _apply_where(action, clauses, values):
+        """按条件一次更新；不预先统计命中数，matched 即为实际变更的行数"""
+        try:
+            affected = ModerationService._update_where(clauses, **values)
+            if affected:
+                StatsService.mark_stale()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return {'action': action, 'matched': affected, 'affected': affected}
+
+    @staticmethod
+    def _update(ids, **values):
+        """按 id 分块更新"""
+        return sum(ModerationService._update_where([Image.id.in_(chunk)], **values) for chunk in chunked(ids))
+
+    @staticmethod
+    def _update_where(clauses, **values):
+        """只更新取值确有变化的行，同时递增 row_version 使序列化缓存失效"""
+        changed = [getattr(Image, k) != v for k, v in values.items()]
+        return db.session.execute(
+            update(Image)
+            .where(*clauses, *changed)
+            .values(row_version=Image.row_version + 1, **values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    @staticmethod
+    def _tag_ids(names):
+        """按名称查已有标签 id (一次 IN 查询)"""
+        found = dict(db.session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+        return [found[n] for n in names if n in found]
+
+    @staticmethod
+    def _add_tags(ids, names):
+        """INSERT ... SELECT 补齐关联，已存在的 (作品, 标签) 对跳过"""
+        affected = 0
+        for tag_id in [t.id for t in TagService.resolve(names)]:
+            for chunk in chunked(ids):
+                already = exists().where(and_(image_tags.c.image_id == Image.id, image_tags.c.tag_id == tag_id))
+                affected += db.session.execute(
+                    insert(image_tags).from_select(
+                        ['image_id', 'tag_id'],
+                        select(Image.id, literal(tag_id)).where(Image.id.in_(chunk), ~already),
+                    )
+                ).rowcount
+        ImageService.bump_row_versions(ids)
+        return affected
+
+    @staticmethod
+    def _remove_tags(ids, names):
+        tag_ids = ModerationService._tag_ids(names)
+        if not tag_ids:
+            return 0
+        affected = 0
+        for chunk in chunked(ids):
+            affected += db.session.execute(
+                delete(image_tags).where(image_tags.c.tag_id.in_(tag_ids), image_tags.c.image_id.in_(chunk))
+            ).rowcount
+        ImageService.bump_row_versions(ids)
+        TagService.delete_orphans(tag_ids)
+        return affected
+
+    @staticmethod
+    def _delete(ids):
+        files, touched_tags = [], set()
+        for chunk in chunked(ids):
+            for file_path, thumb in db.session.execute(
+                    select(Image.file_path, Image.thumbnail_path).where(Image.id.in_(chunk))):
+                files.extend((file_path, thumb))
+            files.extend(db.session.scalars(
+                select(ReferenceImage.file_path).where(ReferenceImage.image_id.in_(chunk))))
+            touched_tags.update(db.session.scalars(
+                select(image_tags.c.tag_id).where(image_tags.c.image_id.in_(chunk))))
+
+        affected = 0
+        for chunk in chunked(ids):
+            db.session.execute(delete(ReferenceImage).where(ReferenceImage.image_id.in_(chunk))
+                               .execution_options(synchronize_session=False))
+            db.session.execute(delete(image_tags).where(image_tags.c.image_id.in_(chunk)))
+            affected += db.session.execute(delete(Image).where(Image.id.in_(chunk))
+                                           .execution_options(synchronize_session=False)).rowcount
+
+        # 文件登记入队，与记录删除同一事务提交
+        DeletionService.enqueue(files)
+        TagService.delete_orphans(list(touched_tags))
+        return affected
@@ -0,0 +1,75 @@
+"""
+worker 启动耗时分析
+
+在全新子进程中以 `python -X importtime` 导入应用 (等同一个 worker 冷启动，含 create_app)，
+按顶层包汇总导入耗时，用于设定并检查 worker 启动预算。
+"""
+import os
+import re
+import subprocess
+import sys
+
+# 子进程内执行：计时导入 app 模块 (模块级 create_app 一并计入)
+_BOOT_SCRIPT = (
+    "import time; t = time.perf_counter(); import app; "
+    "print('boot_ms=%.1f' % ((time.perf_counter() - t) * 1000))"
+)
+# 按需加载的重型依赖：出现在启动导入中说明懒加载被破坏
+LAZY_PACKAGES = ('PIL', 'boto3', 'botocore')
+_BOOT_LINE = re.compile(r'^boot_ms=([\d.]+)$', re.M)
+
+
+def parse_importtime(text):
+    """解析 -X importtime 输出，返回 [(模块名, 自身耗时 us, 累计耗时 us, 嵌套深度)]"""
+    rows = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # 表头
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), self_us, cumulative_us, depth))
+    return rows
+
+
+def summarize_packages(rows):
+    """按顶层包汇总各模块的自身导入耗时 (ms)，降序"""
+    totals = {}
+    for name, self_us, _, _ in rows:
+        root = name.split('.')[0]
+        totals[root] = totals.get(root, 0) + self_us
+    return sorted(((name, us / 1000) for name, us in totals.items()), key=lambda x: -x[1])
+
+
+class ProfileService:
+    @staticmethod
+    def profile_startup(root_path, timeout=120):
+        """
+        冷启动一次应用并返回:
+        {'boot_ms': 导入+create_app 总耗时, 'import_ms': 导入耗时合计,
+         'packages': [(包, ms)], 'lazy_loaded': 启动时被加载的按需依赖}
+        """
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _BOOT_SCRIPT],
+            cwd=root_path, env=dict(os.environ), capture_output=True, text=True, timeout=timeout,
+        )
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f'exit code {proc.returncode}')
+
+        rows = parse_importtime(proc.stderr)
+        packages = summarize_packages(rows)
+        match = _BOOT_LINE.search(proc.stdout)
+        loaded = {name for name, _ in packages}
+        return {
+            'boot_ms': float(match.group(1)) if match else None,
+            'import_ms': sum(ms for _, ms in packages),
+            'packages': packages,
+            'lazy_loaded': [p for p in LAZY_PACKAGES if p in loaded],
+        }
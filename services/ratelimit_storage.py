@@ -0,0 +1,157 @@
+"""
+限流计数的 SQLite 存储后端
+
+`register()` 注册 `sqlite://` 存储方案供 Flask-Limiter 使用 (RATELIMIT_STORAGE_URI=sqlite:////path/to/ratelimit.db)，
+同一台机器上的多个 gunicorn worker 共享同一个数据库文件，限流额度不再按 worker 数翻倍，重启也不会清零。
+跨多台机器部署时改用 Redis 兼容的 URI (redis://...，需安装 redis 包)。
+
+支持 moving-window (逐条记录命中时间) 与 fixed-window (计数器) 两种策略，不支持 sliding-window-counter；
+过期记录在写入时按间隔批量清理，表的大小只与窗口内的命中数有关。
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from limits.storage import SCHEMES, MovingWindowSupport, Storage
+
+# 两次全表过期清理之间的最小间隔 (秒)
+PURGE_INTERVAL = 60
+SCHEME = 'sqlite'
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS hit (key TEXT NOT NULL, atime REAL NOT NULL, expires REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS ix_hit_key_atime ON hit (key, atime)',
+    'CREATE INDEX IF NOT EXISTS ix_hit_expires ON hit (expires)',
+    'CREATE TABLE IF NOT EXISTS counter (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires REAL NOT NULL)',
+)
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    """
+    基于本地 SQLite 文件的限流存储，多进程通过数据库文件锁互斥。
+    每个线程 (及 fork 后的每个进程) 使用独立连接；写操作在 BEGIN IMMEDIATE 事务内完成，检查与记录原子。
+    """
+
+    def __init__(self, uri=None, wrap_exceptions=False, timeout=5.0, **options):
+        path = (uri or '')[len('sqlite:///'):]
+        if not path:
+            raise ValueError('sqlite 限流存储需要文件路径，例如 sqlite:////app/instance/ratelimit.db')
+        self.path = path
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        self._last_purge = 0.0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        for stmt in _SCHEMA:
+            conn.execute(stmt)
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # fork 出的子进程不能沿用父进程的连接
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, fn):
+        """在 BEGIN IMMEDIATE 事务中执行 fn(conn, now)，顺带按间隔清理过期记录"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn, now)
+            if now - self._last_purge >= PURGE_INTERVAL:
+                self._last_purge = now
+                conn.execute('DELETE FROM hit WHERE expires <= ?', (now,))
+                conn.execute('DELETE FROM counter WHERE expires <= ?', (now,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    # ==================== fixed-window ====================
+
+    def incr(self, key, expiry, amount=1, elastic_expiry=False):
+        # elastic_expiry：limits 3.x 的 fixed-window-elastic-expiry 策略传入，每次命中都顺延窗口
+        def run(conn, now):
+            conn.execute('DELETE FROM counter WHERE key = ? AND expires <= ?', (key, now))
+            conn.execute('INSERT OR IGNORE INTO counter (key, value, expires) VALUES (?, 0, ?)', (key, now + expiry))
+            if elastic_expiry:
+                conn.execute('UPDATE counter SET value = value + ?, expires = ? WHERE key = ?',
+                             (amount, now + expiry, key))
+            else:
+                conn.execute('UPDATE counter SET value = value + ? WHERE key = ?', (amount, key))
+            return conn.execute('SELECT value FROM counter WHERE key = ?', (key,)).fetchone()[0]
+        return self._write(run)
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM counter WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connection().execute(
+            'SELECT expires FROM counter WHERE key = ? AND expires > ?', (key, now)).fetchone()
+        return row[0] if row else now
+
+    # ==================== moving-window ====================
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+
+        def run(conn, now):
+            conn.execute('DELETE FROM hit WHERE key = ? AND atime <= ?', (key, now - expiry))
+            count = conn.execute('SELECT COUNT(*) FROM hit WHERE key = ?', (key,)).fetchone()[0]
+            if count + amount > limit:
+                return False
+            conn.executemany('INSERT INTO hit (key, atime, expires) VALUES (?, ?, ?)',
+                             [(key, now, now + expiry)] * amount)
+            return True
+        return self._write(run)
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        oldest, count = self._connection().execute(
+            'SELECT MIN(atime), COUNT(*) FROM hit WHERE key = ? AND atime > ?', (key, now - expiry)).fetchone()
+        return (oldest if count else now), count
+
+    # ==================== 维护 ====================
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        def run(conn, now):
+            removed = conn.execute('DELETE FROM hit').rowcount
+            return removed + conn.execute('DELETE FROM counter').rowcount
+        return self._write(run)
+
+    def clear(self, key):
+        def run(conn, now):
+            conn.execute('DELETE FROM hit WHERE key = ?', (key,))
+            conn.execute('DELETE FROM counter WHERE key = ?', (key,))
+        self._write(run)
+
+
+def register():
+    """把 sqlite:// 登记到 limits 的存储方案表；须在 limiter.init_app 之前调用 (重复调用无副作用)"""
+    # 类体中不声明 STORAGE_SCHEME，避免仅因导入本模块就被元类注册
+    SQLiteStorage.STORAGE_SCHEME = [SCHEME]
+    SCHEMES[SCHEME] = SQLiteStorage
@@ -0,0 +1,69 @@
+"""
+数据库结构指纹
+
+对模型元数据 (表、列、类型、约束、索引) 与随镜像发布的迁移脚本列表计算哈希，
+同步成功后写入 system_setting 表。容器启动时指纹未变即可跳过迁移扫描 (autogenerate 需逐表比对，耗时数秒)。
+"""
+import hashlib
+import os
+
+from sqlalchemy import inspect
+
+from extensions import db
+from models import SystemSetting
+
+FINGERPRINT_KEY = 'schema_fingerprint'
+# manage_db.py 现场自动生成的迁移脚本名包含此标记，不算随代码发布的迁移
+AUTO_MIGRATION_MARK = 'auto_update_'
+
+
+def _describe_table(table):
+    lines = [f'table {table.name}']
+    for col in table.columns:
+        default = col.server_default.arg if col.server_default is not None else None
+        lines.append(f'  col {col.name} {col.type!r} null={col.nullable} pk={col.primary_key} '
+                     f'unique={col.unique} server_default={default!s}')
+    for fk in sorted(table.foreign_keys, key=lambda f: (f.parent.name, f.target_fullname)):
+        lines.append(f'  fk {fk.parent.name} -> {fk.target_fullname}')
+    for index in sorted(table.indexes, key=lambda i: i.name or ''):
+        cols = ','.join(c.name for c in index.columns)
+        lines.append(f'  index {index.name} ({cols}) unique={index.unique}')
+    return lines
+
+
+class SchemaService:
+    @staticmethod
+    def migration_files(directory='migrations'):
+        """随代码发布的迁移脚本文件名 (只列目录，不导入脚本，不含现场自动生成的脚本)"""
+        versions = os.path.join(directory, 'versions')
+        if not os.path.isdir(versions):
+            return []
+        return sorted(f for f in os.listdir(versions) if f.endswith('.py') and AUTO_MIGRATION_MARK not in f)
+
+    @staticmethod
+    def fingerprint(metadata=None, migrations_dir='migrations'):
+        """当前代码期望的结构指纹 (sha256)"""
+        metadata = metadata if metadata is not None else db.metadata
+        lines = []
+        for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+            lines.extend(_describe_table(table))
+        lines.extend(f'migration {name}' for name in SchemaService.migration_files(migrations_dir))
+        return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def stored_fingerprint():
+        """数据库中记录的指纹；库为空或尚无配置表时返回空串"""
+        if not inspect(db.engine).has_table(SystemSetting.__tablename__):
+            return ''
+        return SystemSetting.get_str(FINGERPRINT_KEY, default='')
+
+    @staticmethod
+    def is_current(migrations_dir='migrations'):
+        return SchemaService.stored_fingerprint() == SchemaService.fingerprint(migrations_dir=migrations_dir)
+
+    @staticmethod
+    def store_fingerprint(migrations_dir='migrations'):
+        """结构同步成功后记录指纹 (立即提交)"""
+        value = SchemaService.fingerprint(migrations_dir=migrations_dir)
+        SystemSetting.set_str(FINGERPRINT_KEY, value)
+        return value
@@ -0,0 +1,120 @@
+"""作品 JSON 序列化：按 (id, row_version) 缓存单条作品的 JSON 片段，列表响应直接拼接字节串。"""
+import json
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+from services.metrics_service import MetricsService
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，缺失时回退标准库 json
+    orjson = None
+
+
+def dumps_bytes(obj):
+    """紧凑 UTF-8 JSON 编码，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    基于 orjson 的 app.json 实现。
+    输出与默认实现保持一致 (日期仍按 HTTP 日期格式、按配置排序键)，
+    遇到 orjson 不支持的参数时回退到标准库。
+    """
+
+    def dumps(self, obj, **kwargs):
+        kwargs.pop('separators', None)
+        indent = kwargs.pop('indent', None)
+        sort_keys = kwargs.pop('sort_keys', self.sort_keys)
+        if kwargs or self.ensure_ascii or indent not in (None, 2):
+            if indent is not None:
+                kwargs['indent'] = indent
+            return super().dumps(obj, sort_keys=sort_keys, **kwargs)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+class SerializationService:
+    """
+    进程内 LRU 缓存，键为 (id, row_version, heat_score, 站点根, 字段集)，作品更新后旧键自然不再命中。
+    缓存挂在 app.extensions 上，不同应用实例 (如测试) 互不影响。
+    """
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _state():
+        ext = current_app.extensions
+        state = ext.get('image_json_cache')
+        if state is None:
+            state = ext.setdefault('image_json_cache', {'cache': OrderedDict(), 'hits': 0, 'misses': 0})
+        return state
+
+    @staticmethod
+    def image_json(img, base_url='', fields=None):
+        """单条作品的 JSON 字节串 (等价于 to_dict 的编码结果)，fields 为稀疏字段集 (frozenset)"""
+        state = SerializationService._state()
+        cache = state['cache']
+        # heat_score 随统计上报变化但不递增 row_version，输出该字段时并入键
+        heat = img.heat_score if fields is None or 'heat_score' in fields else None
+        key = (img.id, img.row_version, heat, base_url, fields)
+        with SerializationService._lock:
+            data = cache.get(key)
+            if data is not None:
+                cache.move_to_end(key)
+                state['hits'] += 1
+            else:
+                state['misses'] += 1
+        if data is not None:
+            MetricsService.inc('cache_lookups_total', cache='image_json', result='hit')
+            return data
+        MetricsService.inc('cache_lookups_total', cache='image_json', result='miss')
+
+        data = dumps_bytes(img.to_dict(base_url, fields))
+
+        limit = current_app.config.get('IMAGE_JSON_CACHE_SIZE', 0)
+        if limit > 0:
+            with SerializationService._lock:
+                cache[key] = data
+                while len(cache) > limit:
+                    cache.popitem(last=False)
+        return data
+
+    @staticmethod
+    def images_json(images, base_url='', fields=None):
+        """作品列表的 JSON 数组字节串"""
+        return b'[' + b','.join(SerializationService.image_json(img, base_url, fields) for img in images) + b']'
+
+    @staticmethod
+    def stats():
+        state = SerializationService._state()
+        with SerializationService._lock:
+            return {'hits': state['hits'], 'misses': state['misses'], 'size': len(state['cache'])}
+
+    @staticmethod
+    def reset_after_fork(app):
+        """fork 后在子进程调用：丢弃继承自父进程的锁与缓存"""
+        SerializationService._lock = threading.Lock()
+        app.extensions.pop('image_json_cache', None)
+
+    @staticmethod
+    def clear():
+        state = SerializationService._state()
+        with SerializationService._lock:
+            state['cache'].clear()
+            state['hits'] = state['misses'] = 0
@@ -0,0 +1,204 @@
+"""
+后台统计计数器
+
+作品/标签的增删改在 before_flush 中换算为计数增量，随同一事务写入 stat_counter 表；
+后台首页与统计接口只读这张小表，不再对作品表做 COUNT 扫描。
+- 绕过 ORM 的批量 UPDATE/DELETE 需在同一事务内调用 StatsService.mark_stale()，下次读取时整体重算
+- 存储占用需要遍历文件，只由 `flask refresh-stats` (可配合定时任务) 或统计接口的刷新请求计算
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, inspect, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Image, Tag, StatCounter
+
+STALE_KEY = 'stats:stale'
+STORAGE_KEY = 'storage:bytes'
+TOTAL_KEY = 'images:total'
+TAGS_KEY = 'tags:total'
+
+_IMAGE_ATTRS = ('status', 'category', 'media_type')
+# 重算时预建这些计数器 (值为 0)，避免首次出现时因缺行而标记过期
+_KNOWN_KEYS = ('images:status:pending', 'images:status:approved',
+               'images:approved:gallery', 'images:approved:template',
+               'images:media:image', 'images:media:gif', 'images:media:video')
+# 与 Image 列默认值一致：flush 前新对象的这些字段可能仍为 None
+_IMAGE_DEFAULTS = {'status': 'pending', 'category': 'gallery', 'media_type': 'image'}
+
+
+def _image_keys(status, category, media_type):
+    """一条作品计入的全部计数器"""
+    keys = [TOTAL_KEY, f'images:status:{status}', f'images:media:{media_type}']
+    if status == 'approved':
+        keys.append(f'images:approved:{category}')
+    return keys
+
+
+def _current_state(obj):
+    return tuple(getattr(obj, a) or _IMAGE_DEFAULTS[a] for a in _IMAGE_ATTRS)
+
+
+def _original_state(obj):
+    """变更前的 (status, category, media_type)；未加载就被修改导致原值未知时返回 None"""
+    state = inspect(obj)
+    values = []
+    for attr in _IMAGE_ATTRS:
+        hist = state.attrs[attr].history
+        if hist.deleted:
+            value = hist.deleted[0]
+        elif hist.unchanged:
+            value = hist.unchanged[0]
+        elif hist.added:
+            return None
+        else:
+            value = getattr(obj, attr)
+        values.append(value or _IMAGE_DEFAULTS[attr])
+    return tuple(values)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_counters(session, flush_context, instances):
+    """把本次 flush 涉及的作品/标签变动换算为计数增量，写入同一事务"""
+    deltas = {}
+    stale = False
+
+    def add(keys, n):
+        for k in keys:
+            deltas[k] = deltas.get(k, 0) + n
+
+    for obj in session.new:
+        if isinstance(obj, Image):
+            add(_image_keys(*_current_state(obj)), 1)
+        elif isinstance(obj, Tag):
+            add([TAGS_KEY], 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Image):
+            original = _original_state(obj)
+            if original is None:
+                stale = True
+            else:
+                add(_image_keys(*original), -1)
+        elif isinstance(obj, Tag):
+            add([TAGS_KEY], -1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Image) and session.is_modified(obj, include_collections=False):
+            original = _original_state(obj)
+            if original is None:
+                stale = True
+                continue
+            current = _current_state(obj)
+            if original != current:
+                add(_image_keys(*original), -1)
+                add(_image_keys(*current), 1)
+
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas and not stale:
+        return
+
+    conn = session.connection()
+    now = datetime.now()
+    for key, delta in deltas.items():
+        result = conn.execute(
+            update(StatCounter).where(StatCounter.key == key)
+            .values(value=StatCounter.value + delta, updated_at=now)
+        )
+        # 计数器尚未建立 (新分类/媒体类型等)：交给下次读取时重算
+        if result.rowcount == 0:
+            stale = True
+    if stale:
+        conn.execute(update(StatCounter).where(StatCounter.key == STALE_KEY).values(value=1, updated_at=now))
+
+
+class StatsService:
+    @staticmethod
+    def mark_stale():
+        """标记计数器需要重算 (批量 SQL 更新后调用，随当前事务提交)"""
+        db.session.execute(
+            update(StatCounter).where(StatCounter.key == STALE_KEY).values(value=1, updated_at=datetime.now())
+        )
+
+    @staticmethod
+    def increment(key, delta):
+        """绕过 ORM 插入/删除后手动调整计数 (随当前事务提交)；计数器不存在时标记过期"""
+        now = datetime.now()
+        result = db.session.execute(
+            update(StatCounter).where(StatCounter.key == key)
+            .values(value=StatCounter.value + delta, updated_at=now)
+        )
+        if result.rowcount == 0:
+            StatsService.mark_stale()
+
+    @staticmethod
+    def compute_storage_bytes():
+        """遍历上传目录/存储桶统计占用字节数，失败时返回 None"""
+        from services.storage_service import StorageService
+        try:
+            return sum(size for _, size, _ in StorageService.iter_stored_files())
+        except Exception as e:
+            current_app.logger.warning(f"Storage stats failed: {e}")
+            return None
+
+    @staticmethod
+    def rebuild(include_storage=False):
+        """按当前数据整体重算计数器 (一次分组统计)，include_storage 时同时统计存储占用"""
+        counts = dict.fromkeys((TOTAL_KEY, STALE_KEY) + _KNOWN_KEYS, 0)
+        rows = db.session.query(Image.status, Image.category, Image.media_type, func.count(Image.id)) \
+            .group_by(Image.status, Image.category, Image.media_type).all()
+        for status, category, media_type, n in rows:
+            state = (status or _IMAGE_DEFAULTS['status'], category or _IMAGE_DEFAULTS['category'],
+                     media_type or _IMAGE_DEFAULTS['media_type'])
+            for key in _image_keys(*state):
+                counts[key] = counts.get(key, 0) + n
+        counts[TAGS_KEY] = db.session.query(func.count(Tag.id)).scalar()
+
+        keep_storage = not include_storage
+        if include_storage:
+            storage_bytes = StatsService.compute_storage_bytes()
+            if storage_bytes is None:
+                keep_storage = True
+            else:
+                counts[STORAGE_KEY] = storage_bytes
+
+        try:
+            stmt = delete(StatCounter)
+            if keep_storage:
+                stmt = stmt.where(StatCounter.key != STORAGE_KEY)
+            db.session.execute(stmt)
+            now = datetime.now()
+            db.session.execute(insert(StatCounter), [{'key': k, 'value': v, 'updated_at': now}
+                                                     for k, v in counts.items()])
+            db.session.commit()
+        except IntegrityError:
+            # 其他进程同时在重算，以对方结果为准
+            db.session.rollback()
+
+    @staticmethod
+    def get_stats():
+        """读取聚合统计 (不扫描作品表)；计数器缺失或被标记过期时先重算"""
+        rows = {r.key: r for r in StatCounter.query.all()}
+        if TOTAL_KEY not in rows or (rows.get(STALE_KEY) and rows[STALE_KEY].value):
+            StatsService.rebuild()
+            rows = {r.key: r for r in StatCounter.query.all()}
+
+        def group(prefix):
+            return {k[len(prefix):]: r.value for k, r in sorted(rows.items()) if k.startswith(prefix) and r.value}
+
+        by_status = group('images:status:')
+        storage = rows.get(STORAGE_KEY)
+        return {
+            'total_images': rows[TOTAL_KEY].value,
+            'total_tags': rows[TAGS_KEY].value if TAGS_KEY in rows else 0,
+            'pending': by_status.get('pending', 0),
+            'approved': by_status.get('approved', 0),
+            'by_status': by_status,
+            'approved_by_category': group('images:approved:'),
+            'by_media_type': group('images:media:'),
+            'storage_bytes': storage.value if storage else None,
+            'storage_updated_at': storage.updated_at.isoformat() if storage and storage.updated_at else None,
+        }
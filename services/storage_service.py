@@ -0,0 +1,283 @@
+"""
+存储对账与孤儿文件回收
+
+遍历上传目录 (os.scandir) 或逐页列出存储桶，与数据库中 Image / ReferenceImage
+引用的全部路径做集合差运算：
+- 孤儿文件：存储中存在、数据库未引用 (失败请求/导入残留、旧缩略图等)
+- 悬空引用：数据库引用、存储中已不存在
+默认仅报告 (dry-run)；显式开启删除后按速率限制分批清理。
+"""
+import os
+import time
+
+from flask import current_app
+from extensions import db
+from models import Image, ReferenceImage, PendingDeletion
+from services.image_service import ImageService
+from utils import get_s3_client, remove_physical_files, _resolve_upload_dir, _web_path, _s3_domain, \
+    shard_relpath, S3_DELETE_BATCH_SIZE
+
+
+def _format_size(num):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num < 1024:
+            return f"{num:.1f}{unit}"
+        num /= 1024
+    return f"{num:.1f}TB"
+
+
+class StorageService:
+    @staticmethod
+    def is_cloud():
+        return current_app.config.get('STORAGE_TYPE') == 'cloud'
+
+    @staticmethod
+    def storage_key(web_path):
+        """将数据库中的 web 路径规范化为存储 Key (相对上传目录的路径或 S3 对象 Key)。不归本站管理时返回 None。"""
+        if not web_path:
+            return None
+        if web_path.startswith(('http://', 'https://')):
+            if not StorageService.is_cloud():
+                return None
+            clean = web_path.split('?')[0]
+            domain = (current_app.config.get('S3_DOMAIN') or '').strip().rstrip('/')
+            if domain and clean.startswith(domain + '/'):
+                return clean[len(domain) + 1:]
+            return clean.split('/')[-1]
+
+        prefix = _web_path(current_app.config['UPLOAD_FOLDER'], '')
+        if not prefix.endswith('/'):
+            prefix += '/'
+        if web_path.startswith(prefix):
+            return web_path[len(prefix):]
+        return None
+
+    @staticmethod
+    def key_to_web_path(key):
+        """存储 Key 还原为可交给 remove_physical_files 的 web 路径。"""
+        if StorageService.is_cloud():
+            return f"{_s3_domain()}/{key}"
+        return _web_path(current_app.config['UPLOAD_FOLDER'], key)
+
+    @staticmethod
+    def iter_local_files():
+        """递归遍历上传目录，产出 (key, size, mtime)。跳过隐藏文件。"""
+        root = _resolve_upload_dir(current_app.config['UPLOAD_FOLDER'])
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            with os.scandir(os.path.join(root, rel_dir)) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(rel)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        yield rel, st.st_size, st.st_mtime
+
+    @staticmethod
+    def iter_bucket_objects(page_size=1000):
+        """逐页列出存储桶对象，产出 (key, size, mtime)。"""
+        s3 = get_s3_client()
+        paginator = s3.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=current_app.config.get('S3_BUCKET'),
+                                   PaginationConfig={'PageSize': page_size})
+        for page in pages:
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj.get('Size', 0), obj['LastModified'].timestamp()
+
+    @staticmethod
+    def iter_stored_files():
+        if StorageService.is_cloud():
+            return StorageService.iter_bucket_objects()
+        return StorageService.iter_local_files()
+
+    @staticmethod
+    def referenced_keys(batch_size=5000):
+        """
+        收集数据库引用的全部存储 Key。
+        返回 (keys, owners)：owners 为 key -> [(模型名, 行 id, 字段名)]，用于定位悬空引用。
+        """
+        owners = {}
+
+        def _add(key, owner):
+            if key:
+                owners.setdefault(key, []).append(owner)
+
+        rows = db.session.query(Image.id, Image.file_path, Image.thumbnail_path).yield_per(batch_size)
+        for img_id, file_path, thumb_path in rows:
+            _add(StorageService.storage_key(file_path), ('Image', img_id, 'file_path'))
+            _add(StorageService.storage_key(thumb_path), ('Image', img_id, 'thumbnail_path'))
+
+        rows = db.session.query(ReferenceImage.id, ReferenceImage.file_path) \
+            .filter(ReferenceImage.is_placeholder.isnot(True)).yield_per(batch_size)
+        for ref_id, file_path in rows:
+            _add(StorageService.storage_key(file_path), ('ReferenceImage', ref_id, 'file_path'))
+
+        return set(owners), owners
+
+    @staticmethod
+    def reconcile_stream(delete=False, prune_dangling=False, min_age_minutes=60, rate_limit=50.0,
+                         batch_size=S3_DELETE_BATCH_SIZE):
+        """
+        对账并 (可选) 清理，流式返回进度文本。
+
+        :param delete: False 为 dry-run，仅报告
+        :param prune_dangling: 删除指向缺失文件的参考图记录、清空缺失的缩略图字段 (不删除作品本身)
+        :param min_age_minutes: 只处理早于该时长的文件，避免误删正在上传、尚未提交的文件
+        :param rate_limit: 每秒最多删除的文件数，<=0 不限速
+        """
+        mode = '删除模式' if delete else 'DRY-RUN (仅报告)'
+        yield f"🔍 [Storage] 开始对账：{'云存储' if StorageService.is_cloud() else '本地存储'}，{mode}\n"
+
+        referenced, owners = StorageService.referenced_keys()
+        # 已在删除队列中的文件不算孤儿，交由队列处理
+        queued = {StorageService.storage_key(p) for (p,) in db.session.query(PendingDeletion.path)}
+        yield f"📚 数据库引用 {len(referenced)} 个文件，删除队列中 {len(queued)} 个\n"
+
+        cutoff = time.time() - min_age_minutes * 60
+        stored = set()
+        orphans = []
+        scanned_bytes = orphan_bytes = 0
+        skipped_recent = 0
+        for key, size, mtime in StorageService.iter_stored_files():
+            stored.add(key)
+            scanned_bytes += size
+            if key in referenced or key in queued:
+                continue
+            if mtime > cutoff:
+                skipped_recent += 1
+                continue
+            orphans.append(key)
+            orphan_bytes += size
+
+        dangling = sorted(referenced - stored)
+        yield f"📦 扫描 {len(stored)} 个文件 ({_format_size(scanned_bytes)})\n"
+        yield f"🗑️ 孤儿文件 {len(orphans)} 个 ({_format_size(orphan_bytes)})，近期文件跳过 {skipped_recent} 个\n"
+        for key in orphans[:50]:
+            yield f"   - {key}\n"
+        if len(orphans) > 50:
+            yield f"   ... 其余 {len(orphans) - 50} 个省略\n"
+        yield f"⚠️ 悬空引用 {len(dangling)} 个\n"
+        for key in dangling[:50]:
+            refs = ', '.join(f"{m}#{i}.{f}" for m, i, f in owners[key])
+            yield f"   - {key} <- {refs}\n"
+
+        if not delete:
+            yield "\n✅ DRY-RUN 完成，未做任何修改。使用 --delete 执行清理。"
+            return
+
+        removed = failed = 0
+        step = max(1, min(batch_size, int(rate_limit) if rate_limit and rate_limit > 0 else batch_size))
+        for i in range(0, len(orphans), step):
+            started = time.monotonic()
+            chunk = orphans[i:i + step]
+            errors = remove_physical_files([StorageService.key_to_web_path(k) for k in chunk])
+            failed += len(errors)
+            removed += len(chunk) - len(errors)
+            if rate_limit and rate_limit > 0:
+                time.sleep(max(0.0, len(chunk) / rate_limit - (time.monotonic() - started)))
+        yield f"🧹 已删除孤儿文件 {removed} 个，失败 {failed} 个\n"
+
+        if prune_dangling and dangling:
+            pruned = StorageService._prune_dangling(dangling, owners)
+            yield f"🧹 已清理悬空引用 {pruned} 处 (缺失主图的作品仅报告，不自动删除)\n"
+
+        yield "\n🎉 对账完成"
+
+    @staticmethod
+    def _prune_dangling(dangling, owners):
+        ref_ids, thumb_ids = [], []
+        for key in dangling:
+            for model, row_id, field in owners[key]:
+                if model == 'ReferenceImage':
+                    ref_ids.append(row_id)
+                elif field == 'thumbnail_path':
+                    thumb_ids.append(row_id)
+        touched = set(thumb_ids)
+        if ref_ids:
+            touched.update(r[0] for r in db.session.query(ReferenceImage.image_id)
+                           .filter(ReferenceImage.id.in_(ref_ids)))
+            ReferenceImage.query.filter(ReferenceImage.id.in_(ref_ids)).delete(synchronize_session=False)
+        if thumb_ids:
+            Image.query.filter(Image.id.in_(thumb_ids)).update({'thumbnail_path': None}, synchronize_session=False)
+        ImageService.bump_row_versions(touched)
+        db.session.commit()
+        return len(ref_ids) + len(thumb_ids)
+
+    # ==================== 分片目录迁移 ====================
+
+    @staticmethod
+    def _shard_one(web_path, upload_root, dry_run):
+        """
+        将一个平铺的本地文件移入分片目录，返回新的 web 路径；无需迁移时返回 None。
+        先移动文件再由调用方提交数据库：中途中断后重跑时，旧文件已不存在而新文件存在，
+        会直接改写路径，因此迁移可安全重复执行。
+        """
+        key = StorageService.storage_key(web_path)
+        if not key or '/' in key or StorageService.is_cloud():
+            return None
+        new_key = shard_relpath(key)
+        if new_key == key:
+            return None
+
+        old_abs = os.path.join(upload_root, key)
+        new_abs = os.path.join(upload_root, *new_key.split('/'))
+        if os.path.exists(old_abs):
+            if not dry_run:
+                os.makedirs(os.path.dirname(new_abs), exist_ok=True)
+                os.replace(old_abs, new_abs)
+        elif not os.path.exists(new_abs):
+            # 文件本身已缺失 (悬空引用)，保留原路径交给 storage-gc 处理
+            return None
+        return _web_path(current_app.config['UPLOAD_FOLDER'], new_key)
+
+    @staticmethod
+    def shard_existing_stream(batch_size=500, dry_run=False):
+        """把平铺布局的历史文件迁移到分片目录，按主键分批改写 file_path / thumbnail_path。"""
+        if StorageService.is_cloud():
+            yield "ℹ️ 云存储模式无需迁移目录布局。"
+            return
+        if current_app.config.get('UPLOAD_SHARD_LEVELS', 2) <= 0:
+            yield "ℹ️ UPLOAD_SHARD_LEVELS=0，已配置为平铺布局，无需迁移。"
+            return
+
+        upload_root = _resolve_upload_dir(current_app.config['UPLOAD_FOLDER'])
+        yield f"🚚 [Storage] 开始迁移至分片目录{' (DRY-RUN)' if dry_run else ''}...\n"
+
+        for model, fields in ((Image, ('file_path', 'thumbnail_path')), (ReferenceImage, ('file_path',))):
+            moved = 0
+            last_id = 0
+            while True:
+                columns = [model.id] + [getattr(model, f) for f in fields]
+                rows = db.session.query(*columns).filter(model.id > last_id) \
+                    .order_by(model.id).limit(batch_size).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                touched = []
+
+                for row in rows:
+                    changes = {}
+                    for field, path in zip(fields, row[1:]):
+                        # 同一文件被多个字段引用时 (如 GIF 原图即缩略图)，第二次会命中"已迁移"分支
+                        new_path = StorageService._shard_one(path, upload_root, dry_run)
+                        if new_path:
+                            changes[field] = new_path
+                    if changes:
+                        moved += 1
+                        touched.append(row[0])
+                        if not dry_run:
+                            model.query.filter_by(id=row[0]).update(changes, synchronize_session=False)
+
+                if not dry_run:
+                    if model is ReferenceImage:
+                        touched = [r[0] for r in db.session.query(ReferenceImage.image_id)
+                                   .filter(ReferenceImage.id.in_(touched)).distinct()]
+                    ImageService.bump_row_versions(touched)
+                    db.session.commit()
+                yield f"   {model.__name__}: 已处理至 id={last_id}，迁移 {moved} 条\n"
+
+        yield "\n🎉 迁移完成" if not dry_run else "\n✅ DRY-RUN 完成，未做任何修改。"
@@ -0,0 +1,222 @@
+"""
+标签维护：批量解析、多标签筛选、重命名、合并与僵尸标签清理
+
+全部以集合 SQL 完成，不遍历 tag.images；由调用方统一提交事务。
+"""
+from sqlalchemy import and_, case, delete, distinct, exists, false, func, insert, literal, select, update
+
+from extensions import db
+from models import Image, Tag, image_tags
+from services.database_service import chunked
+from services.stats_service import StatsService, TAGS_KEY
+
+
+def split_tag_names(raw):
+    """解析逗号分隔 (兼容中文逗号) 的标签字符串或列表，去空白、去重并保持顺序"""
+    if isinstance(raw, str):
+        raw = raw.replace('，', ',').split(',')
+    return list(dict.fromkeys(t.strip() for t in (raw or []) if t and t.strip()))
+
+
+def parse_tag_expression(raw):
+    """
+    解析多标签筛选表达式，返回 (required, excluded)：
+    - 逗号分隔的各项取交集 (AND)，如 `风景,日落`
+    - 项内 `|` 分隔取并集 (OR)，如 `风景|城市`
+    - `-` 开头的项为排除 (NOT)，如 `风景,-夜景`
+    required 为各 OR 组的名称列表，excluded 为排除的名称列表
+    """
+    required, excluded = [], []
+    for term in (raw or '').replace('，', ',').split(','):
+        term = term.strip()
+        if term.startswith('-'):
+            name = term[1:].strip()
+            if name and name not in excluded:
+                excluded.append(name)
+            continue
+        names = list(dict.fromkeys(n.strip() for n in term.split('|') if n.strip()))
+        if names and names not in required:
+            required.append(names)
+    return required, excluded
+
+
+def _insert_ignore(rows):
+    """按方言构造“冲突即跳过”的批量插入：并发创建同名标签时不会因唯一约束失败"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        return dialect_insert(Tag).values(rows).on_conflict_do_nothing(index_elements=['name'])
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        return dialect_insert(Tag).values(rows).on_conflict_do_nothing(index_elements=['name'])
+    if dialect in ('mysql', 'mariadb'):
+        return insert(Tag).values(rows).prefix_with('IGNORE')
+    return None
+
+
+class TagService:
+    @staticmethod
+    def resolve(names):
+        """
+        把标签名解析为 Tag 对象 (按输入顺序)，缺失的自动创建。
+        已有标签一次 IN 查询取回 (name 有唯一索引)；
+        缺失的名称用一条 INSERT ... ON CONFLICT DO NOTHING / INSERT IGNORE 创建后再查一次。
+        """
+        names = split_tag_names(names)
+        if not names:
+            return []
+
+        found = {t.name: t for t in Tag.query.filter(Tag.name.in_(names))}
+        missing = [n for n in names if n not in found]
+        if missing:
+            TagService._create(missing)
+            # 加共享锁读取，确保能看到并发事务刚提交的同名标签
+            found.update((t.name, t) for t in Tag.query.filter(Tag.name.in_(missing)).with_for_update(read=True))
+
+        return [found[n] for n in names if n in found]
+
+    @staticmethod
+    def filter_clause(raw, image_id=None):
+        """
+        把多标签表达式编译为作品 id 的过滤条件，无有效条件时返回 None。
+        所有标签名一次 IN 查询解析为 id；必选部分在 image_tags 上按 image_id 分组，
+        HAVING COUNT(DISTINCT 组号) = 组数 一次判定全部 AND/OR 组，排除部分用 NOT EXISTS。
+        任一必选组的标签都不存在时返回恒假条件。
+        """
+        image_id = Image.id if image_id is None else image_id
+        raw = (raw or '').strip()
+        required, excluded = parse_tag_expression(raw)
+        names = {n for group in required for n in group} | set(excluded) | {raw}
+        ids = dict(db.session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+        # 兼容名称本身含 `|` 或以 `-` 开头的旧标签：整串恰为已有标签名时按单个标签处理
+        if raw in ids:
+            required, excluded = [[raw]], []
+
+        groups = []
+        for group in required:
+            group_ids = frozenset(ids[n] for n in group if n in ids)
+            if not group_ids:
+                return false()
+            groups.append(group_ids)
+        # 吸收律：某组是另一组的子集时，较大的组 (OR 更宽) 是冗余的
+        groups = [g for g in dict.fromkeys(groups) if not any(o < g for o in groups)]
+        excluded_ids = sorted({ids[n] for n in excluded if n in ids})
+
+        it = image_tags.c
+        clauses = []
+        if groups:
+            clauses.append(image_id.in_(TagService._grouped_match(groups)))
+        if excluded_ids:
+            clauses.append(~exists().where(it.image_id == image_id, it.tag_id.in_(excluded_ids)))
+        return and_(*clauses) if clauses else None
+
+    @staticmethod
+    def _grouped_match(groups):
+        """命中全部 OR 组的 image_id 子查询"""
+        it = image_tags.c
+        all_ids = sorted(set().union(*groups))
+        stmt = select(it.image_id).where(it.tag_id.in_(all_ids))
+        if len(groups) == 1:
+            return stmt.distinct()
+        if sum(len(g) for g in groups) == len(all_ids):
+            # 各组互不相交：把 tag_id 映射为组号，一次分组判定
+            if all(len(g) == 1 for g in groups):
+                key = it.tag_id
+            else:
+                key = case(*((it.tag_id.in_(sorted(g)), i) for i, g in enumerate(groups)))
+            return stmt.group_by(it.image_id).having(func.count(distinct(key)) == len(groups))
+        # 组间有共享标签 (如 a|b,a|c)：组号不唯一，逐组取交集
+        for group in groups:
+            stmt = stmt.where(it.image_id.in_(select(it.image_id).where(it.tag_id.in_(sorted(group)))))
+        return stmt.distinct()
+
+    @staticmethod
+    def _create(names):
+        stmt = _insert_ignore([{'name': n, 'is_sensitive': False} for n in names])
+        if stmt is not None:
+            created = db.session.execute(stmt).rowcount
+        else:
+            # 其他数据库：逐个在保存点内插入，冲突则跳过
+            from sqlalchemy.exc import IntegrityError
+            created = 0
+            for name in names:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(Tag).values(name=name, is_sensitive=False))
+                    created += 1
+                except IntegrityError:
+                    pass
+        if created > 0:
+            StatsService.increment(TAGS_KEY, created)
+
+    @staticmethod
+    def rename_or_merge(tag, new_name):
+        """
+        重命名标签；目标名称已存在时合并到该标签。
+        返回合并目标 Tag (合并时) 或 None (仅重命名)。
+        """
+        existing = Tag.query.filter(Tag.name == new_name, Tag.id != tag.id).first()
+        if existing:
+            TagService.merge(tag.id, existing.id)
+            return existing
+
+        # 标签名出现在作品序列化结果中，递增关联作品的 row_version
+        TagService._bump_tagged_images(tag.id)
+        db.session.execute(
+            update(Tag).where(Tag.id == tag.id).values(name=new_name)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(tag)
+        return None
+
+    @staticmethod
+    def merge(source_id, target_id):
+        """
+        把 source 标签的作品关联并入 target：
+        INSERT ... SELECT 补齐 target 尚未关联的作品 (去重)，再一次删除 source 的关联与标签本身。
+        """
+        TagService._bump_tagged_images(source_id)
+
+        src = image_tags.alias('src')
+        dup = image_tags.alias('dup')
+        db.session.execute(
+            insert(image_tags).from_select(
+                ['image_id', 'tag_id'],
+                select(src.c.image_id, literal(target_id)).distinct()
+                .where(src.c.tag_id == source_id)
+                .where(~exists().where(and_(dup.c.tag_id == target_id, dup.c.image_id == src.c.image_id))),
+            )
+        )
+        db.session.execute(delete(image_tags).where(image_tags.c.tag_id == source_id))
+        db.session.execute(delete(Tag).where(Tag.id == source_id).execution_options(synchronize_session=False))
+        StatsService.mark_stale()
+        source = db.session.identity_map.get(db.session.identity_key(Tag, source_id))
+        if source is not None:
+            db.session.expunge(source)
+
+    @staticmethod
+    def delete_orphans(tag_ids):
+        """只检查给定的标签，删除已无作品关联的，返回删除数量"""
+        tag_ids = [i for i in dict.fromkeys(tag_ids) if i]
+        if not tag_ids:
+            return 0
+        db.session.flush()
+        removed = 0
+        for chunk in chunked(tag_ids):
+            removed += db.session.execute(
+                delete(Tag)
+                .where(Tag.id.in_(chunk), ~exists().where(image_tags.c.tag_id == Tag.id))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        if removed:
+            StatsService.mark_stale()
+        return removed
+
+    @staticmethod
+    def _bump_tagged_images(tag_id):
+        db.session.execute(
+            update(Image)
+            .where(Image.id.in_(select(image_tags.c.image_id).where(image_tags.c.tag_id == tag_id)))
+            .values(row_version=Image.row_version + 1)
+            .execution_options(synchronize_session=False)
+        )
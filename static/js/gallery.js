@@ -1,6 +1,6 @@
 /**
  * static/js/gallery.js
- * 画廊页面核心交互逻辑：详情弹窗、变量解析、交互式Prompt、统计打点。
+ * 画廊页面核心交互逻辑：详情弹窗、变量解析、交互式Prompt、统计打点、无限滚动。
  */
 
 // --- Global State for Prompt Variables ---
@@ -10,12 +10,36 @@ window.currentImgId = null;
 
 // --- Detail Modal Logic ---
 
+// 卡片只携带 id，详情 (Prompt、描述、参考图等) 在打开时按需拉取并缓存
+const detailCache = new Map();
+
+function fetchDetail(id, url) {
+    if (detailCache.has(id)) return Promise.resolve(detailCache.get(id));
+    return fetch(url, { headers: { 'Accept': 'application/json' } })
+        .then(resp => {
+            if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+            return resp.json();
+        })
+        .then(body => {
+            detailCache.set(id, body.data);
+            return body.data;
+        });
+}
+
 window.showDetail = function(el) {
-    try {
-        const scriptTag = el.querySelector('.img-data');
-        if (!scriptTag) return;
-        const data = JSON.parse(scriptTag.textContent);
+    const id = el.dataset.id;
+    // 接口地址由模板 url_for 生成，带上应用的 URL 前缀
+    const url = el.dataset.detailUrl;
+    if (!id || !url) return;
+    if (typeof NProgress !== 'undefined') NProgress.start();
+    fetchDetail(id, url)
+        .then(renderDetail)
+        .catch(e => console.error("Detail Error:", e))
+        .finally(() => { if (typeof NProgress !== 'undefined') NProgress.done(); });
+}
 
+function renderDetail(data) {
+    try {
         // 1. 基础信息渲染
         const modalImg = document.getElementById('modalImg');
         const modalVideo = document.getElementById('modalVideo');
@@ -253,6 +277,57 @@ function renderOtherDetails(data) {
     }
 }
 
+// --- Infinite Scroll ---
+
+// 滚动到底部附近时按游标拉取下一批卡片并追加；分页导航保留为无 JS 时的回退
+(function initInfiniteScroll() {
+    const sentinel = document.getElementById('gallery-sentinel');
+    const grid = document.querySelector('.gallery-masonry');
+    if (!sentinel || !grid || !('IntersectionObserver' in window)) return;
+
+    const pager = document.querySelector('.pagination-container');
+    if (pager) pager.classList.add('d-none');
+
+    let loading = false;
+    const observer = new IntersectionObserver(entries => {
+        if (loading || !entries.some(e => e.isIntersecting)) return;
+        const url = sentinel.dataset.nextUrl;
+        if (!url) return;
+
+        loading = true;
+        fetch(url, { headers: { 'Accept': 'text/html' } })
+            .then(resp => {
+                if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+                sentinel.dataset.nextUrl = resp.headers.get('X-Next-Url') || '';
+                return resp.text();
+            })
+            .then(html => {
+                grid.insertAdjacentHTML('beforeend', html);
+                if (!sentinel.dataset.nextUrl) {
+                    observer.disconnect();
+                    sentinel.remove();
+                }
+            })
+            .catch(e => {
+                // 出错时恢复分页导航，由用户手动翻页
+                console.error("Load More Error:", e);
+                observer.disconnect();
+                sentinel.remove();
+                if (pager) pager.classList.remove('d-none');
+            })
+            .finally(() => {
+                loading = false;
+                // 追加后哨兵可能仍在视口内，重新观察以触发下一次回调
+                if (sentinel.isConnected && sentinel.dataset.nextUrl) {
+                    observer.unobserve(sentinel);
+                    observer.observe(sentinel);
+                }
+            });
+    }, { rootMargin: '800px 0px' });
+
+    observer.observe(sentinel);
+})();
+
 // --- Variable Update Logic ---
 
 /**
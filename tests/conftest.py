@@ -1,12 +1,20 @@
 import io
 import os
 import tempfile
+from contextlib import contextmanager
 
 import pytest
 from PIL import Image as PilImage
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash
 
-from config import Config
+# 导入 app 模块会创建默认应用：运行时文件 (数据库、SECRET_KEY、限流计数、日志) 写到临时目录，不落在仓库里
+_RUNTIME_DIR = tempfile.mkdtemp(prefix='prompt-manager-tests-')
+os.environ.setdefault('INSTANCE_PATH', os.path.join(_RUNTIME_DIR, 'instance'))
+os.environ.setdefault('LOG_DIR', os.path.join(_RUNTIME_DIR, 'logs'))
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+
+from config import Config  # noqa: E402
 
 
 def make_test_config(tmp_path, **overrides):
@@ -17,10 +25,12 @@ def make_test_config(tmp_path, **overrides):
         TESTING = True
         WTF_CSRF_ENABLED = False
         RATELIMIT_ENABLED = False
+        DELETION_WORKER_ENABLED = False
         USE_LOCAL_RESOURCES = False
         STORAGE_TYPE = 'local'
         API_UPLOAD_TOKEN = ''
         UPLOAD_FOLDER = upload_dir
+        METRICS_DB_PATH = os.path.join(str(tmp_path), 'metrics.db')
         SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(str(tmp_path), 'test.sqlite')}"
         SQLALCHEMY_TRACK_MODIFICATIONS = False
 
@@ -43,6 +53,40 @@ def app(tmp_path):
     yield application
 
 
+@pytest.fixture
+def max_queries(app):
+    """
+    SQL 预算断言：with max_queries(5): client.get('/')
+    块内该应用所有引擎执行的语句超过 n 条时失败，并列出语句 (含疑似 N+1 的重复形状)
+    """
+    from extensions import db
+    from services.database_service import QueryStats, statement_shape
+
+    @contextmanager
+    def budget(n):
+        stats = QueryStats()
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            stats.count += 1
+            stats.statements[statement] += 1
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'after_cursor_execute', record)
+        try:
+            yield stats
+        finally:
+            for engine in engines:
+                event.remove(engine, 'after_cursor_execute', record)
+        if stats.count > n:
+            repeated = ''.join(f'\n  {k} x {shape}' for shape, k in stats.repeated_shapes(2))
+            listed = ''.join(f'\n  {k} x {statement_shape(s)}' for s, k in stats.statements.most_common())
+            pytest.fail(f'{stats.count} SQL statements, budget {n}.'
+                        f'{" Repeated shapes:" + repeated if repeated else ""}\nStatements:{listed}')
+    return budget
+
+
 @pytest.fixture
 def client(app):
     return app.test_client()
@@ -0,0 +1,218 @@
+"""后台管理：审核队列分页与筛选。"""
+import re
+from datetime import datetime, timedelta
+
+from models import Image
+
+
+def _add_pending(app, count, **kwargs):
+    from extensions import db
+    base = datetime(2025, 1, 1)
+    with app.app_context():
+        for i in range(count):
+            db.session.add(Image(title=kwargs.get('title', 'p') + str(i), file_path=f'/x/p{i}.png',
+                                 status='pending', category=kwargs.get('category', 'gallery'),
+                                 media_type=kwargs.get('media_type', 'image'),
+                                 created_at=base + timedelta(minutes=i)))
+        db.session.commit()
+
+
+def _card_titles(html):
+    return re.findall(r'<h5 class="fw-bold mb-0 text-truncate pe-2">([^<]+)</h5>', html)
+
+
+def test_pending_queue_is_keyset_paginated(app, auth_client):
+    per_page = app.config['ADMIN_PER_PAGE']
+    _add_pending(app, per_page + 3)
+
+    html = auth_client.get('/admin/?tab=pending').get_data(as_text=True)
+    first = _card_titles(html)
+    assert first == [f'p{i}' for i in range(per_page)]  # 先到先审
+    assert f'Queue ({per_page + 3})' in html
+
+    after = re.search(r'after=([\w-]+)', html).group(1)
+    html = auth_client.get(f'/admin/?tab=pending&after={after}').get_data(as_text=True)
+    assert _card_titles(html) == [f'p{i}' for i in range(per_page, per_page + 3)]
+    # 最后一页：下一页按钮禁用
+    assert re.search(r'page-link-item disabled"\s*href="[^"]*"\s*title="下一页"', html)
+
+
+def test_pending_queue_filters(app, auth_client):
+    _add_pending(app, 2, title='g', category='gallery')
+    _add_pending(app, 1, title='t', category='template', media_type='video')
+
+    html = auth_client.get('/admin/?tab=pending&pcat=template').get_data(as_text=True)
+    assert _card_titles(html) == ['t0']
+    html = auth_client.get('/admin/?tab=pending&pmedia=image').get_data(as_text=True)
+    assert _card_titles(html) == ['g0', 'g1']
+
+
+def test_stats_counters_track_changes_without_rescan(app, auth_client):
+    from extensions import db
+    from models import Tag, StatCounter
+    from services.stats_service import StatsService
+
+    _add_pending(app, 2, title='s')
+    stats = auth_client.get('/admin/stats').get_json()['data']  # 首次读取时建立计数器
+    assert stats['total_images'] == 2 and stats['pending'] == 2
+
+    with app.app_context():
+        img = Image.query.filter_by(title='s0').first()
+        img.status = 'approved'
+        img.category = 'template'
+        img.tags.append(Tag(name='计数'))
+        db.session.delete(Image.query.filter_by(title='s1').first())
+        db.session.commit()
+        assert not db.session.get(StatCounter, 'stats:stale').value  # 增量维护，未触发重算
+
+        stats = StatsService.get_stats()
+        assert stats['total_images'] == 1
+        assert stats['pending'] == 0
+        assert stats['approved_by_category'] == {'template': 1}
+        assert stats['by_media_type'] == {'image': 1}
+        assert stats['total_tags'] == 1
+
+    # 批量 SQL 更新标记过期，下次读取重算
+    _add_pending(app, 1, title='b')
+    auth_client.post('/admin/approve-all')
+    stats = auth_client.get('/admin/stats').get_json()['data']
+    assert stats['approved'] == 2 and stats['pending'] == 0
+
+
+def test_bulk_moderation_actions(app, auth_client):
+    from extensions import db
+    from models import Tag, ReferenceImage, PendingDeletion
+
+    _add_pending(app, 3, title='k')
+    with app.app_context():
+        ids = [i.id for i in Image.query.order_by(Image.id)]
+        img = db.session.get(Image, ids[2])
+        img.tags.append(Tag(name='旧'))
+        img.refs.append(ReferenceImage(file_path='/x/ref.png', position=0))
+        db.session.commit()
+
+    def bulk(**payload):
+        resp = auth_client.post('/admin/bulk', json=payload)
+        return resp.status_code, resp.get_json()
+
+    code, body = bulk(action='approve', ids=ids[:2])
+    assert code == 200 and body['data']['affected'] == 2
+
+    code, body = bulk(action='recategorize', filter={'status': 'approved'}, category='template')
+    assert body['data']['matched'] == 2
+
+    code, body = bulk(action='add_tags', ids=ids, tags='新,旧')
+    assert body['data']['affected'] == 5  # ids[2] 已有 "旧"，跳过
+
+    code, body = bulk(action='remove_tags', filter={'tag': '新'}, tags=['新'])
+    assert body['data']['affected'] == 3
+
+    code, body = bulk(action='delete', ids=[ids[2], 99999])
+    assert body['data'] == {'action': 'delete', 'matched': 1, 'affected': 1}
+
+    with app.app_context():
+        rows = {i.id: i for i in Image.query}
+        assert set(rows) == set(ids[:2])
+        assert all(i.status == 'approved' and i.category == 'template' for i in rows.values())
+        assert [t.name for t in rows[ids[0]].tags] == ['旧']
+        assert Tag.query.filter_by(name='新').first() is None  # 无关联的标签被清理
+        assert ReferenceImage.query.count() == 0
+        assert {p.path for p in PendingDeletion.query} == {'/x/p2.png', '/x/ref.png'}
+
+    assert bulk(action='approve')[0] == 400  # 未提供 ids/filter
+    assert bulk(action='recategorize', ids=ids, category='bad')[0] == 400
+    assert bulk(action='approve', filter={'evil': 1})[0] == 400
+
+
+def test_tag_merge_and_rename_are_set_based(app, auth_client):
+    from extensions import db
+    from models import Tag
+    from services.image_service import ImageService
+
+    with app.app_context():
+        a, b, keep = Tag(name='a'), Tag(name='b'), Tag(name='keep')
+        db.session.add_all([
+            Image(title='i1', file_path='/x/1.png', status='approved', tags=[a]),
+            Image(title='i2', file_path='/x/2.png', status='approved', tags=[a, b]),
+            Image(title='i3', file_path='/x/3.png', status='approved', tags=[b, keep]),
+        ])
+        db.session.commit()
+        a_id, b_id = a.id, b.id
+        versions = {i.title: i.row_version for i in Image.query}
+
+    # a 合并进 b：i2 已有 b，不产生重复关联；a 被删除
+    auth_client.post('/admin/tag/update', json={'tag_id': a_id, 'new_name': 'b', 'is_sensitive': False})
+    with app.app_context():
+        assert db.session.get(Tag, a_id) is None
+        assert sorted(i.title for i in db.session.get(Tag, b_id).images) == ['i1', 'i2', 'i3']
+        assert db.session.execute(db.text('SELECT COUNT(*) FROM image_tags WHERE tag_id = :t'),
+                                  {'t': b_id}).scalar() == 3
+        bumped = {i.title: i.row_version for i in Image.query}
+        assert bumped['i1'] > versions['i1'] and bumped['i2'] > versions['i2']
+
+    # 纯重命名
+    auth_client.post('/admin/tag/update', json={'tag_id': b_id, 'new_name': 'c', 'is_sensitive': False})
+    with app.app_context():
+        assert db.session.get(Tag, b_id).name == 'c'
+
+        # 编辑作品移除标签时只清理被移除且已无关联的标签
+        i3 = Image.query.filter_by(title='i3').first()
+        ImageService.update_image(i3.id, {'title': 'i3', 'status': 'approved', 'tags': 'c'})
+        assert Tag.query.filter_by(name='keep').first() is None
+        assert Tag.query.filter_by(name='c').first() is not None
+
+
+def test_dashboard_and_tag_update_query_budgets(app, auth_client, max_queries):
+    from extensions import db
+    from models import Tag
+
+    _add_pending(app, 12)
+    with app.app_context():
+        a, b = Tag(name='a'), Tag(name='b')
+        db.session.add_all(Image(title=f'i{i}', file_path=f'/x/{i}.png', status='approved', tags=[a, b])
+                           for i in range(12))
+        db.session.commit()
+        a_id = a.id
+
+    auth_client.get('/admin/')  # 首次访问重算过期的统计计数
+    with max_queries(5):
+        assert auth_client.get('/admin/').status_code == 200
+    with max_queries(8):
+        assert auth_client.post('/admin/tag/update', json={'tag_id': a_id, 'new_name': 'b',
+                                                           'is_sensitive': False}).status_code == 200
+
+
+def test_approve_all_is_one_set_based_update(app, auth_client, max_queries):
+    _add_pending(app, 30)
+    with max_queries(10) as stats:
+        auth_client.post('/admin/approve-all')
+    # 不把命中的 id 取回 Python，也不按 id 分块
+    statements = [s.lstrip().upper() for s in stats.statements]
+    assert not any(s.startswith('SELECT IMAGE.ID') for s in statements)
+    assert sum(1 for s in statements if s.startswith('UPDATE IMAGE')) == 1
+    with app.app_context():
+        assert Image.query.filter_by(status='pending').count() == 0
+
+
+def test_noop_moderation_keeps_stats_fresh(app, auth_client):
+    from models import StatCounter
+    from services.stats_service import STALE_KEY
+
+    def stale():
+        with app.app_context():
+            row = StatCounter.query.filter_by(key=STALE_KEY).first()
+            return bool(row and row.value)
+
+    _add_pending(app, 2)
+    auth_client.post('/admin/bulk', json={'action': 'approve', 'filter': {'status': 'pending'}})
+    auth_client.get('/admin/')  # 重算计数
+    assert not stale()
+
+    # 没有行被改变、或只增删标签时不触发全量重算
+    auth_client.post('/admin/approve-all')
+    auth_client.post('/admin/bulk', json={'action': 'approve', 'filter': {'category': 'gallery'}})
+    auth_client.post('/admin/bulk', json={'action': 'add_tags', 'filter': {'status': 'approved'}, 'tags': 'x'})
+    assert not stale()
+
+    auth_client.post('/admin/bulk', json={'action': 'reject', 'filter': {'category': 'gallery'}})
+    assert stale()
@@ -75,3 +75,205 @@ def test_413_returns_json_on_api(tmp_path, png_file):
                   content_type='multipart/form-data')
     assert resp.status_code == 413
     assert resp.get_json()['code'] == 413
+
+
+def test_gallery_cards_are_slim_and_detail_fetched_on_demand(app, client):
+    with app.app_context():
+        from extensions import db
+        db.session.add(Image(title='卡片', prompt='very long prompt ' * 50, description='desc',
+                             file_path='/x/a.png', media_type='image', status='approved', category='gallery'))
+        db.session.add(Image(title='待审', file_path='/x/b.png', status='pending', category='gallery'))
+        db.session.commit()
+        approved_id = Image.query.filter_by(title='卡片').first().id
+        pending_id = Image.query.filter_by(title='待审').first().id
+
+    html = client.get('/').get_data(as_text=True)
+    assert f'data-id="{approved_id}"' in html
+    assert 'very long prompt' not in html  # 卡片不再内联完整详情
+    # 详情接口地址由 url_for 生成，部署在子路径下时带上前缀
+    prefixed = client.get('/', base_url='http://localhost/pm').get_data(as_text=True)
+    assert f'data-detail-url="/pm/api/image/{approved_id}"' in prefixed
+
+    r1 = client.get(f'/api/image/{approved_id}')
+    assert r1.status_code == 200
+    assert r1.get_json()['data']['prompt'].startswith('very long prompt')
+    etag = r1.headers.get('ETag')
+    assert etag
+    assert client.get(f'/api/image/{approved_id}', headers={'If-None-Match': etag}).status_code == 304
+
+    # 未审核作品不可通过详情接口获取
+    assert client.get(f'/api/image/{pending_id}').status_code == 404
+
+
+def test_infinite_scroll_cursor_walks_all_cards_once(tmp_path):
+    import re
+    from datetime import datetime
+    from app import create_app
+    from extensions import db
+    from tests.conftest import make_test_config
+
+    application = create_app(make_test_config(tmp_path, ITEMS_PER_PAGE=2))
+    with application.app_context():
+        db.create_all()
+        same_time = datetime(2025, 1, 1, 12, 0, 0)  # 时间相同，依赖 id 兜底排序
+        for i in range(5):
+            db.session.add(Image(title=f'c{i}', file_path=f'/x/{i}.png', media_type='image',
+                                 status='approved', category='gallery', heat_score=i % 2,
+                                 created_at=same_time))
+        db.session.commit()
+    c = application.test_client()
+
+    for sort in ('date', 'hot'):
+        html = c.get(f'/?sort={sort}').get_data(as_text=True)
+        seen = [int(x) for x in re.findall(r'data-id="(\d+)"', html)]
+        next_url = re.search(r'data-next-url="([^"]+)"', html).group(1).replace('&amp;', '&')
+        while next_url:
+            resp = c.get(next_url)
+            assert resp.status_code == 200
+            seen += [int(x) for x in re.findall(r'data-id="(\d+)"', resp.get_data(as_text=True))]
+            next_url = resp.headers['X-Next-Url']
+        assert sorted(seen) == [1, 2, 3, 4, 5]
+        assert len(seen) == 5
+
+    # 非法游标退化为从头加载
+    assert c.get('/cards?cursor=@@@').status_code == 200
+
+
+def test_image_json_cache_invalidated_by_row_version(app, client):
+    from extensions import db
+    from models import Tag
+    from services.serialization_service import SerializationService
+
+    with app.app_context():
+        tag = Tag(name='旧标签')
+        img = Image(title='缓存', file_path='/x/c.png', media_type='image',
+                    status='approved', category='gallery', tags=[tag])
+        db.session.add(img)
+        db.session.commit()
+        img_id, version = img.id, img.row_version
+
+    assert client.get('/api/gallery').get_json()['data'][0]['title'] == '缓存'
+    client.get('/api/gallery')
+    with app.test_request_context():
+        assert SerializationService.stats()['hits'] >= 1
+
+    # 修改作品字段与标签名都会递增 row_version，缓存随之失效
+    with app.app_context():
+        img = db.session.get(Image, img_id)
+        img.title = '已改'
+        db.session.commit()
+        assert img.row_version == version + 1
+        Tag.query.filter_by(name='旧标签').first().name = '新标签'
+        db.session.commit()
+        assert db.session.get(Image, img_id).row_version == version + 2
+
+    data = client.get(f'/api/image/{img_id}').get_json()['data']
+    assert data['title'] == '已改'
+    assert data['tags'] == ['新标签']
+
+    # 统计上报只改计数，不递增 row_version；heat_score 仍输出最新值
+    client.post(f'/api/stats/copy/{img_id}')
+    with app.app_context():
+        assert db.session.get(Image, img_id).row_version == version + 2
+    assert client.get(f'/api/image/{img_id}').get_json()['data']['heat_score'] == 10
+
+
+def test_tag_rename_bumps_row_versions_without_loading_images(app, max_queries):
+    from extensions import db
+    from models import Tag
+
+    with app.app_context():
+        tag = Tag(name='热门')
+        db.session.add_all(Image(title=f'h{i}', file_path=f'/x/h{i}.png', tags=[tag]) for i in range(5))
+        db.session.commit()
+        tag_id = tag.id
+        db.session.remove()
+
+        tag = db.session.get(Tag, tag_id)
+        with max_queries(3) as stats:
+            tag.name = '更热门'
+            db.session.commit()
+        # 关联作品不被载入会话，版本号由一条集合 UPDATE 递增
+        assert not any(s.lstrip().upper().startswith('SELECT') for s in stats.statements)
+        assert {i.row_version for i in Image.query} == {2}
+
+
+def test_api_sparse_fieldsets(app, client):
+    from extensions import db
+    from models import Tag, ReferenceImage
+
+    with app.app_context():
+        img = Image(title='稀疏', prompt='long prompt', file_path='/x/s.png', thumbnail_path='/x/s_t.png',
+                    media_type='image', status='approved', category='template', tags=[Tag(name='t1')])
+        img.refs.append(ReferenceImage(file_path='/x/r.png', position=0))
+        db.session.add(img)
+        db.session.commit()
+
+    body = client.get('/api/templates?fields=title,thumbnail_path&per_page=1').get_json()
+    item = body['data'][0]
+    assert set(item) == {'id', 'title', 'thumbnail_path'}
+    assert item['thumbnail_path'].endswith('/x/s_t.png')
+
+    item = client.get('/api/templates?fields=tags,media_type').get_json()['data'][0]
+    assert item == {'id': item['id'], 'media_type': 'image', 'tags': ['t1']}
+
+    # 不带 fields 时输出保持完整
+    full = client.get('/api/templates').get_json()['data'][0]
+    assert full['prompt'] == 'long prompt' and len(full['refs']) == 1
+
+    resp = client.get('/api/templates?fields=title,secret')
+    assert resp.status_code == 400
+
+
+def test_multi_tag_boolean_filter(app, client):
+    from extensions import db
+    from models import Tag
+    from services.tag_service import TagService
+
+    layout = {'a': ['风景', '城市'], 'b': ['风景', '夜景'], 'c': ['城市'], 'd': ['风景', '城市', '夜景'],
+              'e': ['a|b']}
+    with app.app_context():
+        for title, names in layout.items():
+            img = Image(title=title, file_path=f'/x/{title}.png', media_type='image',
+                        status='approved', category='gallery')
+            img.tags.extend(TagService.resolve(names))
+            db.session.add(img)
+        db.session.commit()
+        assert Tag.query.count() == 4
+
+    def titles(expr):
+        resp = client.get('/api/gallery', query_string={'tag': expr, 'fields': 'title'})
+        assert resp.status_code == 200
+        return sorted(i['title'] for i in resp.get_json()['data'])
+
+    assert titles('风景') == ['a', 'b', 'd']
+    assert titles('风景,城市') == ['a', 'd']
+    assert titles('风景，城市,夜景') == ['d']
+    assert titles('城市|夜景') == ['a', 'b', 'c', 'd']
+    assert titles('风景,城市|夜景') == ['a', 'b', 'd']
+    assert titles('夜景|城市,夜景|风景') == ['a', 'b', 'd']
+    assert titles('风景,-夜景') == ['a']
+    assert titles('-风景') == ['c', 'e']
+    assert titles('风景,不存在') == []
+    assert titles('不存在|城市,-不存在') == ['a', 'c', 'd']
+    # 名称本身含 `|` 的旧标签仍可按原名筛选
+    assert titles('a|b') == ['e']
+
+    page = client.get('/', query_string={'tag': '风景,-夜景'}).get_data(as_text=True)
+    assert '/x/a.png' in page and '/x/b.png' not in page
+
+
+def test_gallery_list_query_budget_does_not_grow_with_page_size(app, client, max_queries):
+    from extensions import db
+    from models import Tag
+
+    with app.app_context():
+        tags = [Tag(name=f't{i}') for i in range(5)]
+        db.session.add_all(Image(title=f'q{i}', file_path=f'/x/q{i}.png', status='approved', tags=tags[:i % 5 + 1])
+                           for i in range(30))
+        db.session.commit()
+
+    with max_queries(4):
+        assert client.get('/api/gallery').status_code == 200
+    with max_queries(5):
+        assert client.get('/').status_code == 200
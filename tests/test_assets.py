@@ -0,0 +1,96 @@
+"""静态资源构建：哈希指纹、预压缩与长缓存；第三方资源清单与离线启动。"""
+import gzip
+import re
+
+from services.asset_service import AssetService, VENDOR_ASSETS
+
+
+def test_build_assets_and_serve_hashed_precompressed(app, client, tmp_path):
+    dist = tmp_path / 'dist'
+    app.config['ASSET_DIST_DIR'] = str(dist)
+    manifest = AssetService.build(app.static_folder, str(dist), app.static_url_path)
+    assert re.fullmatch(r'css/style\.[0-9a-f]{12}\.css', manifest['css/style.css'])
+    assert (dist / 'manifest.json').exists()
+
+    # 未加载 manifest 时模板回退到原始文件
+    assert '/static/css/style.css' in client.get('/').get_data(as_text=True)
+
+    app.extensions['asset_manifest'] = AssetService.load_manifest(app)
+    html = client.get('/').get_data(as_text=True)
+    hashed_url = f"/static/dist/{manifest['css/style.css']}"
+    assert hashed_url in html
+    assert f"/static/dist/{manifest['js/gallery.js']}" in html
+
+    plain = client.get(hashed_url, headers={'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200
+    assert plain.mimetype == 'text/css'
+    assert plain.cache_control.immutable and plain.cache_control.max_age == 31536000
+    # 已压缩：去掉注释后体积小于源文件
+    with open(f"{app.static_folder}/css/style.css", 'rb') as f:
+        assert len(plain.data) < len(f.read())
+
+    gz = client.get(hashed_url, headers={'Accept-Encoding': 'gzip'})
+    assert gz.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in gz.headers['Vary']
+    assert gzip.decompress(gz.data) == plain.data
+
+
+def test_css_relative_urls_rewritten(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'bootstrap-icons.min.css').write_text(
+        '@font-face{src:url("fonts/bootstrap-icons.woff2?abc") format("woff2"),url(data:font/woff;base64,AA)}')
+    manifest = AssetService.build(str(static), str(tmp_path / 'dist'), '/static')
+    built = (tmp_path / 'dist' / manifest['css/bootstrap-icons.min.css']).read_text()
+    assert 'url("/static/css/fonts/bootstrap-icons.woff2?abc")' in built
+    assert 'url(data:font/woff;base64,AA)' in built
+
+
+def test_startup_does_not_download_vendor_assets(tmp_path, monkeypatch):
+    import urllib.request
+    from app import create_app
+    from tests.conftest import make_test_config
+
+    def _no_network(*args, **kwargs):
+        raise AssertionError('network access during startup')
+
+    monkeypatch.setattr(urllib.request, 'urlopen', _no_network)
+    monkeypatch.setattr(urllib.request, 'urlretrieve', _no_network)
+    application = create_app(make_test_config(tmp_path, USE_LOCAL_RESOURCES=True))
+
+    missing = application.extensions['vendor_missing']
+    with application.test_request_context():
+        for rel_path in VENDOR_ASSETS:
+            if rel_path in missing:
+                assert AssetService.asset_url(rel_path) == VENDOR_ASSETS[rel_path]['url']
+            else:
+                assert AssetService.asset_url(rel_path) == f'/static/{rel_path}'
+
+
+def test_fetch_vendor_verifies_integrity(tmp_path, monkeypatch):
+    import io
+    import urllib.request
+    from services import asset_service
+
+    payloads = {spec['url']: f'/* {rel} */'.encode() for rel, spec in VENDOR_ASSETS.items()}
+    monkeypatch.setattr(urllib.request, 'urlopen',
+                        lambda req, timeout=None: io.BytesIO(payloads[req.full_url]))
+    css, unpinned = 'css/bootstrap.min.css', 'js/Sortable.min.js'
+    pinned = {rel: dict(spec, integrity=asset_service._integrity(payloads[spec['url']]))
+              for rel, spec in VENDOR_ASSETS.items()}
+    pinned[css]['integrity'] = asset_service._integrity(b'tampered')
+    pinned[unpinned]['integrity'] = ''
+    monkeypatch.setattr(asset_service, 'VENDOR_ASSETS', pinned)
+
+    results = {rel: (status, detail) for rel, status, detail in AssetService.fetch_vendor(str(tmp_path))}
+    assert results[css][0] == 'failed' and 'integrity mismatch' in results[css][1]
+    assert not (tmp_path / 'css' / 'bootstrap.min.css').exists()
+    # 未固定 integrity 的条目一律失败，不落盘
+    assert results[unpinned][0] == 'failed' and 'not pinned' in results[unpinned][1]
+    assert not (tmp_path / 'js' / 'Sortable.min.js').exists()
+    assert results['js/nprogress.min.js'] == ('downloaded', asset_service._integrity(b'/* js/nprogress.min.js */'))
+    assert (tmp_path / 'js' / 'nprogress.min.js').read_bytes() == b'/* js/nprogress.min.js */'
+
+    # 再次执行：已存在且无需更新的文件不重复下载
+    again = {rel: status for rel, status, _ in AssetService.fetch_vendor(str(tmp_path))}
+    assert again['js/nprogress.min.js'] == 'present'
@@ -0,0 +1,164 @@
+"""数据库引擎：SQLite PRAGMA、连接池参数。"""
+from sqlalchemy import text
+
+from services.database_service import SQLITE_PRAGMA_KEYS, DatabaseService
+
+
+def test_sqlite_pragmas_applied_to_every_connection(app):
+    from extensions import db
+
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+            assert conn.execute(text('PRAGMA cache_size')).scalar() == -65536
+
+
+def test_pragmas_can_be_disabled_and_pool_options_for_server_databases():
+    config = {'SQLITE_JOURNAL_MODE': '', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'SQLITE_BUSY_TIMEOUT_MS': '0',
+              'SQLITE_MMAP_SIZE': 0, 'SQLITE_CACHE_SIZE': '-2000',
+              'DB_POOL_SIZE': 5, 'DB_MAX_OVERFLOW': 1, 'DB_POOL_PRE_PING': True, 'DB_POOL_RECYCLE': 300}
+    assert DatabaseService.sqlite_pragmas(config) == [('synchronous', 'NORMAL'), ('cache_size', -2000)]
+    # 未配置取调优默认值；空值与 0 (含 cache_size) 均保持 SQLite 默认
+    assert DatabaseService.sqlite_pragmas({}) == [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'),
+                                                  ('busy_timeout', 5000), ('mmap_size', 268435456),
+                                                  ('cache_size', -65536)]
+    assert DatabaseService.sqlite_pragmas({key: '' for key, _, _ in SQLITE_PRAGMA_KEYS}) == []
+    assert DatabaseService.sqlite_pragmas({'SQLITE_CACHE_SIZE': '0', 'SQLITE_MMAP_SIZE': ''})[-1] == ('busy_timeout', 5000)
+
+    assert DatabaseService.pool_options(config, 'sqlite:////tmp/x.sqlite') == {}
+    options = DatabaseService.pool_options(config, 'postgresql://u@db/app')
+    assert options['pool_size'] == 5 and options['max_overflow'] == 1
+    assert options['pool_pre_ping'] is True and options['pool_recycle'] == 300
+
+
+def test_benchmark_reports_each_setting():
+    pragmas = [('journal_mode', 'WAL'), ('synchronous', 'NORMAL')]
+    results = DatabaseService.benchmark_sqlite(pragmas, rows=50, readers=1, duration=0.2)
+    assert [label for label, _ in results] == [
+        'driver defaults', 'journal_mode=WAL', 'synchronous=NORMAL', 'all configured']
+    assert all(r['writes_per_s'] > 0 and r['reads_per_s'] > 0 for _, r in results)
+
+
+def _replica_app(tmp_path):
+    """主库与副本各放一条标题不同的作品，响应内容即可看出查询落在哪个库"""
+    from sqlalchemy.orm import Session
+    from app import create_app
+    from tests.conftest import make_test_config
+    from extensions import db
+    from models import Image, User
+    from werkzeug.security import generate_password_hash
+
+    replica_uri = f"sqlite:///{tmp_path / 'replica.sqlite'}"
+    application = create_app(make_test_config(tmp_path, DB_REPLICA_URI=replica_uri))
+    with application.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica'])
+        db.session.add(User(username='admin', password_hash=generate_password_hash('secret')))
+        db.session.add(Image(title='on-primary', file_path='/x/p.png', status='approved'))
+        db.session.commit()
+        with Session(db.engines['replica']) as replica:
+            replica.add(Image(title='on-replica', file_path='/x/r.png', status='approved'))
+            replica.commit()
+    return application
+
+
+def _gallery_titles(client):
+    return [item['title'] for item in client.get('/api/gallery').get_json()['data']]
+
+
+def test_public_reads_use_replica_until_client_writes(tmp_path, png_file):
+    application = _replica_app(tmp_path)
+    client = application.test_client()
+    assert _gallery_titles(client) == ['on-replica']
+
+    # 计数类写入不需要读到自己，不影响后续读取
+    resp = client.post('/api/stats/view/1')
+    assert resp.status_code == 200 and 'db_primary' not in resp.headers.get('Set-Cookie', '')
+
+    # 上传写主库并下发粘滞 Cookie，之后该客户端读主库
+    resp = client.post('/api/upload', data={'title': 'new', 'prompt': 'p', 'image': png_file()},
+                       content_type='multipart/form-data')
+    assert resp.status_code == 201
+    assert 'db_primary=1' in resp.headers['Set-Cookie']
+    assert 'on-primary' in _gallery_titles(client)
+
+    # 其他客户端不受影响
+    assert _gallery_titles(application.test_client()) == ['on-replica']
+
+
+def test_admin_reads_primary(tmp_path):
+    application = _replica_app(tmp_path)
+    client = application.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'secret'})
+    assert _gallery_titles(client) == ['on-primary']
+
+
+def test_text_dml_on_replica_request_goes_to_primary(tmp_path):
+    from flask import g
+    from extensions import db
+
+    application = _replica_app(tmp_path)
+    with application.test_request_context('/api/gallery'):
+        g.db_replica = True
+        # 原生 SQL 无法确认只读，走主库
+        db.session.execute(text("UPDATE image SET title = 'renamed' WHERE title = 'on-primary'"))
+        db.session.commit()
+        assert g.db_wrote
+    with application.app_context():
+        assert db.session.execute(text('SELECT title FROM image')).scalars().all() == ['renamed']
+
+
+def test_reset_worker_state_gives_fork_fresh_pools_and_caches(app, client):
+    from app import reset_worker_state
+    from extensions import db
+
+    client.get('/api/gallery')
+    with app.app_context():
+        pool = db.engine.pool
+    app.extensions.setdefault('image_json_cache', {})['x'] = 1
+
+    reset_worker_state(app)
+    with app.app_context():
+        assert db.engine.pool is not pool
+    assert 'image_json_cache' not in app.extensions
+    assert client.get('/api/gallery').status_code == 200
+
+
+def test_gunicorn_config_reads_environment(monkeypatch):
+    import runpy
+    monkeypatch.setenv('GUNICORN_WORKERS', '6')
+    monkeypatch.setenv('GUNICORN_MAX_REQUESTS', '500')
+    conf = runpy.run_path('gunicorn.conf.py')
+    assert conf['workers'] == 6 and conf['worker_class'] == 'gthread'
+    assert conf['preload_app'] is True
+    assert conf['max_requests'] == 500 and conf['max_requests_jitter'] == 100
+    assert callable(conf['post_fork'])
+
+
+def test_slow_queries_and_repeated_statements_are_logged(tmp_path, caplog):
+    from app import create_app
+    from tests.conftest import make_test_config
+    from extensions import db
+    from models import Image
+
+    application = create_app(make_test_config(tmp_path, SQL_SLOW_QUERY_MS=1, SQL_N_PLUS_ONE_THRESHOLD=5))
+
+    def n_plus_one():
+        for i in range(6):
+            db.session.get(Image, i)
+        db.session.execute(text('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 300000) '
+                                'SELECT count(*) FROM c')).scalar()
+        return 'ok'
+
+    application.add_url_rule('/n-plus-one', 'n_plus_one', n_plus_one)
+    with application.app_context():
+        db.create_all()
+
+    caplog.set_level('WARNING')
+    application.test_client().get('/n-plus-one')
+    messages = [r.getMessage() for r in caplog.records]
+    assert any(m.startswith('Slow query') and '[n_plus_one]' in m and 'WITH RECURSIVE' in m for m in messages)
+    n_plus_one_logs = [m for m in messages if m.startswith('Probable N+1 in n_plus_one')]
+    assert len(n_plus_one_logs) == 1 and '6 x SELECT image.id' in n_plus_one_logs[0]
@@ -0,0 +1,63 @@
+"""本地媒体分发：immutable 缓存、Range 请求与代理卸载。"""
+from models import Image
+
+
+def _upload_and_get_path(app, client, png_file):
+    stream, name = png_file()
+    client.post('/upload', data={'title': 't', 'prompt': 'p', 'image': (stream, name)},
+                content_type='multipart/form-data')
+    with app.app_context():
+        return Image.query.first().file_path
+
+
+def test_upload_served_with_immutable_cache(app, client, png_file):
+    path = _upload_and_get_path(app, client, png_file)
+    resp = client.get(path)
+    assert resp.status_code == 200
+    assert resp.mimetype == 'image/png'
+    assert resp.cache_control.immutable
+    assert resp.cache_control.max_age == app.config['MEDIA_CACHE_MAX_AGE']
+
+
+def test_upload_range_request_returns_partial_content(app, client, png_file):
+    path = _upload_and_get_path(app, client, png_file)
+    full = client.get(path).data
+    resp = client.get(path, headers={'Range': 'bytes=0-9'})
+    assert resp.status_code == 206
+    assert resp.data == full[:10]
+    assert resp.headers['Content-Range'].startswith('bytes 0-9/')
+
+
+def test_upload_offloaded_via_x_accel_redirect(app, client, png_file):
+    path = _upload_and_get_path(app, client, png_file)
+    app.config['MEDIA_OFFLOAD'] = 'x-accel-redirect'
+    resp = client.get(path)
+    assert resp.status_code == 200
+    assert resp.data == b''
+    relative = path[len(app.config['UPLOAD_FOLDER']) + 1:]
+    assert resp.headers['X-Accel-Redirect'] == f"/_protected_uploads/{relative}"
+    assert resp.cache_control.immutable
+
+
+def test_x_accel_redirect_quotes_filename(app, client):
+    import os
+    from urllib.parse import quote
+    from utils import _resolve_upload_dir
+
+    name = '导入 图片 #1 50%?.png'
+    upload_root = _resolve_upload_dir(app.config['UPLOAD_FOLDER'])
+    os.makedirs(os.path.join(upload_root, 'old'), exist_ok=True)
+    with open(os.path.join(upload_root, 'old', name), 'wb') as f:
+        f.write(b'x')
+    app.config['MEDIA_OFFLOAD'] = 'x-accel-redirect'
+
+    resp = client.get(f"{app.config['UPLOAD_FOLDER']}/old/{quote(name)}")
+    assert resp.status_code == 200
+    assert resp.headers['X-Accel-Redirect'] == (
+        '/_protected_uploads/old/%E5%AF%BC%E5%85%A5%20%E5%9B%BE%E7%89%87%20%231%2050%25%3F.png')
+
+
+def test_upload_path_traversal_rejected(app, client):
+    folder = app.config['UPLOAD_FOLDER']
+    assert client.get(f"{folder}/../test.sqlite").status_code == 404
+    assert client.get(f"{folder}/missing.png").status_code == 404
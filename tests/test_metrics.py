@@ -0,0 +1,60 @@
+"""运行时指标：/metrics 鉴权、请求与 SQL 统计、多进程汇总。"""
+from tests.conftest import make_test_config
+
+TOKEN = {'Authorization': 'Bearer scrape-me'}
+
+
+def _metrics_app(tmp_path, **overrides):
+    from app import create_app
+    from extensions import db
+
+    application = create_app(make_test_config(tmp_path, METRICS_TOKEN='scrape-me', **overrides))
+    with application.app_context():
+        db.create_all()
+    return application
+
+
+def test_metrics_requires_token(client, tmp_path):
+    # 未配置令牌时不开放
+    assert client.get('/metrics').status_code == 404
+
+    c = _metrics_app(tmp_path).test_client()
+    assert c.get('/metrics').status_code == 401
+    assert c.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert c.get('/metrics', headers=TOKEN).status_code == 200
+
+
+def test_metrics_cover_requests_queries_media_and_caches(tmp_path, png_file):
+    from extensions import db
+    from models import Image
+
+    application = _metrics_app(tmp_path)
+    c = application.test_client()
+    assert c.post('/api/upload', data={'title': 't', 'prompt': 'p', 'tags': 'a,b', 'image': png_file()},
+                  content_type='multipart/form-data').status_code == 201
+    with application.app_context():
+        Image.query.one().status = 'approved'
+        db.session.commit()
+    c.get('/api/gallery')
+    c.get('/api/gallery')
+
+    body = c.get('/metrics', headers=TOKEN).get_data(as_text=True)
+    assert 'prompt_manager_http_request_duration_seconds_count{endpoint="public.api_upload",method="POST"} 1' in body
+    assert 'prompt_manager_http_request_duration_seconds_bucket{endpoint="public.api_gallery_list",method="GET",le="+Inf"} 2' in body
+    assert 'prompt_manager_db_queries_per_request_sum{endpoint="public.api_gallery_list"}' in body
+    assert 'prompt_manager_media_processing_seconds_count{media_type="image"} 1' in body
+    assert 'prompt_manager_cache_lookups_total{cache="image_json",result="hit"} 1' in body
+
+
+def test_metrics_aggregate_across_processes(tmp_path):
+    from services.metrics_service import MetricsService, _Registry
+
+    application = _metrics_app(tmp_path)
+    # 另一个 worker 写入同一文件的增量
+    other = _Registry(application.config['METRICS_DB_PATH'], 5)
+    other.add(('transfer_items_total', 'direction="export",result="processed"', ''), 3)
+    other.flush()
+    with application.app_context():
+        MetricsService.inc('transfer_items_total', 4, direction='export', result='processed')
+        body = MetricsService.render()
+    assert 'prompt_manager_transfer_items_total{direction="export",result="processed"} 7' in body
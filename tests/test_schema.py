@@ -0,0 +1,32 @@
+"""数据库结构指纹：模型变化与随代码发布的迁移脚本。"""
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+from services.schema_service import SchemaService
+
+
+def test_schema_fingerprint_tracks_model_changes(app):
+    with app.app_context():
+        assert SchemaService.stored_fingerprint() == ''
+        assert not SchemaService.is_current()
+        stored = SchemaService.store_fingerprint()
+        assert SchemaService.is_current()
+        assert stored == SchemaService.fingerprint()
+
+        def _meta(length):
+            meta = MetaData()
+            Table('t', meta, Column('id', Integer, primary_key=True), Column('name', String(length)))
+            return meta
+
+        assert SchemaService.fingerprint(_meta(10)) == SchemaService.fingerprint(_meta(10))
+        assert SchemaService.fingerprint(_meta(10)) != SchemaService.fingerprint(_meta(20))
+
+
+def test_schema_fingerprint_includes_shipped_migrations(app, tmp_path):
+    migrations = tmp_path / 'migrations'
+    (migrations / 'versions').mkdir(parents=True)
+    with app.app_context():
+        before = SchemaService.fingerprint(migrations_dir=str(migrations))
+        (migrations / 'versions' / '0001_baseline.py').write_text('')
+        (migrations / 'versions' / 'ab12_auto_update_1700000000.py').write_text('')
+        assert SchemaService.migration_files(str(migrations)) == ['0001_baseline.py']
+        assert SchemaService.fingerprint(migrations_dir=str(migrations)) != before
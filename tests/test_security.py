@@ -1,4 +1,6 @@
-"""安全与序列化回归：XSS 转义、to_dict 脱离请求上下文。"""
+"""安全与序列化回归：XSS 转义、to_dict 脱离请求上下文、多 worker 共享限流。"""
+import pytest
+
 from models import Image
 
 
@@ -29,8 +31,8 @@ def test_to_dict_prefixes_base_url(app):
         assert d['file_path'] == 'https://example.com/static/uploads/a.png'
 
 
-def test_xss_payload_is_escaped_in_inline_json(app, client):
-    """含 HTML 的 prompt/tag 内联进 <script> 时危险字符必须被转义。"""
+def test_xss_payload_is_escaped_in_gallery_page(app, client):
+    """含 HTML 的 prompt/tag 渲染到画廊页时危险字符必须被转义。"""
     with app.app_context():
         from extensions import db
         from services.image_service import ImageService
@@ -41,10 +43,66 @@ def test_xss_payload_is_escaped_in_inline_json(app, client):
         db.session.flush()
         ImageService._apply_tags(img, '<script>alert(1)</script>')
         db.session.commit()
+        img_id = img.id
 
     resp = client.get('/')
     html = resp.get_data(as_text=True)
-    # tojson 会把 < 转义成 <，原始 <img / <script> 不应出现在内联 JSON 中
     assert '<img src=x onerror' not in html
     assert '<script>alert(1)</script>' not in html
-    assert '\\u003c' in html  # 已被转义
+    assert '&lt;script&gt;' in html  # 卡片标签经 Jinja 自动转义
+
+    # 详情以 JSON 按需获取，由前端用 textContent 渲染
+    detail = client.get(f'/api/image/{img_id}').get_json()['data']
+    assert detail['prompt'] == '{{<img src=x onerror=alert(1)>}}'
+
+
+def test_sqlite_rate_limit_storage_is_shared_between_workers(tmp_path):
+    from limits import parse
+    from limits.storage import storage_from_string
+    from limits.strategies import MovingWindowRateLimiter
+    from services import ratelimit_storage
+
+    ratelimit_storage.register()
+    uri = f"sqlite:///{tmp_path / 'ratelimit.db'}"
+    # 两个独立的存储实例相当于两个 worker 进程
+    workers = [MovingWindowRateLimiter(storage_from_string(uri)) for _ in range(2)]
+    limit = parse('3 per minute')
+
+    assert [workers[i % 2].hit(limit, '1.2.3.4') for i in range(4)] == [True, True, True, False]
+    assert workers[1].hit(limit, '5.6.7.8')
+    assert workers[0].get_window_stats(limit, '1.2.3.4').remaining == 0
+
+
+def test_sqlite_rate_limit_storage_fixed_window_and_elastic_expiry(tmp_path):
+    from limits.storage import storage_from_string
+    from services import ratelimit_storage
+
+    ratelimit_storage.register()
+    storage = storage_from_string(f"sqlite:///{tmp_path / 'ratelimit.db'}")
+    assert storage.incr('k', 60) == 1
+    first_expiry = storage.get_expiry('k')
+    # limits 3.x 在 fixed-window-elastic-expiry 策略下传入 elastic_expiry
+    assert storage.incr('k', 120, elastic_expiry=True) == 2
+    assert storage.get_expiry('k') > first_expiry
+    assert storage.get('k') == 2
+
+
+def test_login_rate_limit_follows_hot_reloaded_setting(tmp_path):
+    from app import create_app
+    from extensions import db
+    from tests.conftest import make_test_config
+
+    application = create_app(make_test_config(
+        tmp_path, RATELIMIT_ENABLED=True, RATELIMIT_STORAGE_URI=f"sqlite:///{tmp_path / 'ratelimit.db'}"))
+    with application.app_context():
+        db.create_all()
+    c = application.test_client()
+
+    with application.app_context():
+        from services.config_service import ConfigService
+        ConfigService.set_login_rate_limit('2 per minute')
+        with pytest.raises(ValueError):
+            ConfigService.set_login_rate_limit('lots')
+
+    codes = [c.post('/login', data={'username': 'x', 'password': 'y'}).status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
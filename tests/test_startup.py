@@ -0,0 +1,61 @@
+"""Worker 启动：按需导入重依赖、importtime 解析与 Jinja 字节码缓存。"""
+
+
+def test_worker_boot_defers_pillow_and_boto3(monkeypatch, app):
+    from services.profile_service import ProfileService
+
+    monkeypatch.setenv('RATELIMIT_STORAGE_URI', 'memory://')
+    monkeypatch.setenv('SECRET_KEY', 'profile-test')
+    report = ProfileService.profile_startup(app.root_path)
+    assert report['boot_ms'] > 0
+    assert dict(report['packages']).get('flask', 0) > 0
+    assert report['lazy_loaded'] == []
+
+
+def test_parse_importtime_depth_and_package_totals():
+    from services.profile_service import parse_importtime, summarize_packages
+
+    sample = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       100 |        100 |   jinja2.utils',
+        'import time:       300 |        400 | jinja2',
+        'import time:      2000 |       2000 |     PIL.Image',
+    ])
+    rows = parse_importtime(sample)
+    assert rows[0] == ('jinja2.utils', 100, 100, 1)
+    assert rows[1][3] == 0 and rows[2][3] == 2
+    assert summarize_packages(rows) == [('PIL', 2.0), ('jinja2', 0.4)]
+
+
+def test_jinja_bytecode_cache_is_optional(tmp_path):
+    from app import create_app
+    from extensions import db
+    from tests.conftest import make_test_config
+
+    cache_dir = tmp_path / 'jinja_cache'
+    application = create_app(make_test_config(tmp_path, JINJA_BYTECODE_CACHE_DIR=str(cache_dir)))
+    with application.app_context():
+        db.create_all()
+    assert application.test_client().get('/').status_code == 200
+    assert any(cache_dir.iterdir())
+
+
+def test_config_import_has_no_filesystem_side_effects(tmp_path, monkeypatch):
+    import os
+    import subprocess
+    import sys
+    from app import create_app
+    from tests.conftest import make_test_config
+
+    instance = tmp_path / 'instance'
+    env = dict(os.environ, INSTANCE_PATH=str(instance), SECRET_KEY='')
+    subprocess.run([sys.executable, '-c', 'import config'], cwd=os.path.dirname(os.path.dirname(__file__)),
+                   env=env, check=True, capture_output=True)
+    assert not instance.exists()
+
+    # 目录与持久化密钥由 create_app 准备，再次启动复用同一密钥
+    monkeypatch.delenv('SECRET_KEY')
+    config = make_test_config(tmp_path, INSTANCE_PATH=str(instance), SECRET_KEY=None)
+    first = create_app(config).config['SECRET_KEY']
+    assert (instance / '.secret_key').read_text() == first
+    assert create_app(config).config['SECRET_KEY'] == first
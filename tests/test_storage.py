@@ -0,0 +1,201 @@
+"""云存储：S3 客户端进程级复用与 fork 后重建。"""
+import os
+
+import utils
+
+
+def _cloud_app(tmp_path):
+    from app import create_app
+    from tests.conftest import make_test_config
+
+    return create_app(make_test_config(
+        tmp_path, STORAGE_TYPE='cloud', S3_ENDPOINT='http://127.0.0.1:9',
+        S3_ACCESS_KEY='ak', S3_SECRET_KEY='sk', S3_BUCKET='bucket',
+        S3_DOMAIN='https://cdn.example.com',
+    ))
+
+
+def test_s3_client_reused_within_process(tmp_path):
+    application = _cloud_app(tmp_path)
+    utils.reset_s3_client()
+    with application.app_context():
+        first = utils.get_s3_client()
+        second = utils.get_s3_client()
+        assert first is second
+        assert first.meta.config.max_pool_connections == application.config['S3_MAX_POOL_CONNECTIONS']
+
+        stats = utils.get_s3_client_stats()
+        assert stats['active'] is True
+        assert stats['reused'] >= 1
+    utils.reset_s3_client()
+
+
+def test_s3_client_rebuilt_after_fork(tmp_path, monkeypatch):
+    application = _cloud_app(tmp_path)
+    utils.reset_s3_client()
+    with application.app_context():
+        parent_client = utils.get_s3_client()
+        # 模拟 gunicorn fork 出的子进程：pid 变化后必须重建，不得复用父进程连接池
+        monkeypatch.setattr(os, 'getpid', lambda: -1)
+        child_client = utils.get_s3_client()
+        assert child_client is not parent_client
+        assert utils.get_s3_client_stats()['pid'] == -1
+    utils.reset_s3_client()
+
+
+def test_s3_client_rebuilt_when_config_changes(tmp_path):
+    application = _cloud_app(tmp_path)
+    utils.reset_s3_client()
+    with application.app_context():
+        old = utils.get_s3_client()
+        application.config['S3_ENDPOINT'] = 'http://127.0.0.1:10'
+        assert utils.get_s3_client() is not old
+    utils.reset_s3_client()
+
+
+def test_delete_image_enqueues_files_and_drain_removes_them(app, client, png_file):
+    from extensions import db
+    from models import Image, PendingDeletion
+    from services.deletion_service import DeletionService
+    from services.image_service import ImageService
+
+    stream, name = png_file()
+    client.post('/upload', data={'title': 't', 'prompt': 'p', 'image': (stream, name)},
+                content_type='multipart/form-data')
+    with app.app_context():
+        img = Image.query.first()
+        paths = [img.file_path, img.thumbnail_path]
+        # 测试中 UPLOAD_FOLDER 为绝对路径，web 路径即文件系统路径
+        abs_paths = list(paths)
+        assert all(os.path.exists(p) for p in abs_paths)
+
+        assert ImageService.delete_image(img.id)
+        # 请求内只登记，不同步删除
+        assert PendingDeletion.query.count() == 2
+        assert all(os.path.exists(p) for p in abs_paths)
+
+        assert DeletionService.drain_all() == 2
+        assert PendingDeletion.query.count() == 0
+        assert not any(os.path.exists(p) for p in abs_paths)
+        db.session.remove()
+
+
+def test_cloud_drain_batches_delete_objects_and_retries(tmp_path):
+    from botocore.stub import Stubber
+    from extensions import db
+    from models import PendingDeletion
+    from services.deletion_service import DeletionService
+
+    application = _cloud_app(tmp_path)
+    utils.reset_s3_client()
+    with application.app_context():
+        db.create_all()
+        # 云端缩略图 = 原图 + 处理后缀，两条记录对应同一个 Key，应去重
+        DeletionService.enqueue([
+            'https://cdn.example.com/a.jpg',
+            'https://cdn.example.com/a.jpg?imageView2/1/w/400',
+            'https://cdn.example.com/b.mp4',
+        ])
+        db.session.commit()
+
+        s3 = utils.get_s3_client()
+        with Stubber(s3) as stub:
+            stub.add_response(
+                'delete_objects',
+                {'Errors': [{'Key': 'b.mp4', 'Code': 'InternalError', 'Message': 'boom'}]},
+                {'Bucket': 'bucket', 'Delete': {'Objects': [{'Key': 'a.jpg'}, {'Key': 'b.mp4'}], 'Quiet': True}},
+            )
+            assert DeletionService.drain() == 3
+            stub.assert_no_pending_responses()
+
+        remaining = PendingDeletion.query.all()
+        assert [r.path for r in remaining] == ['https://cdn.example.com/b.mp4']
+        assert remaining[0].attempts == 1
+        assert remaining[0].last_error == 'boom'
+        # 退避期内不会被再次处理
+        assert DeletionService.drain() == 0
+    utils.reset_s3_client()
+
+
+def test_storage_gc_reports_then_deletes_orphans(app, client, png_file):
+    from extensions import db
+    from models import Image, ReferenceImage
+
+    stream, name = png_file()
+    client.post('/upload', data={'title': 't', 'prompt': 'p', 'image': (stream, name)},
+                content_type='multipart/form-data')
+    upload_dir = app.config['UPLOAD_FOLDER']
+    orphan = os.path.join(upload_dir, 'deadbeef.jpg')
+    with open(orphan, 'wb') as f:
+        f.write(b'x' * 10)
+    with app.app_context():
+        img = Image.query.first()
+        db.session.add(ReferenceImage(image_id=img.id, file_path=f"{upload_dir}/missing.jpg"))
+        db.session.commit()
+        kept = [img.file_path, img.thumbnail_path]
+
+    runner = app.test_cli_runner()
+    dry = runner.invoke(args=['storage-gc', '--min-age', '0'])
+    assert 'deadbeef.jpg' in dry.output
+    assert 'missing.jpg' in dry.output
+    assert os.path.exists(orphan)
+
+    result = runner.invoke(args=['storage-gc', '--delete', '--prune-dangling', '--min-age', '0', '--rate', '0'])
+    assert result.exit_code == 0, result.output
+    assert not os.path.exists(orphan)
+    assert all(os.path.exists(p) for p in kept)
+    with app.app_context():
+        assert ReferenceImage.query.count() == 0
+
+
+def test_new_uploads_use_sharded_layout(app, client, png_file):
+    from models import Image
+
+    stream, name = png_file()
+    client.post('/upload', data={'title': 't', 'prompt': 'p', 'image': (stream, name)},
+                content_type='multipart/form-data')
+    with app.app_context():
+        img = Image.query.first()
+        stem = os.path.basename(img.file_path)
+        upload_dir = app.config['UPLOAD_FOLDER']
+        assert img.file_path == f"{upload_dir}/{stem[:2]}/{stem[2:4]}/{stem}"
+        # 缩略图与原图落在同一分片目录
+        assert os.path.dirname(img.thumbnail_path) == os.path.dirname(img.file_path)
+        assert os.path.exists(img.file_path)
+
+
+def test_shard_uploads_migrates_flat_files(app):
+    from extensions import db
+    from models import Image, ReferenceImage
+
+    upload_dir = app.config['UPLOAD_FOLDER']
+    names = ['0123abcd.gif', 'ffee0011_thumb.jpg', 'ffee0011.png', 'legacy-ref.png']
+    for n in names:
+        with open(os.path.join(upload_dir, n), 'wb') as f:
+            f.write(b'x')
+    with app.app_context():
+        gif = Image(title='g', file_path=f"{upload_dir}/0123abcd.gif", thumbnail_path=f"{upload_dir}/0123abcd.gif",
+                    status='approved')
+        png = Image(title='p', file_path=f"{upload_dir}/ffee0011.png",
+                    thumbnail_path=f"{upload_dir}/ffee0011_thumb.jpg", status='approved')
+        db.session.add_all([gif, png])
+        db.session.flush()
+        db.session.add(ReferenceImage(image_id=png.id, file_path=f"{upload_dir}/legacy-ref.png"))
+        db.session.commit()
+
+    runner = app.test_cli_runner()
+    for _ in range(2):  # 重复执行应幂等
+        result = runner.invoke(args=['shard-uploads', '--batch-size', '1'])
+        assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        gif = Image.query.filter_by(title='g').first()
+        png = Image.query.filter_by(title='p').first()
+        assert gif.file_path == gif.thumbnail_path == f"{upload_dir}/01/23/0123abcd.gif"
+        assert png.file_path == f"{upload_dir}/ff/ee/ffee0011.png"
+        assert png.thumbnail_path == f"{upload_dir}/ff/ee/ffee0011_thumb.jpg"
+        ref_path = ReferenceImage.query.first().file_path
+        assert ref_path.count('/') == png.file_path.count('/')
+        for path in (gif.file_path, png.file_path, png.thumbnail_path, ref_path):
+            assert os.path.exists(path)
+    assert not any(os.path.exists(os.path.join(upload_dir, n)) for n in names)
@@ -81,3 +81,28 @@ def test_oversize_image_rejected(tmp_path, png_file):
     resp = c.post('/upload', data={'title': 't', 'prompt': 'p', 'image': (stream, name)},
                   content_type='multipart/form-data')
     assert resp.status_code == 400
+
+
+def test_upload_tags_resolved_in_batch_and_race_safe(app, client, png_file):
+    from extensions import db
+    from models import Tag
+    from services.tag_service import TagService
+
+    assert _upload(client, png_file(), tags='风景, 日落，风景').status_code == 200
+    with app.app_context():
+        assert sorted(t.name for t in Image.query.first().tags) == ['日落', '风景']
+
+        # 另一进程已抢先插入同名标签：冲突被跳过，解析结果仍指向已存在的行
+        db.session.add(Tag(name='并发'))
+        db.session.commit()
+        TagService._create(['并发', '新建'])
+        db.session.commit()
+        assert Tag.query.filter_by(name='并发').count() == 1
+        assert Tag.query.filter_by(name='新建').count() == 1
+
+        # 标签改名后按新名称解析，旧名称重新创建
+        first = TagService.resolve(['日落'])[0]
+        first.name = '黄昏'
+        db.session.commit()
+        again = TagService.resolve(['日落'])[0]
+        assert again.id != first.id and again.name == '日落'
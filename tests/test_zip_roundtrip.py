@@ -68,3 +68,51 @@ def test_import_infers_media_type_when_missing(app):
         img = Image.query.filter_by(title='旧视频').first()
         assert img is not None
         assert img.media_type == 'video'
+
+
+def test_export_includes_sharded_files_and_reimports(app, auth_client, png_file):
+    """分片目录下的文件应能导出，并在导入后重新落到分片目录。"""
+    stream, name = png_file()
+    auth_client.post('/upload', data={'title': '分片', 'prompt': 'p', 'image': (stream, name)},
+                     content_type='multipart/form-data')
+    resp = auth_client.post('/admin/export-zip')
+    assert resp.status_code == 200
+
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        data = json.loads(zf.read('data.json'))
+        item = data['images'][0]
+        assert item['zip_image_path'] in zf.namelist()
+        assert item['zip_thumb_path'] in zf.namelist()
+
+    with app.app_context():
+        from extensions import db
+        Image.query.delete()
+        db.session.commit()
+
+        zip_path = os.path.join(app.instance_path, 'export.zip')
+        os.makedirs(app.instance_path, exist_ok=True)
+        with open(zip_path, 'wb') as f:
+            f.write(resp.data)
+
+        from services.data_service import DataService
+        list(DataService.import_zip_stream(zip_path))
+
+        img = Image.query.filter_by(title='分片').first()
+        stem = os.path.basename(img.file_path)
+        assert img.file_path.endswith(f"/{stem[:2]}/{stem[2:4]}/{stem}")
+        assert os.path.exists(img.file_path)
+
+
+def test_export_query_budget_is_constant(app, auth_client, max_queries):
+    from extensions import db
+    from models import ReferenceImage, Tag
+
+    with app.app_context():
+        tag = Tag(name='t')
+        for i in range(10):
+            db.session.add(Image(title=f'e{i}', file_path=f'/x/e{i}.png', status='approved', tags=[tag],
+                                 refs=[ReferenceImage(file_path=f'/x/r{i}.png', position=0)]))
+        db.session.commit()
+
+    with max_queries(4):
+        assert auth_client.post('/admin/export-zip').status_code == 200
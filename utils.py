@@ -1,14 +1,11 @@
 import os
+import re
 import uuid
-import urllib.request
-from PIL import Image as PilImage
+import hashlib
+import threading
 from flask import current_app
 
-try:
-    import boto3
-    from botocore.exceptions import ClientError
-except ImportError:
-    boto3 = None
+from services.metrics_service import MetricsService
 
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
 VIDEO_EXTENSIONS = {'.mp4', '.webm', '.ogg', '.mov', '.m4v'}
@@ -27,6 +24,27 @@ VIDEO_CONTENT_TYPES = {
 THUMB_SIZE = (400, 400)
 
 
+def _pil():
+    """
+    按需加载 Pillow：只有处理图片的请求才付出导入成本 (worker 启动时不加载)。
+    每次调用同步解压炸弹防护的像素上限，配置变化无需重启。
+    """
+    from PIL import Image
+    if current_app:
+        Image.MAX_IMAGE_PIXELS = current_app.config.get('MAX_IMAGE_PIXELS')
+    return Image
+
+
+def _boto():
+    """按需加载 boto3 (仅云存储模式使用)，未安装时返回 (None, None)"""
+    try:
+        import boto3
+        from botocore.config import Config as BotoConfig
+    except ImportError:
+        return None, None
+    return boto3, BotoConfig
+
+
 def _resolve_upload_dir(upload_folder):
     """将配置的 upload_folder 解析为绝对目录并确保存在。"""
     if not os.path.isabs(upload_folder):
@@ -42,6 +60,36 @@ def _web_path(upload_folder, filename):
     return f"/{upload_folder}/{filename}".replace('//', '/')
 
 
+_HEX_PREFIX = re.compile(r'^[0-9a-f]+$')
+
+
+def shard_relpath(filename, levels=None):
+    """
+    计算文件在上传目录中的分片相对路径，如 'abcdef....jpg' -> 'ab/cd/abcdef....jpg'。
+
+    uuid 文件名直接取前缀分片 (缩略图 '<uuid>_thumb.jpg' 与原图落在同一目录)；
+    其他文件名按其 md5 分片。levels 为 0 时保持平铺。
+    """
+    if levels is None:
+        levels = current_app.config.get('UPLOAD_SHARD_LEVELS', 2)
+    if levels <= 0:
+        return filename
+    stem = os.path.splitext(filename)[0].lower()
+    prefix = stem[:levels * 2]
+    if len(prefix) < levels * 2 or not _HEX_PREFIX.match(prefix):
+        prefix = hashlib.md5(filename.encode('utf-8')).hexdigest()
+    parts = [prefix[i * 2:i * 2 + 2] for i in range(levels)]
+    return '/'.join(parts + [filename])
+
+
+def _prepare_local_target(full_upload_dir, filename):
+    """返回 (分片相对路径, 绝对路径)，并确保分片目录存在。"""
+    rel = shard_relpath(filename)
+    abspath = os.path.join(full_upload_dir, *rel.split('/'))
+    os.makedirs(os.path.dirname(abspath), exist_ok=True)
+    return rel, abspath
+
+
 def _save_thumbnail_from_pil(img, thumb_abspath):
     """从已打开的 PIL Image 生成并保存 400x400 缩略图 (JPEG)。"""
     thumb = img.copy()
@@ -88,21 +136,118 @@ def get_config_value(key, default):
     return current_app.config.get(key, default)
 
 
+# 进程级 S3 客户端缓存：boto3 客户端线程安全且自带连接池，复用可避免每次上传/删除
+# 都重新构建客户端、重新握手 TLS。fork 后子进程必须重建 (连接池 socket 不可跨进程共享)。
+_s3_lock = threading.Lock()
+_s3_state = {'client': None, 'pid': None, 'signature': None}
+_s3_stats = {'created': 0, 'reused': 0, 'in_flight': 0, 'peak_in_flight': 0, 'requests': 0, 'errors': 0}
+
+
+def _s3_client_signature(config):
+    """影响客户端构建的配置项，任一变化都需要重建客户端。"""
+    return (
+        config.get('S3_ENDPOINT'),
+        config.get('S3_ACCESS_KEY'),
+        config.get('S3_SECRET_KEY'),
+        config.get('S3_MAX_POOL_CONNECTIONS', 20),
+        config.get('S3_MAX_ATTEMPTS', 3),
+        config.get('S3_CONNECT_TIMEOUT', 5),
+        config.get('S3_READ_TIMEOUT', 60),
+    )
+
+
+def _on_s3_before_send(**kwargs):
+    with _s3_lock:
+        _s3_stats['requests'] += 1
+        _s3_stats['in_flight'] += 1
+        _s3_stats['peak_in_flight'] = max(_s3_stats['peak_in_flight'], _s3_stats['in_flight'])
+
+
+def _on_s3_response_received(exception=None, response_dict=None, **kwargs):
+    with _s3_lock:
+        _s3_stats['in_flight'] = max(0, _s3_stats['in_flight'] - 1)
+        status = (response_dict or {}).get('status_code') or 0
+        if exception is not None or status >= 400:
+            _s3_stats['errors'] += 1
+
+
+def _build_s3_client(config):
+    boto3, BotoConfig = _boto()
+    client = boto3.client(
+        's3',
+        endpoint_url=config.get('S3_ENDPOINT'),
+        aws_access_key_id=config.get('S3_ACCESS_KEY'),
+        aws_secret_access_key=config.get('S3_SECRET_KEY'),
+        config=BotoConfig(
+            max_pool_connections=config.get('S3_MAX_POOL_CONNECTIONS', 20),
+            connect_timeout=config.get('S3_CONNECT_TIMEOUT', 5),
+            read_timeout=config.get('S3_READ_TIMEOUT', 60),
+            retries={'max_attempts': config.get('S3_MAX_ATTEMPTS', 3), 'mode': 'standard'},
+        ),
+    )
+    # 统计连接池占用：每次真实 HTTP 发送前 +1，收到响应 (或异常) 后 -1
+    client.meta.events.register('before-send.s3', _on_s3_before_send)
+    client.meta.events.register('response-received.s3', _on_s3_response_received)
+    MetricsService.instrument_s3_client(client)
+    return client
+
+
 def get_s3_client():
     """
     获取配置好的 S3 客户端。
+
+    每个进程只构建一次并复用其连接池；检测到 fork (pid 变化) 或 S3 配置变化时重建。
     """
-    if not boto3:
+    if _boto()[0] is None:
         raise ImportError("使用云存储功能需要安装 boto3 库: pip install boto3")
 
-    return boto3.client(
-        's3',
-        endpoint_url=current_app.config.get('S3_ENDPOINT'),
-        aws_access_key_id=current_app.config.get('S3_ACCESS_KEY'),
-        aws_secret_access_key=current_app.config.get('S3_SECRET_KEY')
-    )
+    signature = _s3_client_signature(current_app.config)
+    pid = os.getpid()
+
+    client = _s3_state['client']
+    if client is not None and _s3_state['pid'] == pid and _s3_state['signature'] == signature:
+        _s3_stats['reused'] += 1
+        return client
+
+    with _s3_lock:
+        if _s3_state['client'] is None or _s3_state['pid'] != pid or _s3_state['signature'] != signature:
+            _s3_state['client'] = _build_s3_client(current_app.config)
+            _s3_state['pid'] = pid
+            _s3_state['signature'] = signature
+            _s3_stats['created'] += 1
+            _s3_stats['in_flight'] = 0
+        else:
+            _s3_stats['reused'] += 1
+        return _s3_state['client']
+
+
+def reset_s3_client():
+    """丢弃当前进程缓存的 S3 客户端 (fork 后子进程调用，或测试中重置)。"""
+    _s3_state.update(client=None, pid=None, signature=None)
+    _s3_stats['in_flight'] = 0
+
+
+def get_s3_client_stats():
+    """返回 S3 客户端复用与连接池占用统计。"""
+    stats = dict(_s3_stats)
+    stats['pid'] = _s3_state['pid']
+    stats['active'] = _s3_state['client'] is not None
+    signature = _s3_state['signature']
+    stats['max_pool_connections'] = signature[3] if signature else None
+    return stats
 
 
+if hasattr(os, 'register_at_fork'):
+    # 子进程中的锁可能处于父进程持有状态，需一并重建
+    def _after_fork_in_child():
+        global _s3_lock
+        _s3_lock = threading.Lock()
+        reset_s3_client()
+
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+@MetricsService.timed('media_processing_seconds', media_type='image')
 def process_image(file_storage, upload_folder, ext=None):
     """
     处理上传图片：保存原图并生成缩略图，支持自动压缩和 GIF 处理。
@@ -144,13 +289,14 @@ def process_image(file_storage, upload_folder, ext=None):
 
     # === 分支 B：本地文件存储模式 ===
     full_upload_dir = _resolve_upload_dir(upload_folder)
-    file_abspath = os.path.join(full_upload_dir, filename)
+    filename, file_abspath = _prepare_local_target(full_upload_dir, filename)
 
     max_dim = get_config_value('IMG_MAX_DIMENSION', 1600)
     save_quality = get_config_value('IMG_QUALITY', 85)
     enable_compress = get_config_value('ENABLE_IMG_COMPRESS', True)
 
     try:
+        PilImage = _pil()
         img = PilImage.open(file_storage)
 
         # GIF 特殊处理：保留帧，原图即缩略图
@@ -159,8 +305,7 @@ def process_image(file_storage, upload_folder, ext=None):
             web_path = _web_path(upload_folder, filename)
             return web_path, web_path
 
-        thumb_filename = f"{unique_name}_thumb.jpg"
-        thumb_abspath = os.path.join(full_upload_dir, thumb_filename)
+        thumb_filename, thumb_abspath = _prepare_local_target(full_upload_dir, f"{unique_name}_thumb.jpg")
         _save_thumbnail_from_pil(img, thumb_abspath)
 
         if img.mode in ('RGBA', 'P'):
@@ -180,6 +325,7 @@ def process_image(file_storage, upload_folder, ext=None):
         raise e
 
 
+@MetricsService.timed('media_processing_seconds', media_type='video')
 def save_video(file_storage, upload_folder, ext, poster_file=None):
     """
     保存上传的视频：不经过 PIL，原样落地；可选地从 poster_file 生成封面缩略图。
@@ -201,7 +347,7 @@ def save_video(file_storage, upload_folder, ext, poster_file=None):
         if poster_file and getattr(poster_file, 'filename', ''):
             try:
                 thumb_name = f"{unique_name}_thumb.jpg"
-                poster_img = PilImage.open(poster_file)
+                poster_img = _pil().open(poster_file)
                 if poster_img.mode in ('RGBA', 'P'):
                     poster_img = poster_img.convert('RGB')
                 poster_img.thumbnail(THUMB_SIZE)
@@ -218,15 +364,15 @@ def save_video(file_storage, upload_folder, ext, poster_file=None):
 
     # === 分支 B：本地存储 ===
     full_upload_dir = _resolve_upload_dir(upload_folder)
-    file_storage.save(os.path.join(full_upload_dir, filename))
+    filename, file_abspath = _prepare_local_target(full_upload_dir, filename)
+    file_storage.save(file_abspath)
     web_original = _web_path(upload_folder, filename)
 
     web_thumb = None
     if poster_file and getattr(poster_file, 'filename', ''):
         try:
-            thumb_filename = f"{unique_name}_thumb.jpg"
-            thumb_abspath = os.path.join(full_upload_dir, thumb_filename)
-            poster_img = PilImage.open(poster_file)
+            thumb_filename, thumb_abspath = _prepare_local_target(full_upload_dir, f"{unique_name}_thumb.jpg")
+            poster_img = _pil().open(poster_file)
             _save_thumbnail_from_pil(poster_img, thumb_abspath)
             web_thumb = _web_path(upload_folder, thumb_filename)
         except Exception as e:
@@ -236,6 +382,42 @@ def save_video(file_storage, upload_folder, ext, poster_file=None):
     return web_original, web_thumb
 
 
+S3_DELETE_BATCH_SIZE = 1000  # delete_objects 单次请求的 Key 上限
+
+
+def _is_remote_path(web_path):
+    return web_path.startswith(('http://', 'https://'))
+
+
+def _s3_key_from_url(web_path):
+    """从云端 URL 中提取对象 Key，需去除可能存在的 URL 参数 (如缩略图后缀)。"""
+    return web_path.split('?')[0].split('/')[-1]
+
+
+def _is_within(path, root):
+    return path == root or path.startswith(root + os.sep)
+
+
+def _local_abspath(web_path):
+    """
+    将本地 web 路径解析为绝对路径；越出项目根目录 (路径穿越) 时返回 None。
+    UPLOAD_FOLDER 配置为绝对路径时，其 web 路径即文件系统路径，同样允许。
+    """
+    root = os.path.realpath(current_app.root_path)
+    upload_folder = current_app.config.get('UPLOAD_FOLDER') or ''
+    if os.path.isabs(upload_folder):
+        upload_root = os.path.realpath(upload_folder)
+        candidate = os.path.realpath(web_path)
+        if _is_within(candidate, upload_root):
+            return candidate
+
+    full_path = os.path.realpath(os.path.join(root, web_path.lstrip('/')))
+    if not _is_within(full_path, root):
+        current_app.logger.warning(f"Refused to delete out-of-root path: {web_path}")
+        return None
+    return full_path
+
+
 def remove_physical_file(web_path):
     """
     安全删除物理文件或云端对象。
@@ -245,15 +427,13 @@ def remove_physical_file(web_path):
 
     # === 分支 A：删除云端对象 ===
     # 判断依据：URL 以 http 开头 且 当前模式为 cloud
-    if current_app.config.get('STORAGE_TYPE') == 'cloud' and web_path.startswith(('http://', 'https://')):
+    if current_app.config.get('STORAGE_TYPE') == 'cloud' and _is_remote_path(web_path):
         try:
-            # 从 URL 中提取文件名 (Key)
-            # 需要去除可能存在的 URL 参数 (如缩略图后缀)
-            filename = web_path.split('?')[0].split('/')[-1]
-            
+            filename = _s3_key_from_url(web_path)
+
             s3 = get_s3_client()
             bucket_name = current_app.config.get('S3_BUCKET')
-            
+
             s3.delete_object(Bucket=bucket_name, Key=filename)
             current_app.logger.info(f"Deleted S3 object: {filename}")
             return
@@ -264,57 +444,63 @@ def remove_physical_file(web_path):
     # === 分支 B：删除本地文件 ===
     try:
         # 防御性编程：如果是云端 URL，不进行本地删除尝试
-        if web_path.startswith(('http://', 'https://')):
+        if _is_remote_path(web_path):
             return
 
-        clean_path = web_path.lstrip('/')
-        root = os.path.realpath(current_app.root_path)
-        full_path = os.path.realpath(os.path.join(root, clean_path))
-
-        # 路径穿越防护：解析后的绝对路径必须仍在项目根目录内
-        if not (full_path == root or full_path.startswith(root + os.sep)):
-            current_app.logger.warning(f"Refused to delete out-of-root path: {web_path}")
-            return
-
-        if os.path.exists(full_path):
+        full_path = _local_abspath(web_path)
+        if full_path and os.path.exists(full_path):
             os.remove(full_path)
     except Exception as e:
         current_app.logger.error(f"File deletion error: {e}")
 
 
-def ensure_local_resources(app):
+def remove_physical_files(web_paths):
     """
-    检查并下载必要的静态资源 (Bootstrap, Icons 等)，
-    实现内网或离线环境部署。
+    批量删除物理文件或云端对象。
+
+    云端对象按 Key 去重后以 delete_objects 分批删除 (每批最多 1000 个)，
+    本地文件逐个删除。不存在的文件视为删除成功。
+    返回 {web_path: 错误信息}，仅包含删除失败、需要重试的路径。
     """
-    if not app.config.get('USE_LOCAL_RESOURCES'):
-        return
+    failed = {}
+    keys = {}
+    for web_path in dict.fromkeys(p for p in web_paths if p):
+        if _is_remote_path(web_path):
+            # 非云存储模式下的远程 URL 不归本站管理，直接视为完成
+            if current_app.config.get('STORAGE_TYPE') == 'cloud':
+                keys.setdefault(_s3_key_from_url(web_path), []).append(web_path)
+            continue
+        try:
+            full_path = _local_abspath(web_path)
+            if full_path and os.path.exists(full_path):
+                os.remove(full_path)
+        except OSError as e:
+            failed[web_path] = str(e)
 
-    static_root = app.static_folder
-
-    # 资源映射表
-    resources = {
-        'css/bootstrap.min.css': 'https://cdn.bootcdn.net/ajax/libs/twitter-bootstrap/5.3.0/css/bootstrap.min.css',
-        'css/nprogress.min.css': 'https://cdn.bootcdn.net/ajax/libs/nprogress/0.2.0/nprogress.min.css',
-        'css/bootstrap-icons.min.css': 'https://cdn.bootcdn.net/ajax/libs/bootstrap-icons/1.10.5/font/bootstrap-icons.min.css',
-        'js/bootstrap.bundle.min.js': 'https://cdn.bootcdn.net/ajax/libs/twitter-bootstrap/5.3.0/js/bootstrap.bundle.min.js',
-        'js/nprogress.min.js': 'https://cdn.bootcdn.net/ajax/libs/nprogress/0.2.0/nprogress.min.js',
-        'js/Sortable.min.js': 'https://cdn.bootcdn.net/ajax/libs/Sortable/1.15.0/Sortable.min.js',
-        'css/fonts/bootstrap-icons.woff2': 'https://cdn.bootcdn.net/ajax/libs/bootstrap-icons/1.10.5/font/fonts/bootstrap-icons.woff2',
-        'css/fonts/bootstrap-icons.woff': 'https://cdn.bootcdn.net/ajax/libs/bootstrap-icons/1.10.5/font/fonts/bootstrap-icons.woff',
-    }
-
-    opener = urllib.request.build_opener()
-    opener.addheaders = [('User-Agent', 'Mozilla/5.0')]
-    urllib.request.install_opener(opener)
-
-    for relative_path, url in resources.items():
-        local_path = os.path.join(static_root, relative_path)
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-
-        if not os.path.exists(local_path):
-            try:
-                print(f"Downloading resource: {relative_path}")
-                urllib.request.urlretrieve(url, local_path)
-            except Exception as e:
-                print(f"Failed to download {relative_path}: {e}")
\ No newline at end of file
+    if not keys:
+        return failed
+
+    try:
+        s3 = get_s3_client()
+    except Exception as e:
+        for paths in keys.values():
+            failed.update({p: str(e) for p in paths})
+        return failed
+
+    bucket_name = current_app.config.get('S3_BUCKET')
+    key_list = list(keys)
+    for i in range(0, len(key_list), S3_DELETE_BATCH_SIZE):
+        chunk = key_list[i:i + S3_DELETE_BATCH_SIZE]
+        try:
+            resp = s3.delete_objects(
+                Bucket=bucket_name,
+                Delete={'Objects': [{'Key': k} for k in chunk], 'Quiet': True},
+            )
+            errors = {err.get('Key'): err.get('Message') or err.get('Code') for err in resp.get('Errors', [])}
+        except Exception as e:
+            errors = {k: str(e) for k in chunk}
+        for key, message in errors.items():
+            failed.update({p: message for p in keys.get(key, [])})
+        current_app.logger.info(f"Deleted {len(chunk) - len(errors)} S3 objects ({len(errors)} failed)")
+
+    return failed